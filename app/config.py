@@ -1,10 +1,13 @@
-from dotenv import load_dotenv
-load_dotenv()
-
 import os
 import tempfile
 import logging
 
+# Modal containers get their configuration from secrets in the environment, so the .env
+# lookup (which walks up the directory tree) is only done when running elsewhere
+if os.getenv("MODAL_IS_REMOTE") != "1":
+    from dotenv import load_dotenv
+    load_dotenv()
+
 logger = logging.getLogger(__name__)
 
 class Settings:
@@ -16,12 +19,138 @@ class Settings:
     AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET_NAME", "your-s3-bucket")
     TMP_DIR = tempfile.gettempdir()  # Use system temp directory
 
+    # Provider endpoints (overridable to point at local fakes, e.g. for benchmarks)
+    ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
+    HEYGEN_BASE_URL = os.getenv("HEYGEN_BASE_URL", "https://api.heygen.com").rstrip("/")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # None uses the OpenAI default
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # None uses AWS S3
+    HEYGEN_POLL_INTERVAL = float(os.getenv("HEYGEN_POLL_INTERVAL", "5"))
+    HEYGEN_MAX_WAIT_SECONDS = float(os.getenv("HEYGEN_MAX_WAIT_SECONDS", "300"))
+    # Expected Heygen render seconds per second of audio, and the longest poll interval it may lead to
+    HEYGEN_RENDER_FACTOR = float(os.getenv("HEYGEN_RENDER_FACTOR", "3"))
+    HEYGEN_MAX_POLL_INTERVAL = float(os.getenv("HEYGEN_MAX_POLL_INTERVAL", "30"))
+    # Silence between lines in per-speaker renders, so cuts never catch the next line's lip movement
+    HEYGEN_TRACK_GAP_SECONDS = float(os.getenv("HEYGEN_TRACK_GAP_SECONDS", "0.5"))
+    JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(TMP_DIR, "lisa_jobs"))  # Per-job workspaces and manifests
+    # How often a running job refreshes its heartbeat; a job silent for three intervals is taken
+    # to be orphaned (e.g. by a restart of the worker running it)
+    JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+
+    # Time budget of a job when the request sets none (0: no deadline), e.g. the platform's request
+    # timeout; and the part of it kept for the local fallbacks, merge and upload at the end
+    JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "0"))
+    DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "60"))
+    # Below this much time left before the reserve, portrait crops use a fast x264 preset
+    DEADLINE_FAST_CROP_SECONDS = float(os.getenv("DEADLINE_FAST_CROP_SECONDS", "120"))
+
+    # Admission control: the most estimated work (seconds of stage time, see app.services.admission)
+    # in flight at once (0: admit everything), the longest expected wait a request is queued for
+    # instead of being rejected with 429, and the dialogue segments assumed per minute of an idea
+    ADMISSION_BUDGET_SECONDS = float(os.getenv("ADMISSION_BUDGET_SECONDS", "0"))
+    ADMISSION_MAX_QUEUE_SECONDS = float(os.getenv("ADMISSION_MAX_QUEUE_SECONDS", "30"))
+    ADMISSION_SEGMENTS_PER_MINUTE = float(os.getenv("ADMISSION_SEGMENTS_PER_MINUTE", "8"))
+
+    # Provider slots shared by all jobs of the process ("elevenlabs=10,heygen=20"; providers not
+    # listed are only limited per job), and the weights of scheduling lanes ("<priority>-<kind>")
+    # and tenants ("tenant=weight"; 1 when not listed) when tasks wait for a slot
+    SCHEDULER_SLOTS = os.getenv("SCHEDULER_SLOTS", "elevenlabs=10")
+    SCHEDULER_LANE_WEIGHTS = os.getenv("SCHEDULER_LANE_WEIGHTS", "interactive-audio=8,interactive-video=4,batch-audio=2,batch-video=1")
+    SCHEDULER_TENANT_WEIGHTS = os.getenv("SCHEDULER_TENANT_WEIGHTS", "")
+
+    # Batches (POST /v1/batch): most items per batch, and jobs of a batch run at once (their
+    # segments then share the provider slots with every other job)
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+    BATCH_MAX_CONCURRENT_JOBS = int(os.getenv("BATCH_MAX_CONCURRENT_JOBS", "8"))
+
+    # Provider call timeouts (seconds) and retry policy
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+    OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))  # Script generation streams nothing until done
+    RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+
+    # How long a result is kept for clients retrying with the same Idempotency-Key
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+
+    # Reuse of published podcasts for identical "script" requests
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    # Local caches of generated segment media (Heygen renders, ElevenLabs audio)
+    CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(TMP_DIR, "lisa_cache"))
+    RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+    TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(1024 ** 3)))
+    RENDER_CACHE_S3 = os.getenv("RENDER_CACHE_S3", "false").lower() == "true"  # Share caches between containers via S3
+
+    # Lifetime and garbage collection of intermediate S3 objects (segment audio for Heygen)
+    INTERMEDIATE_TTL_SECONDS = int(os.getenv("INTERMEDIATE_TTL_SECONDS", str(24 * 3600)))
+    INTERMEDIATE_GC_INTERVAL_SECONDS = int(os.getenv("INTERMEDIATE_GC_INTERVAL_SECONDS", "3600"))
+    # podcasts/temp/ holds per-segment audio uploaded by modal_app.py
+    INTERMEDIATE_GC_PREFIXES = [prefix for prefix in os.getenv(
+        "INTERMEDIATE_GC_PREFIXES", "podcasts/intermediate/,podcasts/temp/").split(",") if prefix]
+
+    # Per-request profiling (?profile=true or X-Profile: true)
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.01"))  # Seconds between stack samples
+    PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))  # Traceback depth per allocation
+    PROFILE_UPLOAD = os.getenv("PROFILE_UPLOAD", "true").lower() == "true"  # Upload profiles to S3 (else keep in the job workspace)
+
+    # Logging: "text" or "json" lines, per-module levels ("app.utils.heygen=WARNING,botocore=ERROR"),
+    # truncation of long arguments and sampling of per-segment INFO/DEBUG records (every Nth segment)
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+    LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+    LOG_SEGMENT_SAMPLE_EVERY = int(os.getenv("LOG_SEGMENT_SAMPLE_EVERY", "1"))
+
+    # Import the OpenAI and S3 clients in the background once the server is up, instead of in the first request
+    WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "true").lower() == "true"
+
+    # Where per-segment CPU work (render download and portrait crop) runs: "threads" (inline),
+    # "processes" (local process pool, SEGMENT_PROCESSES workers, 0 = CPU count) or "modal"
+    # (run_segment_task of the deployed Modal app)
+    SEGMENT_BACKEND = os.getenv("SEGMENT_BACKEND", "threads").lower()
+    SEGMENT_PROCESSES = int(os.getenv("SEGMENT_PROCESSES", "0"))
+    MODAL_APP_NAME = os.getenv("MODAL_APP_NAME", "lisa-podcast-generator")
+    MODAL_SEGMENT_FUNCTION = os.getenv("MODAL_SEGMENT_FUNCTION", "run_segment_task")
+
+    # HLS output (output_format "hls"): fragment length and the playlist's declared maximum
+    HLS_SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+    HLS_TARGET_DURATION = float(os.getenv("HLS_TARGET_DURATION", "10"))
+
+    # Pipe the final merge from ffmpeg straight into a multipart S3 upload instead of writing
+    # final_podcast.* to disk first (video becomes fragmented MP4). Parts of S3_PART_SIZE bytes
+    # (at least 5 MiB) are sent S3_UPLOAD_CONCURRENCY at a time
+    STREAM_FINAL_UPLOAD = os.getenv("STREAM_FINAL_UPLOAD", "false").lower() == "true"
+    S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 ** 2)))
+    S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+
+    # Synthesize each voice's lines in a few large ElevenLabs requests (with timestamps) of up to
+    # TTS_BATCH_MAX_CHARS characters, split back into lines at the character alignment
+    TTS_BATCHING = os.getenv("TTS_BATCHING", "false").lower() == "true"
+    TTS_BATCH_MAX_CHARS = int(os.getenv("TTS_BATCH_MAX_CHARS", "4500"))
+
+    # How audio episodes are merged: "ffmpeg" (concatenate and re-encode) or "pcm" (decode once,
+    # mix in NumPy, encode once). PCM assembly adds AUDIO_GAP_SECONDS of silence between turns,
+    # crossfades joins over AUDIO_CROSSFADE_SECONDS and, with AUDIO_LEVELING, levels every turn
+    # to AUDIO_TARGET_DBFS RMS with at most AUDIO_MAX_GAIN_DB of gain
+    AUDIO_ASSEMBLY = os.getenv("AUDIO_ASSEMBLY", "ffmpeg").lower()
+    AUDIO_GAP_SECONDS = float(os.getenv("AUDIO_GAP_SECONDS", "0"))
+    AUDIO_CROSSFADE_SECONDS = float(os.getenv("AUDIO_CROSSFADE_SECONDS", "0.02"))
+    AUDIO_LEVELING = os.getenv("AUDIO_LEVELING", "true").lower() == "true"
+    AUDIO_TARGET_DBFS = float(os.getenv("AUDIO_TARGET_DBFS", "-20"))
+    AUDIO_MAX_GAIN_DB = float(os.getenv("AUDIO_MAX_GAIN_DB", "12"))
+
 settings = Settings()
 
-# Debug: Log the loaded environment variables (masked for security)
-logger.info("Environment variables loaded:")
-logger.info(f"OPENAI_API_KEY: {settings.OPENAI_API_KEY[:10]}..." if settings.OPENAI_API_KEY != "your-openai-key" else "OPENAI_API_KEY: Not set")
-logger.info(f"ELEVENLABS_API_KEY: {settings.ELEVENLABS_API_KEY[:10]}..." if settings.ELEVENLABS_API_KEY != "your-elevenlabs-key" else "ELEVENLABS_API_KEY: Not set")
-logger.info(f"HEYGEN_API_KEY: {settings.HEYGEN_API_KEY[:10]}..." if settings.HEYGEN_API_KEY != "your-heygen-key" else "HEYGEN_API_KEY: Not set")
-logger.info(f"AWS_ACCESS_KEY_ID: {settings.AWS_ACCESS_KEY_ID[:10]}..." if settings.AWS_ACCESS_KEY_ID != "your-aws-access-key" else "AWS_ACCESS_KEY_ID: Not set")
-logger.info(f"AWS_S3_BUCKET: {settings.AWS_S3_BUCKET}") 
\ No newline at end of file
+def _masked(value, placeholder):
+    return f"{value[:10]}..." if value != placeholder else "Not set"
+
+def log_settings():
+    """Log which credentials were loaded (masked); called once logging is configured"""
+    logger.info("Environment variables loaded:")
+    logger.info("OPENAI_API_KEY: %s", _masked(settings.OPENAI_API_KEY, "your-openai-key"))
+    logger.info("ELEVENLABS_API_KEY: %s", _masked(settings.ELEVENLABS_API_KEY, "your-elevenlabs-key"))
+    logger.info("HEYGEN_API_KEY: %s", _masked(settings.HEYGEN_API_KEY, "your-heygen-key"))
+    logger.info("AWS_ACCESS_KEY_ID: %s", _masked(settings.AWS_ACCESS_KEY_ID, "your-aws-access-key"))
+    logger.info("AWS_S3_BUCKET: %s", settings.AWS_S3_BUCKET)
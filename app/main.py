@@ -1,36 +1,348 @@
+import time
+import hashlib
 import logging
-from fastapi import FastAPI
+import threading
+import contextvars
+from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 from app.models import (
-    AudioPodcastRequest, VideoPodcastRequest
-)
-from app.services.podcast import create_audio_podcast, create_video_podcast
-
-# Configure logging at application level
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Console handler only (Modal compatible)
-    ]
+    AudioPodcastRequest, VideoPodcastRequest, BatchRequest
 )
+from app.services.jobs import JobManifest, JobConflict
+from app.services.podcast import create_audio_podcast, create_video_podcast, resume_podcast, discard_job
+from app.services.singleflight import SingleFlight, IdempotencyConflict, request_fingerprint
+from app.services.result_cache import result_cache, is_cacheable
+from app.utils.metrics import REGISTRY, Callback, observe_wait
+from app.utils.profiling import profile_job
+from app.utils.logging_config import configure_logging
+from app.utils.cancellation import JobCancelled, cancel, is_running
+from app.config import settings, log_settings
+from app.startup import warm_up_in_background
+from app.services.backends import shutdown_segment_backend
+from app.services.hls import stream_url
+from app.services.admission import Overloaded, reserve, admitted, release, withdraw
+from app.services.scheduler import fair_share
+from app.services.batches import BatchManifest, start_batch, resume_batches
+
+# Configure logging at application level (format, levels and sampling come from the LOG_* settings)
+configure_logging()
+log_settings()
 
 # Create logger for this module
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Provider SDKs are imported lazily; load them while waiting for the first request
+    if settings.WARM_UP_CLIENTS:
+        warm_up_in_background()
+    # Batches interrupted by a restart carry on with their unfinished jobs
+    threading.Thread(target=resume_batches, name="resume-batches", daemon=True).start()
+    yield
+    shutdown_segment_backend()
+
+app = FastAPI(lifespan=lifespan)
+
+# Identical requests that arrive while one is already running share its result
+inflight = SingleFlight()
+
+REGISTRY.register(Callback("lisa_inflight_requests", "Podcast requests currently executing", (), lambda: {(): inflight.in_flight()}))
+
+# When the current request arrived, to measure how long it queued for a threadpool worker
+_received_at = contextvars.ContextVar("lisa_received_at", default=None)
+
+@app.middleware("http")
+async def record_arrival(request: Request, call_next):
+    _received_at.set(time.perf_counter())
+    return await call_next(request)
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    """Admission control turned the request away; Retry-After is when it is expected to fit"""
+    return JSONResponse(status_code=429, headers={"Retry-After": str(exc.retry_after)},
+                        content={"detail": {"error": str(exc), "retry_after": exc.retry_after}})
+
+def _record_threadpool_wait():
+    """Sync endpoints run on a bounded threadpool; record how long this request waited for it"""
+    received_at = _received_at.get()
+    if received_at is not None:
+        observe_wait("http_threadpool", time.perf_counter() - received_at)
+
+def _log_request(data):
+    """Summary of a podcast request; the full body (input_text can be a whole script) only at DEBUG"""
+    logger.info("Request: input_type=%s language=%s input_text=%s chars duration=%s min",
+                data.input_type, data.language, len(data.input_text), data.duration_minutes)
+    logger.debug("Request data: %s", data)
+
+def _job_failed(job, exc, profile=None):
+    """Report a failed (or cancelled) job with its ID so the client can resume it"""
+    cancelled = isinstance(exc, JobCancelled)
+    if cancelled:
+        logger.info("Job %s was cancelled", job.job_id)
+    else:
+        logger.error("Job %s failed: %s", job.job_id, exc)
+    detail = {"error": str(exc), "job_id": job.job_id}
+    if profile:
+        detail["profile"] = profile
+    raise HTTPException(status_code=409 if cancelled or isinstance(exc, JobConflict) else 500, detail=detail)
+
+def _tenant(x_tenant_id, x_api_key):
+    """Who a request runs for, for fair sharing: X-Tenant-ID, else a digest of X-API-Key, else "default" """
+    if x_tenant_id and x_tenant_id.strip():
+        return x_tenant_id.strip()
+    if x_api_key:
+        return "key-" + hashlib.sha256(x_api_key.encode("utf-8")).hexdigest()[:12]
+    return "default"
+
+def _profiling_requested(profile, x_profile):
+    """Profiling is opt-in per request with ?profile=true or an X-Profile: true header"""
+    return profile or (x_profile or "").strip().lower() in ("1", "true", "yes")
+
+def _run_job(job, create, data, profiling, tenant):
+    """Run the pipeline for job, profiled if requested, and build the response"""
+    error = None
+    with profile_job(job, profiling) as profile:
+        try:
+            with fair_share(job.job_id, job.kind, data.priority, tenant):
+                s3_url, duration = create(data, job=job)
+        except (Exception, JobCancelled) as exc:
+            error = exc
+    if error is not None:
+        _job_failed(job, error, profile)
+    response = {"status": "success", "s3_url": s3_url, "duration": duration, "job_id": job.job_id}
+    for key in ("stream_url", "segment_durations", "partial", "missing_segments", "degraded_segments"):
+        if job.result and job.result.get(key):
+            response[key] = job.result[key]
+    if profile:
+        response["profile"] = profile
+    return response
+
+def _start_job(kind, create, data, profiling, tenant):
+    """
+    Run the pipeline for a new job on a background thread and answer 202 right away with the job ID
+    (and, for HLS output, the playlist URL, which becomes playable as segments finish).
+    Progress and the result are available from GET /v1/jobs/{job_id}. A job that has to wait for
+    admission is "queued" until it starts.
+    """
+    ticket = reserve(kind, data)
+    try:
+        job = JobManifest.create(kind, data)
+    except Exception:
+        release(ticket)
+        raise
+    if ticket and not ticket.admitted:
+        ticket.job_id = job.job_id
+        job.set_status("queued")
+    
+    def run():
+        with profile_job(job, profiling) as profile:
+            try:
+                with admitted(ticket), fair_share(job.job_id, kind, data.priority, tenant):
+                    create(data, job=job)
+            except JobCancelled:
+                logger.info("Job %s was cancelled", job.job_id)
+            except Exception as exc:
+                logger.error("Job %s failed: %s", job.job_id, exc)
+        if profile:
+            # Nobody is waiting for the response, so the links are kept with the job's result
+            job.result = {**(job.result or {}), "profile": profile}
+            job.save()
+    
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name=f"job-{job.job_id[:8]}", daemon=True)
+    thread.start()
+    response = {"status": "accepted", "job_id": job.job_id}
+    if data.output_format == "hls":
+        response["stream_url"] = stream_url(job.job_id)
+    return JSONResponse(status_code=202, content=response)
+
+def _run_once(kind, data, idempotency_key, run):
+    """
+    Run a podcast request through single-flight coalescing.
+    Requests are keyed by the Idempotency-Key header when present (and its result is kept
+    for IDEMPOTENCY_TTL_SECONDS), otherwise by a fingerprint of the normalized request.
+    Scripted requests whose podcast was already published are answered from the result cache.
+    """
+    fingerprint = request_fingerprint(kind, data)
+    
+    def run_cached():
+        if not is_cacheable(data):
+            return run()
+        cached = result_cache.lookup(fingerprint)
+        if cached:
+            return {"status": "success", "s3_url": cached["s3_url"], "duration": cached["duration"],
+                    "job_id": cached["job_id"], "cached": True}
+        result = run()
+        # Episodes cut short or degraded by a deadline are not what a later request should get
+        if result.get("partial") or result.get("degraded_segments"):
+            return result
+        result_cache.store(fingerprint, result["s3_url"], result["duration"], result["job_id"])
+        return result
+    
+    if idempotency_key:
+        key, retain_seconds = f"idempotency:{kind}:{idempotency_key}", settings.IDEMPOTENCY_TTL_SECONDS
+    else:
+        key, retain_seconds = f"request:{fingerprint}", 0
+    try:
+        result, shared = inflight.do(key, run_cached, fingerprint=fingerprint, retain_seconds=retain_seconds)
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    if shared:
+        logger.info("Duplicate %s request coalesced with job %s", kind, result['job_id'])
+    return result
 
 @app.post("/v1/lisa-audio-podcast")
-def lisa_audio_podcast(data: AudioPodcastRequest):
+def lisa_audio_podcast(data: AudioPodcastRequest, idempotency_key: Optional[str] = Header(default=None),
+                       profile: bool = False, x_profile: Optional[str] = Header(default=None), wait: bool = True,
+                       x_tenant_id: Optional[str] = Header(default=None), x_api_key: Optional[str] = Header(default=None)):
+    _record_threadpool_wait()
     logger.info("=== AUDIO PODCAST REQUEST RECEIVED ===")
-    logger.info(f"Request data: {data}")
-    s3_url, duration = create_audio_podcast(data)
-    logger.info(f"Audio podcast completed. S3 URL: {s3_url}")
-    return {"status": "success", "s3_url": s3_url, "duration": duration}
+    _log_request(data)
+    profiling = _profiling_requested(profile, x_profile)
+    tenant = _tenant(x_tenant_id, x_api_key)
+    
+    if not wait:
+        # Not coalesced: the caller needs this job's ID (and playlist) before it completes
+        return _start_job("audio", create_audio_podcast, data, profiling, tenant)
+    
+    def run():
+        with admitted(reserve("audio", data)):
+            response = _run_job(JobManifest.create("audio", data), create_audio_podcast, data, profiling, tenant)
+        logger.info("Audio podcast completed. S3 URL: %s", response['s3_url'])
+        return response
+    
+    if profiling:
+        # A profile has to come from a real run, not a coalesced or cached result
+        return run()
+    return _run_once("audio", data, idempotency_key, run)
 
 @app.post("/v1/lisa-video-podcast")
-def lisa_video_podcast(data: VideoPodcastRequest):
+def lisa_video_podcast(data: VideoPodcastRequest, idempotency_key: Optional[str] = Header(default=None),
+                       profile: bool = False, x_profile: Optional[str] = Header(default=None), wait: bool = True,
+                       x_tenant_id: Optional[str] = Header(default=None), x_api_key: Optional[str] = Header(default=None)):
+    _record_threadpool_wait()
     logger.info("=== VIDEO PODCAST REQUEST RECEIVED ===")
-    logger.info(f"Request data: {data}")
-    s3_url, duration = create_video_podcast(data)
-    logger.info(f"Video podcast completed. S3 URL: {s3_url}")
-    return {"status": "success", "s3_url": s3_url, "duration": duration} 
\ No newline at end of file
+    _log_request(data)
+    profiling = _profiling_requested(profile, x_profile)
+    tenant = _tenant(x_tenant_id, x_api_key)
+    
+    if not wait:
+        # Not coalesced: the caller needs this job's ID (and playlist) before it completes
+        return _start_job("video", create_video_podcast, data, profiling, tenant)
+    
+    def run():
+        with admitted(reserve("video", data)):
+            response = _run_job(JobManifest.create("video", data), create_video_podcast, data, profiling, tenant)
+        logger.info("Video podcast completed. S3 URL: %s", response['s3_url'])
+        return response
+    
+    if profiling:
+        # A profile has to come from a real run, not a coalesced or cached result
+        return run()
+    return _run_once("video", data, idempotency_key, run)
+
+@app.get("/v1/jobs/{job_id}")
+def get_job(job_id: str, timings: bool = False):
+    """Job status; with ?timings=true, also the per-stage and per-segment timing breakdown"""
+    try:
+        job = JobManifest.load(job_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary(include_timings=timings)
+
+@app.post("/v1/jobs/{job_id}/resume")
+def resume_job(job_id: str, x_tenant_id: Optional[str] = Header(default=None), x_api_key: Optional[str] = Header(default=None)):
+    _record_threadpool_wait()
+    logger.info("=== RESUME REQUEST RECEIVED FOR JOB %s ===", job_id)
+    try:
+        job = JobManifest.load(job_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    def run():
+        # Completed jobs just return their stored result; others are charged for their whole dialogue
+        ticket = None
+        request = (AudioPodcastRequest if job.kind == "audio" else VideoPodcastRequest)(**job.request)
+        if job.status != "completed":
+            ticket = reserve(job.kind, request, segments=len(job.dialogue) if job.dialogue else None)
+        try:
+            with admitted(ticket), fair_share(job.job_id, job.kind, request.priority, _tenant(x_tenant_id, x_api_key)):
+                s3_url, duration = resume_podcast(job.job_id)
+        except (Exception, JobCancelled) as exc:
+            _job_failed(job, exc)
+        logger.info("Resumed job %s completed. S3 URL: %s", job_id, s3_url)
+        return {"status": "success", "s3_url": s3_url, "duration": duration, "job_id": job.job_id}
+    
+    # Concurrent resumes of the same job share one run instead of racing on its workspace
+    result, _ = inflight.do(f"resume:{job.job_id}", run)
+    return result
+
+@app.post("/v1/batch")
+def submit_batch(data: BatchRequest, x_tenant_id: Optional[str] = Header(default=None), x_api_key: Optional[str] = Header(default=None)):
+    """
+    Submit many podcast requests at once. Each item becomes a job (identical items share one),
+    run in the background in the "batch" lane; answers 202 with the batch ID and each item's job ID.
+    Progress and results are available from GET /v1/batch/{batch_id}.
+    """
+    _record_threadpool_wait()
+    logger.info("=== BATCH REQUEST RECEIVED: %s items ===", len(data.items))
+    if len(data.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"A batch can have at most {settings.BATCH_MAX_ITEMS} items")
+    batch = start_batch(data, _tenant(x_tenant_id, x_api_key))
+    items = [{"index": index, "type": item["type"], "job_id": item["job_id"]} for index, item in enumerate(batch.items)]
+    return JSONResponse(status_code=202, content={"status": "accepted", "batch_id": batch.batch_id, "items": items})
+
+@app.get("/v1/batch/{batch_id}")
+def get_batch(batch_id: str):
+    """Batch status with each item's job status, segment progress and result"""
+    try:
+        batch = BatchManifest.load(batch_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.summary()
+
+@app.delete("/v1/tasks/{task_id}")
+def cancel_task(task_id: str):
+    """
+    Cancel a job (task IDs are the job IDs returned by the podcast endpoints).
+    A job running in this process stops at its next cancellation check: queued segment work is
+    dropped, Heygen polling and retry backoff end, and ffmpeg processes are killed. It then
+    removes its workspace and HLS objects and is marked "cancelled"; until then the response is
+    202 "cancelling". A job that is not running anywhere (not started yet, failed, or orphaned
+    by a restart, as its heartbeat shows) is cleaned up and marked cancelled right away; it can
+    no longer start. Completed jobs, and jobs running in another worker, cannot be cancelled here (409).
+    """
+    _record_threadpool_wait()
+    try:
+        job = JobManifest.load(task_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # Under the job's lock, so the job cannot start between the checks and marking it cancelled
+    with job.locked():
+        job = JobManifest.load(task_id)
+        if job.status in ("completed", "cancelled"):
+            raise HTTPException(status_code=409, detail={"error": f"Job is already {job.status}", "job_id": job.job_id})
+        
+        if withdraw(job.job_id):
+            # Still waiting for admission, so nothing has been spent on it yet
+            logger.info("Job %s was queued, marking it cancelled", job.job_id)
+            job.set_status("cancelled", error="Cancelled")
+            return {"status": "cancelled", "job_id": job.job_id}
+        
+        if cancel(job.job_id) or is_running(job.job_id):
+            return JSONResponse(status_code=202, content={"status": "cancelling", "job_id": job.job_id})
+        
+        if job.status == "running" and job.alive():
+            raise HTTPException(status_code=409, detail={"error": "Job is running in another worker", "job_id": job.job_id})
+        
+        logger.info("Job %s is not running anywhere, marking it cancelled", job.job_id)
+        discard_job(job)
+        job.set_status("cancelled", error="Cancelled")
+        return {"status": "cancelled", "job_id": job.job_id}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: stage and job timings, limiter waits, provider retries, cache stats"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal, Dict
+from typing import Optional, Literal, Dict, List, Union
+from typing_extensions import Annotated
 
 class ElevenLabsConfig(BaseModel):
     stability: float = Field(ge=0.0, le=1.0, description="Stability setting (0.0 to 1.0)")
@@ -12,6 +13,9 @@ class HeygenConfig(BaseModel):
     host_avatar_id: str
     guest_avatar_id: str
     background: Optional[str] = Field(default=None, description="Background URL or color (optional)")
+    render_mode: Literal["segment", "speaker", "audiogram"] = Field(default="segment", description="'speaker' renders one Heygen video per speaker and cuts the lines out locally; 'audiogram' renders speaker images, a waveform and captions locally instead of Heygen avatars")
+    host_image_url: Optional[str] = Field(default=None, description="Host image for 'audiogram' videos (optional)")
+    guest_image_url: Optional[str] = Field(default=None, description="Guest image for 'audiogram' videos (optional)")
 
 class AudioPodcastRequest(BaseModel):
     input_type: Literal["idea", "script"]
@@ -23,6 +27,10 @@ class AudioPodcastRequest(BaseModel):
     guest_voice_id: str
     elevenlabs_config: ElevenLabsConfig
     duration_minutes: int = Field(default=5, ge=1, le=60, description="Desired podcast duration in minutes (1-60)")
+    output_format: Literal["file", "hls"] = Field(default="file", description="'hls' also publishes finished segments as an HLS playlist while the podcast is generated")
+    hls_final_file: bool = Field(default=True, description="With HLS output, also merge and upload the complete file")
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, description="Time budget of the job; near it, late segments fall back to cheaper rendering or are left out of a partial result (optional)")
+    priority: Literal["interactive", "batch"] = Field(default="interactive", description="Scheduling lane: 'batch' jobs get a smaller share of provider capacity when it is short")
 
 class VideoPodcastRequest(BaseModel):
     input_type: Literal["idea", "script"]
@@ -36,6 +44,20 @@ class VideoPodcastRequest(BaseModel):
     elevenlabs_config: ElevenLabsConfig
     heygen_config: HeygenConfig
     duration_minutes: int = Field(default=5, ge=1, le=60, description="Desired podcast duration in minutes (1-60)")
+    output_format: Literal["file", "hls"] = Field(default="file", description="'hls' also publishes finished segments as an HLS playlist while the podcast is generated")
+    hls_final_file: bool = Field(default=True, description="With HLS output, also merge and upload the complete file")
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, description="Time budget of the job; near it, late segments fall back to cheaper rendering or are left out of a partial result (optional)")
+    priority: Literal["interactive", "batch"] = Field(default="interactive", description="Scheduling lane: 'batch' jobs get a smaller share of provider capacity when it is short")
+
+class AudioBatchItem(AudioPodcastRequest):
+    type: Literal["audio"]
+
+class VideoBatchItem(VideoPodcastRequest):
+    type: Literal["video"]
+
+class BatchRequest(BaseModel):
+    items: List[Annotated[Union[AudioBatchItem, VideoBatchItem], Field(discriminator="type")]] = Field(
+        min_length=1, description="Podcast requests, each with a 'type' of 'audio' or 'video'; priority defaults to 'batch'")
 
 class PodcastResponse(BaseModel):
     status: str
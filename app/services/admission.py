@@ -0,0 +1,245 @@
+"""
+Admission control in front of the podcast endpoints. Every request is costed before any money
+is spent on it: the segments it will have times the recent latency of each stage a segment goes
+through (from the spans the pipeline records), plus the per-job stages. Admitted jobs hold
+their cost until they finish. While the cost in flight would exceed ADMISSION_BUDGET_SECONDS,
+a request waits in a FIFO queue if it is expected to get in within ADMISSION_MAX_QUEUE_SECONDS,
+and is turned away (429) with that expectation as its Retry-After otherwise.
+"""
+import math
+import time
+import heapq
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from app.config import settings
+from app.services.podcast import process_dialogue
+from app.utils.cancellation import JobCancelled
+from app.utils.metrics import REGISTRY, Callback, Counter, RECENT_WEIGHT, recent_seconds, observe_wait
+
+logger = logging.getLogger(__name__)
+
+# Stage latencies (seconds) assumed until a stage has been observed in this process
+DEFAULT_STAGE_SECONDS = {
+    "script": 30, "tts": 2, "audio_upload": 0.5, "heygen_submit": 1, "heygen_queue": 15, "heygen_render": 60,
+    "heygen_download": 2, "crop": 3, "cut": 2, "track_join": 1, "render": 30, "merge": 5, "publish": 3,
+}
+HEYGEN_STAGES = ("audio_upload", "heygen_submit", "heygen_queue", "heygen_render", "heygen_download")
+
+# Wall time of a job per second of its cost, until a job of its kind has finished here. Segments
+# run concurrently, so a job takes a fraction of its summed stage time
+DEFAULT_WALL_RATIO = 0.25
+
+ADMISSION_DECISIONS = REGISTRY.register(Counter(
+    "lisa_admission_decisions_total", "Podcast requests admitted right away, queued or rejected", ("decision",)))
+
+class Overloaded(Exception):
+    """A request would not be admitted soon enough; the client should retry after retry_after seconds"""
+
+    def __init__(self, retry_after, cost):
+        super().__init__(f"Server is at capacity, retry in {retry_after}s")
+        self.retry_after = retry_after
+        self.cost = cost
+
+def _stage_seconds(stage):
+    return recent_seconds(stage, DEFAULT_STAGE_SECONDS[stage])
+
+def estimate_segments(data):
+    """Dialogue segments of a request: counted in a script, estimated from the duration of an idea"""
+    if data.input_type == "script":
+        return max(1, len(process_dialogue(data.input_text, data.host_name, data.guest_name)))
+    return max(1, round(data.duration_minutes * settings.ADMISSION_SEGMENTS_PER_MINUTE))
+
+def estimate_cost(kind, data, segments=None):
+    """
+    Estimated work of a request in seconds of stage time, summed over its segments and per-job
+    stages. segments: Segment count when already known (a resumed job), else estimated.
+    """
+    per_job = ["merge", "publish"]
+    if segments is None:
+        segments = estimate_segments(data)
+        if data.input_type == "idea":
+            per_job.append("script")
+    per_segment = ["tts"]
+    if kind == "video":
+        render_mode = data.heygen_config.render_mode
+        if render_mode == "audiogram":
+            per_job.append("render")
+        elif render_mode == "speaker":
+            # One render per speaker, cut into lines
+            per_segment.append("cut")
+            per_job.extend(["track_join", *HEYGEN_STAGES] * 2)
+        else:
+            per_segment.extend(HEYGEN_STAGES)
+            if data.orientation == "portrait":
+                per_segment.append("crop")
+    return segments * sum(map(_stage_seconds, per_segment)) + sum(map(_stage_seconds, per_job))
+
+class Ticket:
+    """One request's claim on the budget: queued until admitted, released when its job finishes"""
+
+    def __init__(self, kind, cost, job_id=None):
+        self.kind = kind
+        self.cost = cost
+        self.job_id = job_id
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.expected_end = None
+        self.withdrawn = False
+
+    @property
+    def admitted(self):
+        return self.admitted_at is not None
+
+class AdmissionController:
+    """
+    Budget of estimated work in flight, with a FIFO queue of the requests waiting for room.
+    A job costlier than the whole budget is admitted alone rather than never.
+    """
+
+    def __init__(self, budget, max_queue_seconds):
+        self.budget = budget
+        self.max_queue_seconds = max_queue_seconds
+        self._condition = threading.Condition()
+        self._running = []
+        self._queue = deque()
+        self._wall_ratio = {}  # {kind: recent wall seconds per cost second of finished jobs}
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def _in_flight(self):
+        return sum(ticket.cost for ticket in self._running)
+
+    def _fits(self, ticket):
+        return not self._running or self._in_flight() + ticket.cost <= self.budget
+
+    def _expected_wall(self, ticket):
+        return ticket.cost * self._wall_ratio.get(ticket.kind, DEFAULT_WALL_RATIO)
+
+    def _admit(self, ticket, now):
+        ticket.admitted_at = now
+        ticket.expected_end = now + self._expected_wall(ticket)
+        self._running.append(ticket)
+
+    def _expected_admission(self, ticket, now):
+        """
+        When ticket (behind everything already queued) is expected to be admitted, replaying the
+        expected ends of running jobs. Jobs past their expected end are assumed to end within a second.
+        """
+        ends = [(max(running.expected_end, now + 1), running.cost) for running in self._running]
+        heapq.heapify(ends)
+        in_flight = sum(cost for _, cost in ends)
+        at = now
+        for waiting in [*self._queue, ticket]:
+            while ends and in_flight + waiting.cost > self.budget:
+                end, cost = heapq.heappop(ends)
+                in_flight -= cost
+                at = max(at, end)
+            in_flight += waiting.cost
+            heapq.heappush(ends, (at + self._expected_wall(waiting), waiting.cost))
+        return at
+
+    def reserve(self, kind, cost, job_id=None):
+        """Admit a request of cost, queue it (see wait) or raise Overloaded; returns its Ticket"""
+        ticket = Ticket(kind, cost, job_id)
+        with self._condition:
+            now = time.monotonic()
+            if not self._queue and self._fits(ticket):
+                self._admit(ticket, now)
+                ADMISSION_DECISIONS.inc(decision="admitted")
+                return ticket
+            expected_wait = self._expected_admission(ticket, now) - now
+            if expected_wait > self.max_queue_seconds:
+                ADMISSION_DECISIONS.inc(decision="rejected")
+                logger.warning("Rejecting %s request (cost %.0fs): %.0fs of work in flight, %s queued, expected wait %.0fs",
+                               kind, cost, self._in_flight(), len(self._queue), expected_wait)
+                raise Overloaded(max(1, math.ceil(expected_wait)), cost)
+            self._queue.append(ticket)
+            ADMISSION_DECISIONS.inc(decision="queued")
+            logger.info("Queued %s request (cost %.0fs), expected to start in %.0fs", kind, cost, expected_wait)
+            return ticket
+
+    def wait(self, ticket):
+        """Block until ticket is admitted; raises JobCancelled if it is withdrawn first"""
+        with self._condition:
+            while not ticket.admitted:
+                if ticket.withdrawn:
+                    raise JobCancelled(f"Job {ticket.job_id} was cancelled while queued")
+                if self._queue[0] is ticket and self._fits(ticket):
+                    self._queue.popleft()
+                    self._admit(ticket, time.monotonic())
+                    # The next request in line may fit as well
+                    self._condition.notify_all()
+                    break
+                self._condition.wait()
+        observe_wait("admission", ticket.admitted_at - ticket.enqueued_at)
+
+    def release(self, ticket, finished=True):
+        """
+        Return ticket's cost to the budget (or drop it from the queue). A finished job's wall
+        time updates the expected wall time of its kind.
+        """
+        with self._condition:
+            if ticket in self._running:
+                self._running.remove(ticket)
+                if finished and ticket.cost > 0:
+                    ratio = (time.monotonic() - ticket.admitted_at) / ticket.cost
+                    previous = self._wall_ratio.get(ticket.kind)
+                    self._wall_ratio[ticket.kind] = ratio if previous is None else previous + RECENT_WEIGHT * (ratio - previous)
+            elif ticket in self._queue:
+                self._queue.remove(ticket)
+            self._condition.notify_all()
+
+    def withdraw(self, job_id):
+        """Take the queued request of job_id out of the queue (its waiter raises JobCancelled); False if none"""
+        with self._condition:
+            for ticket in self._queue:
+                if ticket.job_id == job_id:
+                    self._queue.remove(ticket)
+                    ticket.withdrawn = True
+                    self._condition.notify_all()
+                    return True
+        return False
+
+    def stats(self):
+        with self._condition:
+            return {"in_flight": self._in_flight(), "queued": sum(ticket.cost for ticket in self._queue),
+                    "running_jobs": len(self._running), "queued_jobs": len(self._queue)}
+
+controller = AdmissionController(settings.ADMISSION_BUDGET_SECONDS, settings.ADMISSION_MAX_QUEUE_SECONDS)
+
+REGISTRY.register(Callback("lisa_admission_cost_seconds", "Estimated work of admitted and queued podcast requests",
+                           ("state",), lambda: {(state,): controller.stats()[state] for state in ("in_flight", "queued")}))
+REGISTRY.register(Callback("lisa_admission_queued_requests", "Podcast requests waiting for admission",
+                           (), lambda: {(): controller.stats()["queued_jobs"]}))
+
+def reserve(kind, data, job_id=None, segments=None):
+    """Ticket of a request (see AdmissionController.reserve), or None when admission control is off"""
+    if not controller.enabled:
+        return None
+    return controller.reserve(kind, estimate_cost(kind, data, segments), job_id)
+
+def release(ticket):
+    """Give up a ticket whose job never ran"""
+    if ticket is not None:
+        controller.release(ticket, finished=False)
+
+def withdraw(job_id):
+    return controller.enabled and controller.withdraw(job_id)
+
+@contextmanager
+def admitted(ticket):
+    """Run the enclosed block (the job) once ticket is admitted, and release its cost afterwards"""
+    if ticket is None:
+        yield
+        return
+    finished = False
+    try:
+        controller.wait(ticket)
+        yield
+        finished = True
+    finally:
+        controller.release(ticket, finished)
@@ -0,0 +1,204 @@
+import os
+import time
+import shutil
+import inspect
+import logging
+import tempfile
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.config import settings
+from app.utils.metrics import JobTimings, track_job, track_segment, replay, observe_wait, _current_segment
+
+logger = logging.getLogger(__name__)
+
+def offloadable(*outputs):
+    """
+    Mark a module-level function as segment work that a backend may run outside this process.
+    - outputs: Names of parameters that are paths of files the function writes; backends that
+      run it on another machine bring these files back to the given paths
+    Arguments and the return value must be picklable.
+    """
+    def mark(func):
+        func.offload_outputs = outputs
+        return func
+    return mark
+
+def _run_measured(func, args, segment):
+    """Run func(*args) collecting its spans; returns (result, wall-clock start, spans)"""
+    started = time.time()
+    timings = JobTimings()
+    with track_job(timings), track_segment(segment):
+        result = func(*args)
+    return result, started, timings.spans
+
+def _init_worker():
+    from app.utils.logging_config import configure_logging
+    configure_logging()
+
+class ThreadBackend:
+    """
+    Runs segment work inline on the pipeline's own worker threads (the default).
+    Subclasses move offloadable work elsewhere; the pipeline's threads still coordinate
+    each segment (provider calls, polling, manifest updates) and wait for the result.
+    """
+    name = "threads"
+
+    def run(self, func, *args):
+        if getattr(func, "offload_outputs", None) is None:
+            return func(*args)
+        return self._offload(func, args)
+
+    def _offload(self, func, args):
+        return func(*args)
+
+    def shutdown(self):
+        pass
+
+class ProcessBackend(ThreadBackend):
+    """
+    Runs offloadable work (ffmpeg downloads and crops) on a pool of local worker processes,
+    so CPU-bound steps use every core instead of contending with the request process.
+    - workers: Pool size; defaults to the CPU count
+    """
+    name = "processes"
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs threads (uvicorn, boto3) is unsafe
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker)
+            return self._pool
+
+    def _offload(self, func, args):
+        submitted = time.time()
+        pool = self._executor()
+        try:
+            result, started, spans = pool.submit(_run_measured, func, args, _current_segment.get()).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next task
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        observe_wait("process_pool", max(0.0, started - submitted))
+        replay(spans, started)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+def _output_paths(func, args):
+    """{parameter name: path} of the output files of an offloadable call"""
+    params = list(inspect.signature(func).parameters)
+    return {name: args[params.index(name)] for name in func.offload_outputs}
+
+class ModalBackend(ThreadBackend):
+    """
+    Fans offloadable work out to a deployed Modal function (run_segment_task in modal_app.py),
+    one call per segment, so the CPU work of a long episode spreads over many containers
+    instead of this one. Output files come back through content-addressed S3 intermediates.
+    """
+    name = "modal"
+
+    def __init__(self, app_name, function_name):
+        self.app_name = app_name
+        self.function_name = function_name
+        self._function = None
+
+    def _remote(self):
+        if self._function is None:
+            import modal
+            self._function = modal.Function.from_name(self.app_name, self.function_name)
+        return self._function
+
+    def _offload(self, func, args):
+        from app.utils.s3 import download_from_s3
+        outputs = _output_paths(func, args)
+        task = {"func": f"{func.__module__}:{func.__name__}", "args": list(args), "segment": _current_segment.get()}
+        submitted = time.time()
+        response = self._remote().remote(task)
+        # Includes container start and any clock skew between the machines
+        observe_wait("modal", max(0.0, response["started"] - submitted))
+        for path in set(outputs.values()):
+            if download_from_s3(response["outputs"][path], path) is None:
+                raise Exception(f"Output {path} of {task['func']} is missing from S3")
+        replay(response["spans"], response["started"])
+        return response["result"]
+
+def run_remote_task(task):
+    """
+    Worker side of ModalBackend: run an offloadable function with its output paths redirected
+    to a scratch directory, upload the outputs, and return them keyed by the caller's paths.
+    """
+    from app.utils.s3 import upload_content_addressed, key_from_url
+    module, name = task["func"].split(":")
+    func = getattr(importlib.import_module(module), name)
+    if getattr(func, "offload_outputs", None) is None:
+        raise ValueError(f"{task['func']} is not offloadable")
+
+    scratch = tempfile.mkdtemp(prefix="segment_", dir=settings.TMP_DIR)
+    try:
+        args = list(task["args"])
+        outputs = _output_paths(func, args)
+        # Parameters that name the same file (e.g. no separate raw render) stay the same file
+        local = {path: os.path.join(scratch, os.path.basename(path)) for path in set(outputs.values())}
+        params = list(inspect.signature(func).parameters)
+        for param, path in outputs.items():
+            args[params.index(param)] = local[path]
+
+        result, started, spans = _run_measured(func, args, task.get("segment"))
+
+        uploaded = {}
+        for path, local_path in local.items():
+            url = upload_content_addressed(local_path, extension=os.path.splitext(path)[1])
+            uploaded[path] = key_from_url(url)
+        # Report paths as the caller knows them
+        back = {local_path: path for path, local_path in local.items()}
+        if isinstance(result, tuple):
+            result = tuple(back.get(item, item) if isinstance(item, str) else item for item in result)
+        elif isinstance(result, str):
+            result = back.get(result, result)
+        return {"result": result, "outputs": uploaded, "started": started, "spans": spans}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def create_backend(name):
+    if name == "threads":
+        return ThreadBackend()
+    if name == "processes":
+        return ProcessBackend(settings.SEGMENT_PROCESSES or None)
+    if name == "modal":
+        return ModalBackend(settings.MODAL_APP_NAME, settings.MODAL_SEGMENT_FUNCTION)
+    raise ValueError(f"Unknown SEGMENT_BACKEND {name!r}; expected threads, processes or modal")
+
+# One backend per process, chosen per deployment with SEGMENT_BACKEND
+_backend = None
+_backend_lock = threading.Lock()
+
+def segment_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(settings.SEGMENT_BACKEND)
+                logger.info("Segment backend: %s", _backend.name)
+    return _backend
+
+def shutdown_segment_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.shutdown()
+            _backend = None
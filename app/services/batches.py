@@ -0,0 +1,257 @@
+"""
+Batches: many podcast requests submitted in one call (POST /v1/batch). Every item becomes a job
+right away (status "queued"), so it can be followed, cancelled and resumed like any other, and
+a background runner works through the batch:
+- identical items share one job;
+- "idea" items with the same idea, speakers, language and duration share one generated script;
+- up to BATCH_MAX_CONCURRENT_JOBS jobs run at once in the fair-share scheduler's "batch" lane,
+  so their segments keep the shared provider slots busy together (identical lines in flight
+  at the same time are synthesized once, see podcast._synthesize).
+Admission control makes items wait for room instead of rejecting them.
+"""
+import os
+import json
+import uuid
+import logging
+import threading
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
+from app.models import AudioPodcastRequest, VideoPodcastRequest
+from app.services.jobs import JobManifest
+from app.services.podcast import create_audio_podcast, create_video_podcast, process_dialogue
+from app.services.singleflight import request_fingerprint
+from app.services.admission import Overloaded, reserve, admitted
+from app.services.scheduler import fair_share
+from app.utils.openai_gpt import generate_podcast_script
+from app.utils.cancellation import JobCancelled
+from app.utils.logging_config import bind_job
+from app.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Job statuses of items still to finish
+ACTIVE_STATUSES = ("pending", "queued", "running")
+
+class BatchManifest:
+    """
+    Record of one batch, persisted as JSON under JOBS_DIR/batches.
+    - items: [{"type", "job_id"}] in submission order; identical items have the same job_id
+    """
+
+    def __init__(self, batch_id, tenant, items, created_at=None):
+        self.batch_id = batch_id
+        self.tenant = tenant
+        self.items = items
+        self.created_at = created_at or datetime.utcnow().isoformat()
+
+    @staticmethod
+    def _path(batch_id):
+        return os.path.join(settings.JOBS_DIR, "batches", f"{os.path.basename(batch_id)}.json")
+
+    @classmethod
+    def create(cls, tenant, items):
+        batch = cls(str(uuid.uuid4()), tenant, items)
+        batch.save()
+        logger.info("Created batch %s with %s items", batch.batch_id, len(items))
+        return batch
+
+    @classmethod
+    def load(cls, batch_id):
+        path = cls._path(batch_id)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No manifest found for batch {batch_id}")
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self):
+        path = self._path(self.batch_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"batch_id": self.batch_id, "tenant": self.tenant, "items": self.items,
+                       "created_at": self.created_at}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        """
+        Per-item status, progress and result, the count of items in each status, and the batch
+        status: "running" until every job has finished, then "completed", "partial" (some items
+        failed or were cancelled) or "failed".
+        """
+        jobs = {}
+        for item in self.items:
+            if item["job_id"] not in jobs:
+                try:
+                    jobs[item["job_id"]] = JobManifest.load(item["job_id"])
+                except FileNotFoundError:
+                    jobs[item["job_id"]] = None
+        items = []
+        counts = {}
+        for index, item in enumerate(self.items):
+            job = jobs[item["job_id"]]
+            status = job.status if job else "missing"
+            counts[status] = counts.get(status, 0) + 1
+            entry = {"index": index, "type": item["type"], "job_id": item["job_id"], "status": status}
+            if job:
+                key = "audio_path" if job.kind == "audio" else "video_path"
+                entry["segments_total"] = len(job.dialogue) if job.dialogue is not None else None
+                entry["segments_done"] = sum(1 for artifacts in job.segments.values() if artifacts.get(key))
+                if job.result:
+                    entry["result"] = job.result
+                if job.error:
+                    entry["error"] = job.error
+            items.append(entry)
+        if any(status in ACTIVE_STATUSES for status in counts):
+            status = "running"
+        elif set(counts) == {"completed"}:
+            status = "completed"
+        elif "completed" in counts or "partial" in counts:
+            status = "partial"
+        else:
+            status = "failed"
+        return {"batch_id": self.batch_id, "status": status, "total": len(items), "counts": counts,
+                "items": items, "created_at": self.created_at}
+
+def _item_request(item):
+    """The podcast request of a batch item (without its type); priority defaults to "batch" """
+    model = AudioPodcastRequest if item.type == "audio" else VideoPodcastRequest
+    fields = item.model_dump(exclude={"type"})
+    if "priority" not in item.model_fields_set:
+        fields["priority"] = "batch"
+    return model(**fields)
+
+def _script_key(data):
+    return (" ".join(data.input_text.split()), data.host_name, data.guest_name, data.language, data.duration_minutes)
+
+def _share_scripts(jobs):
+    """Generate one script for every idea asked for by several jobs, and record it (and its dialogue) in each"""
+    groups = {}
+    for job, data in jobs:
+        if data.input_type == "idea" and job.dialogue is None:
+            groups.setdefault(_script_key(data), []).append((job, data))
+    groups = [group for group in groups.values() if len(group) > 1]
+    if not groups:
+        return
+
+    def generate(group):
+        data = group[0][1]
+        with span("script"):
+            script = generate_podcast_script(data.input_text, data.host_name, data.guest_name, data.language, data.duration_minutes)
+        segments = [list(segment) for segment in process_dialogue(script, data.host_name, data.guest_name)]
+        for job, _ in group:
+            # Left alone if it was cancelled or started meanwhile
+            with job.locked():
+                if JobManifest.load(job.job_id).status != job.status:
+                    continue
+                job.script = script
+                job.dialogue = segments
+                job.save()
+        logger.info("Generated one script for %s jobs", len(group))
+
+    def run(group):
+        try:
+            generate(group)
+        except Exception as exc:
+            # Each job then generates its own script when it runs
+            logger.warning("Shared script generation for %s jobs failed: %s", len(group), exc)
+
+    with ThreadPoolExecutor(max_workers=min(len(groups), settings.BATCH_MAX_CONCURRENT_JOBS)) as executor:
+        list(executor.map(lambda group: contextvars.copy_context().run(run, group), groups))
+
+def _wait_for_admission(kind, data, job_id):
+    """Admission ticket of a batch job, waiting out Overloaded; raises JobCancelled if the job is cancelled meanwhile"""
+    while True:
+        try:
+            return reserve(kind, data, job_id=job_id)
+        except Overloaded as exc:
+            logger.info("Batch job %s waits %ss for admission", job_id, exc.retry_after)
+            threading.Event().wait(min(exc.retry_after, 30))
+        if JobManifest.load(job_id).status == "cancelled":
+            raise JobCancelled(f"Job {job_id} was cancelled while queued")
+
+def _unfinished(job):
+    """Whether a batch job still has to run here: not finished, and not running in a live process"""
+    return job.status in ACTIVE_STATUSES and not job.alive()
+
+def _run_job(job_id, kind, data, tenant):
+    create = create_audio_podcast if kind == "audio" else create_video_podcast
+    try:
+        with bind_job(job_id):
+            # The job may have been cancelled (or resumed by hand) while it was queued
+            job = JobManifest.load(job_id)
+            if not _unfinished(job):
+                logger.info("Batch job %s is %s, skipping it", job_id, job.status)
+                return
+            ticket = _wait_for_admission(kind, data, job_id)
+            # A cancellation after the check above makes create raise JobCancelled before it starts
+            with admitted(ticket), fair_share(job_id, kind, data.priority, tenant):
+                create(data, job=job)
+    except JobCancelled:
+        logger.info("Batch job %s was cancelled", job_id)
+    except Exception as exc:
+        logger.error("Batch job %s failed: %s", job_id, exc)
+
+def _run_batch(batch, jobs, tenant):
+    logger.info("=== RUNNING BATCH %s: %s jobs ===", batch.batch_id, len(jobs))
+    _share_scripts(jobs)
+    with ThreadPoolExecutor(max_workers=settings.BATCH_MAX_CONCURRENT_JOBS, thread_name_prefix=f"batch-{batch.batch_id[:8]}") as executor:
+        for job, data in jobs:
+            executor.submit(contextvars.copy_context().run, _run_job, job.job_id, job.kind, data, tenant)
+    logger.info("=== BATCH %s FINISHED ===", batch.batch_id)
+
+def _run_in_background(batch, jobs, tenant):
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(_run_batch, batch, jobs, tenant),
+                              name=f"batch-{batch.batch_id[:8]}", daemon=True)
+    thread.start()
+
+def start_batch(request, tenant):
+    """Create the jobs and the manifest of a batch and start running it in the background"""
+    jobs = {}  # {request fingerprint: (job, request)}
+    items = []
+    for item in request.items:
+        data = _item_request(item)
+        fingerprint = request_fingerprint(item.type, data)
+        if fingerprint not in jobs:
+            job = JobManifest.create(item.type, data)
+            job.set_status("queued")
+            jobs[fingerprint] = (job, data)
+        items.append({"type": item.type, "job_id": jobs[fingerprint][0].job_id})
+    batch = BatchManifest.create(tenant, items)
+    if len(jobs) < len(items):
+        logger.info("Batch %s: %s identical items share a job", batch.batch_id, len(items) - len(jobs))
+    _run_in_background(batch, list(jobs.values()), tenant)
+    return batch
+
+def resume_batches():
+    """
+    Pick up the batches a restart interrupted: their jobs that never started, and those orphaned
+    while running, are run again (resumed from their manifests). Every worker sharing JOBS_DIR
+    does this at startup; a job another worker has already started is skipped.
+    """
+    directory = os.path.join(settings.JOBS_DIR, "batches")
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            batch = BatchManifest.load(name[:-len(".json")])
+            jobs = {}
+            for item in batch.items:
+                if item["job_id"] in jobs:
+                    continue
+                try:
+                    job = JobManifest.load(item["job_id"])
+                except FileNotFoundError:
+                    continue
+                if _unfinished(job):
+                    model = AudioPodcastRequest if job.kind == "audio" else VideoPodcastRequest
+                    jobs[job.job_id] = (job, model(**job.request))
+        except Exception as e:
+            logger.warning("Could not load batch %s: %s", name, e)
+            continue
+        if jobs:
+            logger.info("Resuming batch %s: %s unfinished jobs", batch.batch_id, len(jobs))
+            _run_in_background(batch, list(jobs.values()), batch.tenant)
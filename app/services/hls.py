@@ -0,0 +1,131 @@
+import os
+import math
+import logging
+import threading
+from app.config import settings
+from app.utils.ffmpeg_merge import segment_for_hls
+from app.utils.metrics import span
+from app.utils.s3 import upload_to_s3, put_text, object_url
+
+logger = logging.getLogger(__name__)
+
+HLS_PREFIX = "podcasts/stream"
+PLAYLIST_NAME = "index.m3u8"
+
+def stream_url(job_id):
+    """URL of a job's HLS playlist (known before the first segment is published)"""
+    return object_url(f"{HLS_PREFIX}/{job_id}/{PLAYLIST_NAME}")
+
+class HlsPublisher:
+    """
+    Publishes the finished segments of a job to S3 as an HLS event playlist, in dialogue order,
+    so listeners can start playing the episode while later segments are still being generated.
+    Segments may finish in any order; each one waits until every earlier segment is published.
+    Segments are remuxed into MPEG-TS fragments (no re-encode) with continuous timestamps.
+    """
+
+    def __init__(self, job, segment_seconds=None, target_duration=None):
+        self.job = job
+        self.prefix = f"{HLS_PREFIX}/{job.job_id}"
+        self.url = stream_url(job.job_id)
+        self.segment_seconds = segment_seconds or settings.HLS_SEGMENT_SECONDS
+        self.target_duration = target_duration or settings.HLS_TARGET_DURATION
+        self.work_dir = job.workspace_path("hls")
+        self.duration = 0.0
+        self._entries = []  # [(fragment name, duration)]
+        self._ready = {}  # {idx: path} of finished segments waiting for an earlier one
+        self._next = 0
+        self._complete = False
+        # One thread at a time publishes the ready segments in order; the lock only guards the
+        # state above, so segments are cut and uploaded without holding it
+        self._publishing = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def add(self, idx, path):
+        """
+        Publish a finished segment, along with any later ones that were waiting for it. If another
+        thread is publishing, that thread takes over the segment and add returns at once.
+        """
+        with self._lock:
+            self._ready[idx] = path
+            if self._publishing:
+                return
+            self._publishing = True
+        try:
+            while True:
+                with self._lock:
+                    if self._next not in self._ready:
+                        self._publishing = False
+                        self._idle.notify_all()
+                        return
+                    idx, path = self._next, self._ready[self._next]
+                # Only dropped once published, so a failed upload is retried by the next add
+                if path is not None:
+                    self._publish(idx, path)
+                with self._lock:
+                    del self._ready[idx]
+                    self._next += 1
+        except BaseException:
+            with self._lock:
+                self._publishing = False
+                self._idle.notify_all()
+            raise
+
+    def skip(self, idx):
+        """Leave a segment out of the stream (a partial episode), so later ones are published"""
+        self.add(idx, None)
+
+    def _publish(self, idx, path):
+        with span("stream_publish", segment=idx):
+            fragments = segment_for_hls(path, os.path.join(self.work_dir, f"seg{idx}_%03d.ts"),
+                                        os.path.join(self.work_dir, f"seg{idx}.csv"), self.duration, self.segment_seconds)
+            entries = []
+            for fragment, duration in fragments:
+                name = os.path.basename(fragment)
+                upload_to_s3(fragment, f"{self.prefix}/{name}", content_type="video/mp2t")
+                os.remove(fragment)
+                if duration > self.target_duration:
+                    # Stream copy can only cut at keyframes; render() raises the target duration to match
+                    logger.warning("HLS fragment %s is %.1fs, longer than the %ss target duration", name, duration, self.target_duration)
+                entries.append((name, duration))
+            with self._lock:
+                self._entries.extend(entries)
+                self.duration += sum(duration for _, duration in entries)
+                playlist = self.render()
+            self._upload_playlist(playlist)
+        logger.info("Segment %s published to stream (%.1fs so far)", idx + 1, self.duration, extra={"segment": idx})
+
+    def finish(self):
+        """Mark the playlist complete (players stop polling it); returns its URL"""
+        with self._lock:
+            # Segments handed to a publishing thread are in the playlist before it ends
+            self._idle.wait_for(lambda: not self._publishing)
+            self._complete = True
+            playlist = self.render()
+        self._upload_playlist(playlist)
+        logger.info("Stream complete: %s (%.1fs)", self.url, self.duration)
+        return self.url
+
+    def render(self):
+        # Every fragment must fit in the target duration, which stream copy cannot guarantee
+        longest = max((duration for _, duration in self._entries), default=0)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(self.target_duration, longest))}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        for name, duration in self._entries:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if self._complete:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def _upload_playlist(self, playlist):
+        # Players re-fetch the playlist while it grows, so it must not be cached
+        put_text(f"{self.prefix}/{PLAYLIST_NAME}", playlist, "application/vnd.apple.mpegurl",
+                 cache_control="no-cache, no-store")
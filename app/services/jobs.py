@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import socket
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from app.config import settings
+from app.utils.cancellation import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+# Files kept next to the manifest: the lock serializing status changes across the processes that
+# share JOBS_DIR, and the heartbeat of the process running the job ({"host", "pid"}, touched
+# every JOB_HEARTBEAT_SECONDS)
+LOCK_FILE = "manifest.lock"
+HEARTBEAT_FILE = "heartbeat.json"
+
+class JobConflict(Exception):
+    """A job cannot be started because it is completed or running in another process"""
+
+class JobManifest:
+    """
+    Per-job record of completed segment artifacts, persisted as JSON in the job workspace.
+    - job_id: Unique job identifier (also used for the workspace directory and S3 keys)
+    - kind: "audio" or "video"
+    - request: The original request payload, so the job can be resumed later
+    - segments: {idx: {"audio_path", "audio_url", "video_id", "video_path"}}
+    - tracks: {speaker: {"cuts", "audio_path", "audio_url", "video_id", "video_path"}} of
+      per-speaker Heygen renders (render_mode "speaker"), where cuts is [[idx, start, end]]
+    - timings: Stage timing breakdown of the last run (see app.utils.metrics.JobTimings)
+    """
+
+    def __init__(self, job_id, kind, request, status="pending", script=None, dialogue=None,
+                 segments=None, tracks=None, result=None, error=None, timings=None, created_at=None, updated_at=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.request = request
+        self.status = status
+        self.script = script
+        self.dialogue = dialogue
+        self.segments = segments or {}
+        self.tracks = tracks or {}
+        self.result = result
+        self.error = error
+        self.timings = timings
+        self.created_at = created_at or datetime.utcnow().isoformat()
+        self.updated_at = updated_at or self.created_at
+        self._lock = threading.Lock()
+
+    @property
+    def workspace(self):
+        return os.path.join(settings.JOBS_DIR, self.job_id)
+
+    @property
+    def path(self):
+        return os.path.join(self.workspace, "manifest.json")
+
+    def workspace_path(self, filename):
+        """Return the path of a file inside this job's workspace"""
+        return os.path.join(self.workspace, filename)
+
+    @classmethod
+    def create(cls, kind, data):
+        job = cls(str(uuid.uuid4()), kind, data.model_dump())
+        os.makedirs(job.workspace, exist_ok=True)
+        job.save()
+        logger.info("Created %s job %s in %s", kind, job.job_id, job.workspace)
+        return job
+
+    @classmethod
+    def load(cls, job_id):
+        path = os.path.join(settings.JOBS_DIR, os.path.basename(job_id), "manifest.json")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No manifest found for job {job_id}")
+        with open(path) as f:
+            state = json.load(f)
+        # JSON object keys are always strings; segment indices are ints everywhere else
+        state["segments"] = {int(idx): artifacts for idx, artifacts in state.get("segments", {}).items()}
+        return cls(**state)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "request": self.request,
+            "status": self.status,
+            "script": self.script,
+            "dialogue": self.dialogue,
+            "segments": self.segments,
+            "tracks": self.tracks,
+            "result": self.result,
+            "error": self.error,
+            "timings": self.timings,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def summary(self, include_timings=False):
+        """Job state without the request payload and script, for status responses"""
+        total = len(self.dialogue) if self.dialogue is not None else None
+        summary = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "segments_total": total,
+            "segments": self.segments,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if include_timings:
+            summary["timings"] = self.timings
+        return summary
+
+    def save(self):
+        """Write the manifest atomically so a crash never leaves a half-written file"""
+        with self._lock:
+            self.updated_at = datetime.utcnow().isoformat()
+            os.makedirs(self.workspace, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def segment(self, idx):
+        """Return the recorded artifacts for a segment (empty dict if none)"""
+        return self.segments.get(idx, {})
+
+    def record(self, idx, **artifacts):
+        """Record completed artifacts for a segment and persist the manifest"""
+        with self._lock:
+            self.segments.setdefault(idx, {}).update(artifacts)
+        self.save()
+
+    def forget(self, idx, *keys):
+        """Drop recorded artifacts that turned out to be unusable"""
+        with self._lock:
+            for key in keys:
+                self.segments.get(idx, {}).pop(key, None)
+        self.save()
+
+    def track(self, speaker):
+        """Return the recorded artifacts of a speaker's render (empty dict if none)"""
+        return self.tracks.get(speaker, {})
+
+    def record_track(self, speaker, **artifacts):
+        with self._lock:
+            self.tracks.setdefault(speaker, {}).update(artifacts)
+        self.save()
+
+    def forget_track(self, speaker, *keys):
+        """Drop artifacts of a speaker's render, or the whole render when no keys are given"""
+        with self._lock:
+            if keys:
+                for key in keys:
+                    self.tracks.get(speaker, {}).pop(key, None)
+            else:
+                self.tracks.pop(speaker, None)
+        self.save()
+
+    def has_file(self, idx, key):
+        """Check that a recorded local artifact still exists on disk"""
+        path = self.segment(idx).get(key)
+        return bool(path) and os.path.exists(path)
+
+    def set_status(self, status, result=None, error=None, timings=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        if timings is not None:
+            self.timings = timings
+        self.save()
+
+    @contextmanager
+    def locked(self):
+        """Hold the job's lock, shared by every process using JOBS_DIR, for a check-then-update of its status"""
+        os.makedirs(self.workspace, exist_ok=True)
+        with open(self.workspace_path(LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def alive(self):
+        """
+        Whether some process is running the job: its heartbeat is recent and, when it runs on this
+        host, its process still exists
+        """
+        path = self.workspace_path(HEARTBEAT_FILE)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            with open(path) as f:
+                owner = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if age > 3 * settings.JOB_HEARTBEAT_SECONDS:
+            return False
+        if owner.get("host") == socket.gethostname():
+            try:
+                os.kill(owner["pid"], 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return True
+
+    def _beat(self):
+        path = self.workspace_path(HEARTBEAT_FILE)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"host": socket.gethostname(), "pid": os.getpid()}, f)
+            os.replace(tmp_path, path)
+
+    @contextmanager
+    def running(self):
+        """
+        Mark the job running in this process and keep its heartbeat fresh while the enclosed block
+        runs. The status is checked and set in one step under the job's lock: a job cancelled since
+        this manifest was loaded raises JobCancelled (resuming a cancelled job is fine), one
+        completed or running elsewhere raises JobConflict.
+        """
+        with self.locked():
+            try:
+                status = JobManifest.load(self.job_id).status
+            except FileNotFoundError:
+                status = self.status
+            if status == "cancelled" and self.status != "cancelled":
+                raise JobCancelled(f"Job {self.job_id} was cancelled before it started")
+            if status == "completed" or (status == "running" and self.alive()):
+                raise JobConflict(f"Job {self.job_id} is already {status}")
+            self._beat()
+            self.set_status("running")
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+                try:
+                    self._beat()
+                except OSError as e:
+                    logger.warning("Could not refresh the heartbeat of job %s: %s", self.job_id, e)
+
+        thread = threading.Thread(target=beat, name=f"heartbeat-{self.job_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            try:
+                os.remove(self.workspace_path(HEARTBEAT_FILE))
+            except OSError:
+                pass
+
+    def cleanup(self):
+        """Remove everything in the workspace except the manifest itself (and its lock and heartbeat)"""
+        keep = {self.path, self.workspace_path(LOCK_FILE), self.workspace_path(HEARTBEAT_FILE)}
+        for name in os.listdir(self.workspace):
+            path = os.path.join(self.workspace, name)
+            if path in keep:
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                logger.info("Removed: %s", path)
+            except OSError:
+                logger.warning("Could not remove: %s", path)
@@ -1,28 +1,47 @@
 import os
+import time
+import shutil
 import logging
 import re
+import contextvars
+from functools import partial
+from urllib.parse import urlparse
 from app.utils.openai_gpt import generate_podcast_script
-from app.utils.elevenlabs import synthesize_voice
-from app.utils.heygen import generate_avatar_video
-from app.utils.ffmpeg_merge import merge_audio_clips, merge_video_clips
-from app.utils.s3 import upload_to_s3
+from app.utils.elevenlabs import synthesize_voice, synthesize_lines, batch_lines, AlignmentMismatch
+from app.utils.heygen import submit_avatar_video, poll_avatar_video, download_avatar_video
+from app.utils.ffmpeg_merge import merge_audio_clips, merge_video_clips, crop_video_to_portrait, stream_audio_merge, stream_video_merge, join_audio_with_offsets, cut_clip, split_audio
+from app.utils.s3 import upload_to_s3, upload_stream, upload_content_addressed, delete_prefix, collect_garbage_in_background
 from app.config import settings
+from app.models import AudioPodcastRequest, VideoPodcastRequest
+from app.services.jobs import JobManifest
+from app.utils.audiogram import LAYOUTS, download_image, render_audiogram, stream_audiogram
+from app.utils.media_probe import media_duration
+from app.utils.file_cache import render_cache, render_key, tts_cache, tts_key
+from app.utils.metrics import JobTimings, track_job, track_segment, span, observe_wait, JOB_SECONDS, JOBS_TOTAL
+from app.utils.profiling import checkpoint, profiled_thread
+from app.utils.logging_config import bind_job
+from app.utils.cancellation import JobCancelled, cancellable, check_cancelled, on_cancel
+from app.utils.deadlines import DeadlineExceeded, job_deadline, time_left, past_soft_deadline, check_deadline
+from app.services.backends import offloadable, segment_backend
+from app.services.scheduler import provider_slot
+from app.services.singleflight import SingleFlight
+from app.services.hls import HLS_PREFIX, HlsPublisher, stream_url
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
 def process_dialogue(script, host, guest):
-    logger.info(f"Processing dialogue script for {host} and {guest}")
-    logger.info(f"Script preview: {script[:200]}...")
+    logger.info("Processing dialogue script for %s and %s", host, guest)
+    logger.debug("Script preview: %s...", script[:200])
     
     # Split into lines and clean up
     lines = [line.strip() for line in script.split("\n") if line.strip()]
-    logger.info(f"Total lines in script: {len(lines)}")
+    logger.info("Total lines in script: %s", len(lines))
     
     segments = []
     for i, line in enumerate(lines):
-        logger.info(f"Processing line {i+1}: {line[:100]}...")
+        logger.debug("Processing line %s: %s...", i+1, line[:100])
         
         # Try different patterns for dialogue
         # Pattern 1: "Name:" or "**Name:**" (with asterisks)
@@ -31,25 +50,25 @@ def process_dialogue(script, host, guest):
             text = re.sub(f"^\\*?\\*?{re.escape(host)}\\*?\\*?:\\s*", "", line, flags=re.IGNORECASE).strip()
             if text:
                 segments.append(("host", text))
-                logger.info(f"Found host dialogue: {text[:50]}...")
+                logger.debug("Found host dialogue: %s...", text[:50])
         elif re.match(f"^\\*?\\*?{re.escape(guest)}\\*?\\*?:", line, re.IGNORECASE):
             # Remove asterisks and extract text after colon
             text = re.sub(f"^\\*?\\*?{re.escape(guest)}\\*?\\*?:\\s*", "", line, flags=re.IGNORECASE).strip()
             if text:
                 segments.append(("guest", text))
-                logger.info(f"Found guest dialogue: {text[:50]}...")
+                logger.debug("Found guest dialogue: %s...", text[:50])
         
         # Pattern 2: "Name - text"
         elif re.match(f"^{re.escape(host)} -", line, re.IGNORECASE):
             text = line[len(host):].strip(" -").strip()
             if text:
                 segments.append(("host", text))
-                logger.info(f"Found host dialogue (dash): {text[:50]}...")
+                logger.debug("Found host dialogue (dash): %s...", text[:50])
         elif re.match(f"^{re.escape(guest)} -", line, re.IGNORECASE):
             text = line[len(guest):].strip(" -").strip()
             if text:
                 segments.append(("guest", text))
-                logger.info(f"Found guest dialogue (dash): {text[:50]}...")
+                logger.debug("Found guest dialogue (dash): %s...", text[:50])
         
         # Pattern 3: "Name (speaking): text" or "**Name (speaking):** text"
         elif re.match(f"^\\*?\\*?{re.escape(host)}.*:", line, re.IGNORECASE):
@@ -59,7 +78,7 @@ def process_dialogue(script, host, guest):
                 text = parts[1].strip()
                 if text:
                     segments.append(("host", text))
-                    logger.info(f"Found host dialogue (colon): {text[:50]}...")
+                    logger.debug("Found host dialogue (colon): %s...", text[:50])
         elif re.match(f"^\\*?\\*?{re.escape(guest)}.*:", line, re.IGNORECASE):
             # Extract text after the first colon
             parts = line.split(":", 1)
@@ -67,9 +86,9 @@ def process_dialogue(script, host, guest):
                 text = parts[1].strip()
                 if text:
                     segments.append(("guest", text))
-                    logger.info(f"Found guest dialogue (colon): {text[:50]}...")
+                    logger.debug("Found guest dialogue (colon): %s...", text[:50])
     
-    logger.info(f"Extracted {len(segments)} dialogue segments")
+    logger.info("Extracted %s dialogue segments", len(segments))
     
     # If no segments found, create a fallback
     if len(segments) == 0:
@@ -81,278 +100,1011 @@ def process_dialogue(script, host, guest):
         for i, sentence in enumerate(sentences[:10]):  # Limit to 10 sentences
             speaker = "host" if i % 2 == 0 else "guest"
             segments.append((speaker, sentence))
-            logger.info(f"Created fallback {speaker} segment: {sentence[:50]}...")
+            logger.debug("Created fallback %s segment: %s...", speaker, sentence[:50])
     
     return segments
 
-def create_audio_podcast(data):
-    logger.info("=== STARTING AUDIO PODCAST GENERATION ===")
-    logger.info(f"Input type: {data.input_type}")
-    logger.info(f"Language: {data.language}")
-    logger.info(f"Target duration: {data.duration_minutes} minutes")
-    logger.info(f"Host: {data.host_name} (Voice ID: {data.host_voice_id})")
-    logger.info(f"Guest: {data.guest_name} (Voice ID: {data.guest_voice_id})")
+def _prepare_dialogue(data, job):
+    """Generate the script and dialogue segments, or reuse the ones recorded in the job manifest"""
+    if job.dialogue is not None:
+        logger.info("Reusing script and %s dialogue segments from job %s", len(job.dialogue), job.job_id)
+        return [tuple(segment) for segment in job.dialogue]
     
     # Step 1: Generate or use script
     if data.input_type == "idea":
         logger.info("Generating podcast script from idea...")
-        script = generate_podcast_script(data.input_text, data.host_name, data.guest_name, data.language, data.duration_minutes)
-        logger.info(f"Generated script length: {len(script)} characters")
+        with span("script"):
+            script = generate_podcast_script(data.input_text, data.host_name, data.guest_name, data.language, data.duration_minutes)
+        logger.info("Generated script length: %s characters", len(script))
     else:
         logger.info("Using provided script...")
         script = data.input_text
-        logger.info(f"Script length: {len(script)} characters")
+        logger.info("Script length: %s characters", len(script))
     
     # Step 2: Process dialogue
     logger.info("Processing dialogue into segments...")
-    segments = process_dialogue(script, data.host_name, data.guest_name)
-    logger.info(f"Created {len(segments)} audio segments")
+    with span("parse"):
+        segments = process_dialogue(script, data.host_name, data.guest_name)
+    
+    # Persist the script so a resumed "idea" job does not get a different dialogue from OpenAI
+    job.script = script
+    job.dialogue = [list(segment) for segment in segments]
+    job.save()
+    checkpoint("dialogue")
+    return segments
+
+# Speech synthesis in flight, by TTS cache key
+_tts_inflight = SingleFlight()
+
+def _synthesize(text, voice_id, config, out_path):
+    """
+    synthesize_voice, reusing audio already generated for the same text, voice and settings.
+    Identical lines requested at the same time (e.g. by jobs of one batch) share one request.
+    """
+    key = tts_key(text, voice_id, config)
+    if tts_cache().get(key, out_path):
+        return out_path
+    
+    def synthesize():
+        # The slot is taken for each attempt, not while a failed one backs off
+        with span("tts"):
+            synthesize_voice(text, voice_id, config, out_path, slot=partial(provider_slot, "elevenlabs"))
+        tts_cache().put(key, out_path)
+        return out_path
+    
+    def still_wanted():
+        check_cancelled()
+        check_deadline("Speech synthesis")
+    
+    try:
+        # Waiting on another job's request ends when this job is cancelled or out of time
+        produced, shared = _tts_inflight.do(key, synthesize, on_wait=still_wanted)
+    except JobCancelled:
+        # Another job's cancellation is no reason to fail this one
+        still_wanted()
+        return synthesize()
+    # The first caller wrote its own job's file, which stays in its workspace until that job ends
+    if shared and produced != out_path and not tts_cache().get(key, out_path):
+        shutil.copyfile(produced, out_path)
+    return out_path
+
+def _synthesize_batched(data, job, lines):
+    """
+    TTS_BATCHING: synthesize lines [(idx, speaker, text, voice_id)] with a few large requests per
+    voice and split each response into per-line clips midway through the pauses between lines.
+    Clips are recorded in the job manifest. Returns {idx: exception} of the lines that failed.
+    """
+    config = data.elevenlabs_config
+    by_voice = {}
+    for idx, speaker, text, voice_id in lines:
+        out_path = job.workspace_path(f"audio_{idx}.mp3")
+        if tts_cache().get(tts_key(text, voice_id, config), out_path):
+            job.record(idx, audio_path=out_path)
+        else:
+            by_voice.setdefault(voice_id, []).append((idx, text))
+    batches = []
+    for voice_id, voice_lines in by_voice.items():
+        for batch in batch_lines([text for _, text in voice_lines], settings.TTS_BATCH_MAX_CHARS):
+            batches.append((voice_id, [voice_lines[i] for i in batch]))
+    
+    def synthesize_batch(voice_id, batch):
+        check_deadline("Speech synthesis")
+        idxs = [idx for idx, _ in batch]
+        batch_path = job.workspace_path(f"tts_batch_{idxs[0]}.mp3")
+        try:
+            with span("tts"):
+                times = synthesize_lines([text for _, text in batch], voice_id, config, batch_path,
+                                         slot=partial(provider_slot, "elevenlabs"))
+        except AlignmentMismatch:
+            # The audio cannot be cut into lines, so the batch is synthesized line by line instead
+            logger.warning("Could not split batched audio for segments %s; synthesizing them one by one",
+                           ", ".join(str(idx + 1) for idx in idxs))
+            for idx, text in batch:
+                check_deadline("Speech synthesis")
+                out_path = _synthesize(text, voice_id, config, job.workspace_path(f"audio_{idx}.mp3"))
+                job.record(idx, audio_path=out_path)
+            return
+        cut_points = [(end + next_start) / 2 for (_, end), (next_start, _) in zip(times, times[1:])]
+        out_paths = [job.workspace_path(f"audio_{idx}.mp3") for idx in idxs]
+        with span("tts_split"):
+            split_audio(batch_path, cut_points, out_paths)
+        os.remove(batch_path)
+        for (idx, text), out_path in zip(batch, out_paths):
+            tts_cache().put(tts_key(text, voice_id, config), out_path)
+            job.record(idx, audio_path=out_path)
+    
+    def run(voice_id, batch):
+        with profiled_thread():
+            synthesize_batch(voice_id, batch)
+    
+    failures = {}
+    if not batches:
+        return failures
+    logger.info("Synthesizing %s lines in %s batched requests", sum(len(batch) for _, batch in batches), len(batches))
+    # Same ElevenLabs concurrency limit as per-line requests
+    with ThreadPoolExecutor(max_workers=min(10, len(batches))) as executor:
+        future_to_batch = {
+            executor.submit(contextvars.copy_context().run, run, voice_id, batch): batch
+            for voice_id, batch in batches
+        }
+        with on_cancel(partial(executor.shutdown, wait=False, cancel_futures=True)):
+            for future in as_completed(future_to_batch):
+                batch = future_to_batch[future]
+                try:
+                    future.result()
+                except Exception as exc:
+                    logger.error("Batched audio generation for segments %s generated an exception: %s",
+                                 ", ".join(str(idx + 1) for idx, _ in batch), exc)
+                    failures.update({idx: exc for idx, _ in batch})
+    check_cancelled()
+    return failures
+
+@offloadable("raw_video", "out_video")
+def finish_segment_video(idx, video_url, raw_video, out_video, orientation, crop_preset=None):
+    """
+    Download a completed Heygen render to raw_video (unless video_url is None because it is
+    already there) and, for portrait output, crop it into out_video. For landscape output
+    raw_video and out_video are the same file. Runs on the segment backend.
+    - crop_preset: x264 preset of the crop (see _crop_preset)
+    """
+    if video_url:
+        download_avatar_video(video_url, raw_video)
+    if orientation == "portrait":
+        logger.info("Cropping video segment %s to portrait orientation...", idx + 1)
+        with span("crop"):
+            crop_video_to_portrait(raw_video, out_video, preset=crop_preset)
+        logger.info("Video segment %s cropped to portrait: %s", idx + 1, out_video)
+    return idx, out_video
+
+def _run_segments(func, args_list, max_workers, label, limiter):
+    """
+    Run func over args_list concurrently, where each args tuple starts with the segment index
+    and func returns (idx, result).
+    Every segment runs to completion even if others fail, so that completed work is recorded
+    in the job manifest. Returns ({idx: result}, {idx: exception}).
+    If the job is cancelled, queued segments never start and JobCancelled is raised.
+    - limiter: Name under which time spent waiting for a free worker is recorded
+    """
+    results = {}
+    failures = {}
+    if not args_list:
+        return results, failures
+    
+    def run(args, submitted_at):
+        observe_wait(limiter, time.perf_counter() - submitted_at)
+        check_cancelled()
+        with track_segment(args[0]), profiled_thread():
+            return func(args)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Each task runs in a copy of this context, so its spans are attributed to the current job
+        future_to_idx = {
+            executor.submit(contextvars.copy_context().run, run, args, time.perf_counter()): args[0]
+            for args in args_list
+        }
+        
+        # Collect results as they complete; cancelling the job drops the segments still queued
+        with on_cancel(partial(executor.shutdown, wait=False, cancel_futures=True)):
+            for future in as_completed(future_to_idx):
+                idx = future_to_idx[future]
+                try:
+                    segment_idx, result = future.result()
+                    results[segment_idx] = result
+                    logger.info("Completed %s for segment %s", label, idx + 1, extra={"segment": idx})
+                except Exception as exc:
+                    logger.error("%s for segment %s generated an exception: %s", label, idx + 1, exc)
+                    failures[idx] = exc
+    
+    check_cancelled()
+    return results, failures
+
+def _speaker_lines(segments, pending, failures=()):
+    """{speaker: [idx]} of the pending lines of each speaker, in dialogue order"""
+    lines = {}
+    for idx in pending:
+        if idx not in failures:
+            lines.setdefault(segments[idx][0], []).append(idx)
+    return lines
+
+def _reusable_track(job, speaker, lines):
+    """
+    The speaker's recorded render when it covers all of lines and still has something to
+    render from (or is already rendered), otherwise None
+    """
+    track = job.track(speaker)
+    if not track or not set(lines) <= {idx for idx, _, _ in track["cuts"]}:
+        return None
+    if (track.get("video_path") and os.path.exists(track["video_path"])) or track.get("video_id") or track.get("audio_url"):
+        return track
+    if track.get("audio_path") and os.path.exists(track["audio_path"]):
+        return track
+    return None
+
+def _render_by_speaker(data, job, segments, pending, failures, width, height, on_segment):
+    """
+    render_mode "speaker": join each speaker's pending lines into one audio track, render one
+    Heygen video per track, and cut every line out of its speaker's render locally.
+    An episode costs two renders instead of one per line. on_segment(idx, video_path) is
+    called for every finished line. Returns {idx: exception} of the lines that failed.
+    """
+    new_failures = {}
+    lines = _speaker_lines(segments, pending, failures)
+
+    # Step 3b: Build the track of each speaker, unless an earlier attempt already did
+    for speaker, idxs in list(lines.items()):
+        if _reusable_track(job, speaker, idxs):
+            logger.info("Reusing %s track of job %s", speaker, job.job_id)
+            continue
+        missing = [idx for idx in idxs if not job.has_file(idx, "audio_path")]
+        for idx in missing:
+            new_failures[idx] = Exception(f"Audio for segment {idx + 1} is missing")
+        idxs = [idx for idx in idxs if idx not in missing]
+        lines[speaker] = idxs
+        job.forget_track(speaker)
+        if not idxs:
+            continue
+        audio_path = job.workspace_path(f"track_{speaker}.mp3")
+        try:
+            with span("track_join"):
+                offsets = join_audio_with_offsets([job.segment(idx)["audio_path"] for idx in idxs], audio_path,
+                                                  gap_seconds=settings.HEYGEN_TRACK_GAP_SECONDS)
+        except Exception as exc:
+            logger.error("Joining the %s track failed: %s", speaker, exc)
+            new_failures.update({idx: exc for idx in idxs})
+            continue
+        job.record_track(speaker, cuts=[[idx, start, end] for idx, (start, end) in zip(idxs, offsets)], audio_path=audio_path)
+        logger.info("%s track: %s lines, %.1fs", speaker.capitalize(), len(idxs), offsets[-1][1])
+    lines = {speaker: idxs for speaker, idxs in lines.items() if idxs and job.track(speaker)}
+
+    # Step 3c: Render the tracks concurrently
+    def heygen_render(speaker, track, avatar_id, length):
+        """URL of the speaker's finished Heygen render, polling an earlier attempt's if it is still usable"""
+        if track.get("video_id"):
+            logger.info("%s track already submitted to Heygen (video ID: %s), polling existing render", speaker.capitalize(), track["video_id"])
+            try:
+                return poll_avatar_video(track["video_id"], audio_seconds=length)
+            except Exception as exc:
+                logger.warning("Previous Heygen render %s of the %s track is unusable (%s), resubmitting", track["video_id"], speaker, exc)
+                job.forget_track(speaker, "video_id")
+
+        audio_url = track.get("audio_url")
+        if not audio_url:
+            check_deadline("Audio upload")
+            with span("audio_upload"):
+                audio_url = upload_content_addressed(track["audio_path"], extension=".mp3")
+            job.record_track(speaker, audio_url=audio_url)
+        logger.info("Generating video for the %s track (%.1fs) using avatar ID: %s", speaker, length, avatar_id)
+        check_deadline("Heygen render")
+        video_id = submit_avatar_video(audio_url, avatar_id, data.heygen_config.background, width=width, height=height)
+        job.record_track(speaker, video_id=video_id)
+        return poll_avatar_video(video_id, audio_seconds=length)
+
+    def render_track(speaker):
+        track = job.track(speaker)
+        video_path = job.workspace_path(f"track_{speaker}.mp4")
+        if track.get("video_path") and os.path.exists(track["video_path"]):
+            return track["video_path"]
+
+        avatar_id = data.heygen_config.host_avatar_id if speaker == "host" else data.heygen_config.guest_avatar_id
+        key = None
+        if track.get("audio_path") and os.path.exists(track["audio_path"]):
+            key = render_key(track["audio_path"], avatar_id, data.heygen_config.background, width, height)
+            if render_cache().get(key, video_path):
+                logger.info("Reusing cached Heygen render of the %s track", speaker)
+                job.record_track(speaker, video_path=video_path)
+                return video_path
+
+        length = max(end for _, _, end in track["cuts"])
+        # Held while polling: Heygen counts a render against its concurrency limit until it is done
+        with provider_slot("heygen"):
+            video_url = heygen_render(speaker, track, avatar_id, length)
+
+        download_avatar_video(video_url, video_path)
+        if key:
+            render_cache().put(key, video_path)
+        job.record_track(speaker, video_path=video_path)
+        logger.info("%s track rendered: %s", speaker.capitalize(), video_path)
+        return video_path
+
+    def run(speaker):
+        with profiled_thread():
+            return render_track(speaker)
+
+    track_videos = {}
+    if lines:
+        with ThreadPoolExecutor(max_workers=len(lines)) as executor:
+            future_to_speaker = {executor.submit(contextvars.copy_context().run, run, speaker): speaker for speaker in lines}
+            for future in as_completed(future_to_speaker):
+                speaker = future_to_speaker[future]
+                try:
+                    track_videos[speaker] = future.result()
+                except Exception as exc:
+                    logger.error("Video generation for the %s track generated an exception: %s", speaker, exc)
+                    new_failures.update({idx: exc for idx in lines[speaker]})
+
+    # Step 3d: Cut each line out of its speaker's render (with the portrait crop in the same encode)
+    def cut_segment(args):
+        idx, track_video, start, end = args
+        out_video = job.workspace_path(f"video_{idx}.mp4")
+        with span("cut"):
+            portrait = data.orientation == "portrait"
+            cut_clip(track_video, start, end, out_video, portrait=portrait, preset=_crop_preset(job, idx, portrait))
+        return on_segment(idx, out_video)
+
+    cut_args = []
+    for speaker, track_video in track_videos.items():
+        wanted = set(lines[speaker])
+        cut_args.extend((idx, track_video, start, end) for idx, start, end in job.track(speaker)["cuts"] if idx in wanted)
+    _, cut_failures = _run_segments(cut_segment, sorted(cut_args), os.cpu_count() or 1, "Cut", "cut")
+    new_failures.update(cut_failures)
+    return new_failures
+
+def _raise_for_failures(job, failures):
+    # Segments of a cancelled job fail as a side effect; report the cancellation instead
+    check_cancelled()
+    if not failures:
+        return
+    failed = ", ".join(str(idx + 1) for idx in sorted(failures))
+    first_error = failures[min(failures)]
+    error_msg = f"{len(failures)} segment(s) failed ({failed}): {first_error}. Resume job {job.job_id} to retry only these segments."
+    logger.error(error_msg)
+    raise Exception(error_msg)
+
+def _publishable(job, failures):
+    """
+    Segments to publish: all of them, or, once the job's soft deadline has passed, the ones that
+    did complete (a partial episode beats none). Otherwise failures are raised as usual.
+    Returns (segment indices to publish, indices of missing segments).
+    """
+    check_cancelled()
+    count = len(job.dialogue)
+    if failures and past_soft_deadline() and len(failures) < count:
+        missing = sorted(failures)
+        logger.warning("Job deadline reached: publishing %s of %s segments (missing %s)", count - len(missing), count,
+                       ", ".join(str(idx + 1) for idx in missing))
+        return [idx for idx in range(count) if idx not in failures], missing
+    _raise_for_failures(job, failures)
+    return list(range(count)), []
+
+def _crop_preset(job, idx, portrait):
+    """x264 preset for a segment's portrait crop: "ultrafast" (recorded as degraded) when time is short"""
+    left = time_left()
+    if not portrait or left is None or left > settings.DEADLINE_FAST_CROP_SECONDS:
+        return None
+    job.record(idx, degraded="fast_crop")
+    return "ultrafast"
+
+def _audiogram_assets(data, job):
+    """(images, background, names) of an audiogram render, downloading the images once"""
+    config = data.heygen_config
+    images = {
+        "host": _fetch_image(config.host_image_url, job, "image_host") if config.host_image_url else None,
+        "guest": _fetch_image(config.guest_image_url, job, "image_guest") if config.guest_image_url else None,
+    }
+    background = config.background.strip() if config.background and config.background.strip() else None
+    if background and not background.startswith("#"):
+        background = _fetch_image(background, job, "background")
+    return images, background, {"host": data.host_name, "guest": data.guest_name}
+
+def _render_late_segments(data, job, segments, failures, on_segment):
+    """
+    Deadline fallback: segments whose Heygen render missed the job's soft deadline (or was not
+    started because of it) are rendered locally as audiogram clips of their audio, in the
+    output orientation, instead of being left out. Returns the remaining failures.
+    """
+    late = sorted(idx for idx, exc in failures.items() if isinstance(exc, DeadlineExceeded) and job.has_file(idx, "audio_path"))
+    if not late:
+        return failures
+    logger.warning("Rendering %s segments locally, their Heygen renders would miss the job deadline", len(late))
+    images, background, names = _audiogram_assets(data, job)
     
-    # Step 3: Generate audio files
+    def render_locally(args):
+        idx, = args
+        speaker, text = segments[idx]
+        audio_path = job.segment(idx)["audio_path"]
+        out_video = job.workspace_path(f"video_{idx}.mp4")
+        with span("local_render"):
+            render_audiogram(audio_path, [(speaker, text, 0.0, media_duration(audio_path))], {speaker: images[speaker]},
+                             background, data.orientation, out_video, names)
+        job.record(idx, degraded="local_render")
+        return on_segment(idx, out_video)
+    
+    rendered, local_failures = _run_segments(render_locally, [(idx,) for idx in late], os.cpu_count() or 1, "Local render", "local_render")
+    failures = {idx: exc for idx, exc in failures.items() if idx not in rendered}
+    failures.update(local_failures)
+    return failures
+
+def _record_durations(job, idxs, key):
+    """Probe the file each segment has under key (audio_path or video_path) and record its duration"""
+    durations = []
+    for idx in idxs:
+        duration = round(media_duration(job.segment(idx)[key]), 3)
+        job.record(idx, duration=duration)
+        durations.append(duration)
+    logger.info("Segment durations: %.1fs in total over %s segments", sum(durations), len(idxs))
+    return durations
+
+def _open_stream(data, job):
+    """HLS publisher for the job when the request asked for HLS output, otherwise None"""
+    if data.output_format != "hls":
+        return None
+    stream = HlsPublisher(job)
+    logger.info("Publishing segments to HLS playlist: %s", stream.url)
+    return stream
+
+def _stream_merge_to_s3(merge, paths, job, s3_key, content_type):
+    """
+    Run a streaming merge and upload its output as it is produced, so merge and upload
+    overlap and the final file never touches local disk. Returns the S3 URL.
+    """
+    logger.info("Merging %s segments straight into S3...", len(paths))
+    with span("merge_publish"):
+        stream = merge(paths, job.workspace)
+        try:
+            # Only completed once ffmpeg exits cleanly, so a failed merge never publishes a truncated file
+            s3_url = upload_stream(stream.stdout, s3_key, content_type, before_complete=stream.wait)
+        finally:
+            stream.close()
+    checkpoint("merge")
+    return s3_url
+
+def _audio_mergers():
+    """(merge to file, merge to stream) functions for audio episodes, per AUDIO_ASSEMBLY"""
+    if settings.AUDIO_ASSEMBLY != "pcm":
+        return merge_audio_clips, stream_audio_merge
+    # NumPy is only imported (and needed) for PCM assembly
+    from app.utils.pcm_audio import merge_audio_pcm, stream_audio_merge_pcm
+    mix = {
+        "gap_seconds": settings.AUDIO_GAP_SECONDS,
+        "crossfade_seconds": settings.AUDIO_CROSSFADE_SECONDS,
+        "target_dbfs": settings.AUDIO_TARGET_DBFS if settings.AUDIO_LEVELING else None,
+        "max_gain_db": settings.AUDIO_MAX_GAIN_DB,
+    }
+    return partial(merge_audio_pcm, **mix), partial(stream_audio_merge_pcm, **mix)
+
+def _job_result(data, job, s3_url, duration, missing=()):
+    result = {"s3_url": s3_url, "duration": duration}
+    if data.output_format == "hls":
+        result["stream_url"] = stream_url(job.job_id)
+    durations = [job.segment(idx).get("duration") for idx in range(len(job.dialogue or [])) if idx not in missing]
+    if durations and None not in durations:
+        result["segment_durations"] = durations
+    if missing:
+        result["partial"] = True
+        result["missing_segments"] = list(missing)
+    degraded = {}
+    for idx in range(len(job.dialogue or [])):
+        if job.segment(idx).get("degraded") and idx not in missing:
+            degraded.setdefault(job.segment(idx)["degraded"], []).append(idx)
+    if degraded:
+        result["degraded_segments"] = degraded
+    return result
+
+def _deadline_seconds(data):
+    """The job's time budget: the request's, else JOB_DEADLINE_SECONDS (0 for none)"""
+    return data.deadline_seconds or settings.JOB_DEADLINE_SECONDS
+
+def discard_job(job):
+    """
+    Free what a cancelled job holds: its workspace (the manifest is kept) and its HLS objects.
+    Shared intermediates in S3 (content-addressed audio) may be in use by other jobs and are
+    left to garbage collection.
+    """
+    logger.info("Discarding job %s", job.job_id)
+    job.cleanup()
+    if job.request.get("output_format") == "hls":
+        try:
+            delete_prefix(f"{HLS_PREFIX}/{job.job_id}/")
+        except Exception as e:
+            logger.warning("Could not delete the HLS stream of job %s: %s", job.job_id, e)
+
+def _finish_job(job, timings, status, result=None, error=None):
+    """Record the job outcome in its manifest (with the stage timing breakdown) and in the job metrics"""
+    JOB_SECONDS.observe(timings.elapsed(), kind=job.kind, status=status)
+    JOBS_TOTAL.inc(kind=job.kind, status=status)
+    job.set_status(status, result=result, error=error, timings=timings.breakdown())
+
+def create_audio_podcast(data, job=None):
+    logger.info("=== STARTING AUDIO PODCAST GENERATION ===")
+    logger.info("Input type: %s", data.input_type)
+    logger.info("Language: %s", data.language)
+    logger.info("Target duration: %s minutes", data.duration_minutes)
+    logger.info("Host: %s (Voice ID: %s)", data.host_name, data.host_voice_id)
+    logger.info("Guest: %s (Voice ID: %s)", data.guest_name, data.guest_voice_id)
+    
+    if job is None:
+        job = JobManifest.create("audio", data)
+    logger.info("Job ID: %s", job.job_id)
+    
+    timings = JobTimings()
+    # Registered for cancellation before it is marked running, so a cancel request always reaches it
+    with cancellable(job.job_id), job.running():
+        try:
+            with track_job(timings), bind_job(job.job_id), \
+                    job_deadline(_deadline_seconds(data), settings.DEADLINE_RESERVE_SECONDS):
+                s3_url, duration, missing = _generate_audio_podcast(data, job)
+        except JobCancelled:
+            discard_job(job)
+            _finish_job(job, timings, "cancelled", error="Cancelled")
+            raise
+        except Exception as exc:
+            _finish_job(job, timings, "failed", error=str(exc))
+            raise
+        
+        _finish_job(job, timings, "partial" if missing else "completed", result=_job_result(data, job, s3_url, duration, missing))
+    return s3_url, duration
+
+def _generate_audio_podcast(data, job):
+    # Steps 1-2: Script and dialogue segments
+    segments = _prepare_dialogue(data, job)
+    logger.info("Created %s audio segments", len(segments))
+    
+    # Step 3: Generate audio files (segments already in the manifest are skipped)
     audio_paths = []
+    failures = {}
+    stream = _open_stream(data, job)
+    if settings.TTS_BATCHING:
+        # A few large requests per voice; the loop below then only collects the clips
+        lines = [(idx, speaker, text, data.host_voice_id if speaker == "host" else data.guest_voice_id)
+                 for idx, (speaker, text) in enumerate(segments) if not job.has_file(idx, "audio_path")]
+        failures = _synthesize_batched(data, job, lines)
     logger.info("Generating audio files for each segment...")
     for idx, (speaker, text) in enumerate(segments):
-        logger.info(f"Processing segment {idx + 1}/{len(segments)} - {speaker}: {text[:50]}...")
+        if idx in failures:
+            continue
+        if job.has_file(idx, "audio_path"):
+            logger.info("Segment %s/%s already synthesized", idx + 1, len(segments), extra={"segment": idx})
+            audio_paths.append(job.segment(idx)["audio_path"])
+            if stream:
+                stream.add(idx, job.segment(idx)["audio_path"])
+            continue
+        logger.info("Processing segment %s/%s - %s: %s...", idx + 1, len(segments), speaker, text[:50], extra={"segment": idx})
         voice_id = data.host_voice_id if speaker == "host" else data.guest_voice_id
-        out_path = os.path.join(settings.TMP_DIR, f"audio_{idx}.mp3")
-        logger.info(f"Generating audio for {speaker} using voice ID: {voice_id}")
-        synthesize_voice(text, voice_id, data.elevenlabs_config, out_path)
-        audio_paths.append(out_path)
-        logger.info(f"Audio segment {idx + 1} saved to: {out_path}")
-    
-    # Step 4: Merge audio files
-    logger.info("Merging audio segments...")
-    merged_audio = os.path.join(settings.TMP_DIR, "final_podcast.mp3")
-    merge_audio_clips(audio_paths, merged_audio)
-    logger.info(f"Audio merged successfully: {merged_audio}")
-    
-    # Step 5: Upload to S3
-    logger.info("Uploading final audio to S3...")
-    s3_key = f"podcasts/audio/final_{os.path.basename(merged_audio)}"
-    s3_url = upload_to_s3(merged_audio, s3_key)
-    logger.info(f"Audio uploaded to S3: {s3_url}")
+        out_path = job.workspace_path(f"audio_{idx}.mp3")
+        logger.info("Generating audio for %s using voice ID: %s", speaker, voice_id, extra={"segment": idx})
+        try:
+            with track_segment(idx):
+                check_deadline("Speech synthesis")
+                _synthesize(text, voice_id, data.elevenlabs_config, out_path)
+                job.record(idx, audio_path=out_path)
+                audio_paths.append(out_path)
+                logger.info("Audio segment %s saved to: %s", idx + 1, out_path, extra={"segment": idx})
+                if stream:
+                    stream.add(idx, out_path)
+        except Exception as exc:
+            logger.error("Audio generation for segment %s generated an exception: %s", idx + 1, exc)
+            failures[idx] = exc
+    
+    checkpoint("tts")
+    idxs, missing = _publishable(job, failures)
+    durations = _record_durations(job, idxs, "audio_path")
+    
+    if stream:
+        for idx in missing:
+            stream.skip(idx)
+        playlist_url = stream.finish()
+        if not data.hls_final_file:
+            job.cleanup()
+            logger.info("=== AUDIO PODCAST STREAM COMPLETE ===")
+            return playlist_url, round(stream.duration), missing
+    
+    merge, stream_merge = _audio_mergers()
+    s3_key = f"podcasts/audio/{job.job_id}.mp3"
+    if settings.STREAM_FINAL_UPLOAD:
+        # Steps 4-5: Merge straight into the S3 upload
+        s3_url = _stream_merge_to_s3(stream_merge, audio_paths, job, s3_key, "audio/mpeg")
+        # The episode never touches disk; PCM assembly overlaps (crossfade) or spaces (gap) the clips
+        duration = sum(durations)
+        if settings.AUDIO_ASSEMBLY == "pcm":
+            duration += (len(durations) - 1) * (settings.AUDIO_GAP_SECONDS - settings.AUDIO_CROSSFADE_SECONDS)
+    else:
+        # Step 4: Merge audio files
+        logger.info("Merging audio segments...")
+        merged_audio = job.workspace_path("final_podcast.mp3")
+        with span("merge"):
+            merge(audio_paths, merged_audio)
+        logger.info("Audio merged successfully: %s", merged_audio)
+        duration = media_duration(merged_audio)
+        checkpoint("merge")
+        
+        # Step 5: Upload to S3
+        logger.info("Uploading final audio to S3...")
+        with span("publish"):
+            s3_url = upload_to_s3(merged_audio, s3_key)
+    logger.info("Audio uploaded to S3: %s", s3_url)
     
     # Step 6: Cleanup
     logger.info("Cleaning up temporary files...")
-    for path in audio_paths:
-        try:
-            os.remove(path)
-            logger.info(f"Removed: {path}")
-        except:
-            pass
-    try:
-        os.remove(merged_audio)
-        logger.info(f"Removed: {merged_audio}")
-    except:
-        pass
+    job.cleanup()
     
-    duration = len(segments) * 30  # Dummy duration
-    logger.info(f"=== AUDIO PODCAST GENERATION COMPLETE ===")
-    logger.info(f"Final duration: {duration} seconds")
-    logger.info(f"S3 URL: {s3_url}")
+    logger.info("=== AUDIO PODCAST GENERATION COMPLETE ===")
+    logger.info("Final duration: %.1f seconds", duration)
+    logger.info("S3 URL: %s", s3_url)
     
-    return s3_url, duration
+    return s3_url, round(duration), missing
 
-def create_video_podcast(data):
-    logger.info("=== STARTING VIDEO PODCAST GENERATION ===")
-    logger.info(f"Input type: {data.input_type}")
-    logger.info(f"Language: {data.language}")
-    logger.info(f"Orientation: {data.orientation}")
-    logger.info(f"Target duration: {data.duration_minutes} minutes")
-    logger.info(f"Host: {data.host_name} (Voice ID: {data.host_voice_id}, Avatar ID: {data.heygen_config.host_avatar_id})")
-    logger.info(f"Guest: {data.guest_name} (Voice ID: {data.guest_voice_id}, Avatar ID: {data.heygen_config.guest_avatar_id})")
-    logger.info(f"Background: {data.heygen_config.background}")
+def _fetch_image(url, job, name):
+    """Download an image into the job workspace, keeping its extension (ffmpeg picks the decoder by it)"""
+    extension = os.path.splitext(urlparse(url).path)[1] or ".png"
+    with span("image_download"):
+        return download_image(url, job.workspace_path(f"{name}{extension}"))
+
+def _render_audiogram_video(data, job, segments, stream, idxs):
+    """
+    render_mode "audiogram": join the audio of segments idxs, render the whole video locally
+    (speaker images, waveform and captions over the Heygen background) in one encode and
+    publish it. Returns (s3_url, duration).
+    """
+    logger.info("Joining %s audio segments for the audiogram...", len(idxs))
+    merged_audio = job.workspace_path("final_podcast.mp3")
+    with span("merge"):
+        offsets = join_audio_with_offsets([job.segment(idx)["audio_path"] for idx in idxs], merged_audio)
+    checkpoint("merge")
+    turns = [segments[idx] + (start, end) for idx, (start, end) in zip(idxs, offsets)]
+    duration = offsets[-1][1]
+    for idx, (start, end) in zip(idxs, offsets):
+        job.record(idx, duration=round(end - start, 3))
     
-    # Step 1: Generate or use script
-    if data.input_type == "idea":
-        logger.info("Generating podcast script from idea...")
-        script = generate_podcast_script(data.input_text, data.host_name, data.guest_name, data.language, data.duration_minutes)
-        logger.info(f"Generated script length: {len(script)} characters")
+    images, background, names = _audiogram_assets(data, job)
+    
+    s3_key = f"podcasts/video/{job.job_id}.mp4"
+    if settings.STREAM_FINAL_UPLOAD and not stream:
+        # Steps 4-5: Render straight into the S3 upload (as fragmented MP4)
+        logger.info("Rendering audiogram straight into S3...")
+        with span("render_publish"):
+            video = stream_audiogram(merged_audio, turns, images, background, data.orientation, job.workspace, names)
+            try:
+                s3_url = upload_stream(video.stdout, s3_key, "video/mp4", before_complete=video.wait)
+            finally:
+                video.close()
+        checkpoint("render")
     else:
-        logger.info("Using provided script...")
-        script = data.input_text
-        logger.info(f"Script length: {len(script)} characters")
+        # Step 4: Render the video
+        video_path = job.workspace_path("final_podcast.mp4")
+        with span("render"):
+            render_audiogram(merged_audio, turns, images, background, data.orientation, video_path, names)
+        logger.info("Audiogram rendered: %s", video_path)
+        checkpoint("render")
+        
+        if stream:
+            stream.add(0, video_path)
+            playlist_url = stream.finish()
+            if not data.hls_final_file:
+                job.cleanup()
+                logger.info("=== VIDEO PODCAST STREAM COMPLETE ===")
+                return playlist_url, round(stream.duration)
+        
+        # Step 5: Upload to S3
+        logger.info("Uploading final video to S3...")
+        with span("publish"):
+            s3_url = upload_to_s3(video_path, s3_key)
+    logger.info("Video uploaded to S3: %s", s3_url)
     
-    # Step 2: Process dialogue
-    logger.info("Processing dialogue into segments...")
-    segments = process_dialogue(script, data.host_name, data.guest_name)
-    logger.info(f"Created {len(segments)} video segments")
+    # Step 6: Cleanup
+    job.cleanup()
+    logger.info("=== VIDEO PODCAST GENERATION COMPLETE ===")
+    logger.info("Final duration: %.1f seconds", duration)
+    return s3_url, round(duration)
+
+def create_video_podcast(data, job=None):
+    logger.info("=== STARTING VIDEO PODCAST GENERATION ===")
+    logger.info("Input type: %s", data.input_type)
+    logger.info("Language: %s", data.language)
+    logger.info("Orientation: %s", data.orientation)
+    logger.info("Target duration: %s minutes", data.duration_minutes)
+    logger.info("Host: %s (Voice ID: %s, Avatar ID: %s)", data.host_name, data.host_voice_id, data.heygen_config.host_avatar_id)
+    logger.info("Guest: %s (Voice ID: %s, Avatar ID: %s)", data.guest_name, data.guest_voice_id, data.heygen_config.guest_avatar_id)
+    logger.info("Background: %s", data.heygen_config.background)
+    
+    if job is None:
+        job = JobManifest.create("video", data)
+    logger.info("Job ID: %s", job.job_id)
+    
+    timings = JobTimings()
+    # Registered for cancellation before it is marked running, so a cancel request always reaches it
+    with cancellable(job.job_id), job.running():
+        try:
+            with track_job(timings), bind_job(job.job_id), \
+                    job_deadline(_deadline_seconds(data), settings.DEADLINE_RESERVE_SECONDS):
+                s3_url, duration, missing = _generate_video_podcast(data, job)
+        except JobCancelled:
+            discard_job(job)
+            _finish_job(job, timings, "cancelled", error="Cancelled")
+            raise
+        except Exception as exc:
+            _finish_job(job, timings, "failed", error=str(exc))
+            raise
+        
+        _finish_job(job, timings, "partial" if missing else "completed", result=_job_result(data, job, s3_url, duration, missing))
+    return s3_url, duration
+
+def _generate_video_podcast(data, job):
+    # Steps 1-2: Script and dialogue segments
+    segments = _prepare_dialogue(data, job)
+    logger.info("Created %s video segments", len(segments))
     
     # Step 3: Generate audio and video files with concurrency
-    video_paths = []
     logger.info("Generating audio and video files for each segment with concurrency...")
     
+    # Segments whose final video is already on disk need no further work
+    pending = [idx for idx in range(len(segments)) if not job.has_file(idx, "video_path")]
+    if len(pending) < len(segments):
+        logger.info("Resuming job %s: %s of %s segments already complete", job.job_id, len(segments) - len(pending), len(segments))
+    # Shortcuts taken against an earlier attempt's deadline do not apply to segments rendered again
+    for idx in pending:
+        if job.segment(idx).get("degraded"):
+            job.forget(idx, "degraded")
+    
+    # With HLS output, segments are published as soon as they (and all earlier ones) are done
+    stream = _open_stream(data, job)
+    if stream:
+        for idx in range(len(segments)):
+            if idx not in pending:
+                stream.add(idx, job.segment(idx)["video_path"])
+    
     # Step 3a: Generate all audio files concurrently
     logger.info("Starting concurrent audio generation (all requests at once)...")
     
     def generate_audio_segment(args):
         idx, speaker, text, voice_id = args
-        out_audio = os.path.join(settings.TMP_DIR, f"audio_{idx}.mp3")
+        out_audio = job.workspace_path(f"audio_{idx}.mp3")
         
-        logger.info(f"Generating audio for segment {idx + 1} - {speaker} using voice ID: {voice_id}")
-        synthesize_voice(text, voice_id, data.elevenlabs_config, out_audio)
-        logger.info(f"Audio segment {idx + 1} saved to: {out_audio}")
+        logger.info("Generating audio for segment %s - %s using voice ID: %s", idx + 1, speaker, voice_id)
+        check_deadline("Speech synthesis")
+        _synthesize(text, voice_id, data.elevenlabs_config, out_audio)
+        job.record(idx, audio_path=out_audio)
+        logger.info("Audio segment %s saved to: %s", idx + 1, out_audio)
         return idx, out_audio
     
-    # Prepare arguments for concurrent audio generation
+    # Prepare arguments for concurrent audio generation. Audio is only needed for segments
+    # that still have to be rendered and have neither a local file nor an uploaded copy.
+    # With per-speaker renders, lines of a track recorded by an earlier attempt need no audio either
+    tracked = set()
+    if data.heygen_config.render_mode == "speaker":
+        for speaker, idxs in _speaker_lines(segments, pending).items():
+            if _reusable_track(job, speaker, idxs):
+                tracked.update(idxs)
     audio_args = []
-    for idx, (speaker, text) in enumerate(segments):
+    for idx in pending:
+        speaker, text = segments[idx]
+        artifacts = job.segment(idx)
+        if idx in tracked or job.has_file(idx, "audio_path") or artifacts.get("audio_url") or artifacts.get("video_id"):
+            continue
         voice_id = data.host_voice_id if speaker == "host" else data.guest_voice_id
         audio_args.append((idx, speaker, text, voice_id))
     
     # Execute audio generation with ElevenLabs concurrency limit (max 10 concurrent)
-    audio_files = {}  # {idx: file_path}
     max_concurrent = min(10, len(segments))  # Respect ElevenLabs limit of 10
-    logger.info(f"Using max {max_concurrent} concurrent audio generation requests (ElevenLabs limit)")
+    logger.info("Using max %s concurrent audio generation requests (ElevenLabs limit)", max_concurrent)
+    if settings.TTS_BATCHING:
+        failures = _synthesize_batched(data, job, audio_args)
+    else:
+        _, failures = _run_segments(generate_audio_segment, audio_args, max_concurrent, "Audio generation", "elevenlabs")
+    checkpoint("tts")
     
-    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
-        # Submit all audio generation tasks
-        future_to_idx = {executor.submit(generate_audio_segment, args): args[0] for args in audio_args}
-        
-        # Collect results as they complete
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
+    if data.heygen_config.render_mode == "audiogram":
+        # Steps 3b-6: No Heygen; the whole video is rendered locally from the audio in one encode
+        idxs, missing = _publishable(job, failures)
+        return _render_audiogram_video(data, job, segments, stream, idxs) + (missing,)
+    
+    # Always generate landscape videos (1280x720) for better compatibility
+    width, height = 1280, 720  # Always landscape for Heygen
+    
+    # The landscape render is kept under its own name until portrait output is cropped from it
+    def raw_video_path(idx):
+        name = f"video_{idx}_raw.mp4" if data.orientation == "portrait" else f"video_{idx}.mp4"
+        return job.workspace_path(name)
+    
+    def store_video_segment(idx, raw_video, out_video, rendered=True):
+        if rendered and idx in render_keys:
+            render_cache().put(render_keys[idx], raw_video)
+        if raw_video != out_video:
+            os.remove(raw_video)
+        job.record(idx, video_path=out_video)
+        if stream:
+            stream.add(idx, out_video)
+        return idx, out_video
+    
+    # Lines cut from a speaker's render and local fallback renders are written in place
+    def store_local_segment(idx, out_video):
+        job.record(idx, video_path=out_video)
+        if stream:
+            stream.add(idx, out_video)
+        return idx, out_video
+    
+    if data.heygen_config.render_mode == "speaker":
+        # Steps 3b-3d: One render per speaker, cut into lines locally; nothing is left for the per-line steps
+        failures.update(_render_by_speaker(data, job, segments, pending, failures, width, height, store_local_segment))
+        pending = []
+    
+    # Step 3b: Reuse cached Heygen renders of identical audio, so unchanged segments skip
+    # both the S3 upload and the render
+    render_keys = {}  # {idx: render cache key}
+    for idx in pending:
+        if idx in failures or not job.has_file(idx, "audio_path"):
+            continue
+        speaker, _ = segments[idx]
+        avatar_id = data.heygen_config.host_avatar_id if speaker == "host" else data.heygen_config.guest_avatar_id
+        render_keys[idx] = render_key(job.segment(idx)["audio_path"], avatar_id, data.heygen_config.background, width, height)
+        raw_video = raw_video_path(idx)
+        if render_cache().get(render_keys[idx], raw_video):
+            logger.info("Reusing cached Heygen render for segment %s", idx + 1)
             try:
-                segment_idx, audio_path = future.result()
-                audio_files[segment_idx] = audio_path
-                logger.info(f"Completed audio generation for segment {idx + 1}")
+                out_video = job.workspace_path(f"video_{idx}.mp4")
+                finish_segment_video(idx, None, raw_video, out_video, data.orientation,
+                                     _crop_preset(job, idx, data.orientation == "portrait"))
+                store_video_segment(idx, raw_video, out_video, rendered=False)
             except Exception as exc:
-                logger.error(f"Audio generation for segment {idx + 1} generated an exception: {exc}")
-                raise
+                logger.error("Video generation for segment %s generated an exception: %s", idx + 1, exc)
+                failures[idx] = exc
+    pending = [idx for idx in pending if not job.has_file(idx, "video_path")]
     
-    # Step 3b: Upload all audio files to S3 concurrently
+    # Step 3c: Upload all audio files to S3 concurrently
     logger.info("Starting concurrent S3 uploads for audio files (all requests at once)...")
     
     def upload_audio_to_s3(args):
         idx, audio_path = args
-        s3_audio_key = f"podcasts/video/audio_{idx}.mp3"
         
-        logger.info(f"Uploading audio segment {idx + 1} to S3...")
-        s3_audio_url = upload_to_s3(audio_path, s3_audio_key)
-        logger.info(f"Audio segment {idx + 1} uploaded to S3: {s3_audio_url}")
+        # Keyed by content hash, so identical audio is only uploaded once
+        logger.info("Uploading audio segment %s to S3...", idx + 1)
+        check_deadline("Audio upload")
+        with span("audio_upload"):
+            s3_audio_url = upload_content_addressed(audio_path, extension=".mp3")
+        job.record(idx, audio_url=s3_audio_url)
+        logger.info("Audio segment %s uploaded to S3: %s", idx + 1, s3_audio_url)
         return idx, s3_audio_url
     
     # Prepare arguments for concurrent S3 uploads
-    upload_args = [(idx, audio_path) for idx, audio_path in audio_files.items()]
+    upload_args = []
+    for idx in pending:
+        artifacts = job.segment(idx)
+        if idx in failures or artifacts.get("audio_url") or artifacts.get("video_id"):
+            continue
+        upload_args.append((idx, artifacts["audio_path"]))
     
     # Execute S3 uploads with reasonable concurrency limit (max 5 concurrent)
-    audio_urls = {}  # {idx: s3_url}
     max_s3_concurrent = min(5, len(segments))  # Reasonable S3 concurrency limit
-    logger.info(f"Using max {max_s3_concurrent} concurrent S3 upload requests")
-    
-    with ThreadPoolExecutor(max_workers=max_s3_concurrent) as executor:
-        # Submit all S3 upload tasks
-        future_to_idx = {executor.submit(upload_audio_to_s3, args): args[0] for args in upload_args}
-        
-        # Collect results as they complete
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
-            try:
-                segment_idx, s3_url = future.result()
-                audio_urls[segment_idx] = s3_url
-                logger.info(f"Completed S3 upload for segment {idx + 1}")
-            except Exception as exc:
-                logger.error(f"S3 upload for segment {idx + 1} generated an exception: {exc}")
-                raise
+    logger.info("Using max %s concurrent S3 upload requests", max_s3_concurrent)
+    _, upload_failures = _run_segments(upload_audio_to_s3, upload_args, max_s3_concurrent, "S3 upload", "s3_upload")
+    failures.update(upload_failures)
+    checkpoint("audio_upload")
     
-    # Step 3c: Generate videos concurrently using ThreadPoolExecutor
+    # Step 3d: Generate videos concurrently using ThreadPoolExecutor
     logger.info("Starting concurrent Heygen video generation (all requests at once)...")
     
     def generate_video_segment(args):
         idx, speaker, audio_url, avatar_id = args
-        out_video = os.path.join(settings.TMP_DIR, f"video_{idx}.mp4")
-        
-        # Always generate landscape videos (1280x720) for better compatibility
-        width, height = 1280, 720  # Always landscape for Heygen
-        
-        logger.info(f"Generating video for segment {idx + 1} - {speaker} using avatar ID: {avatar_id}")
-        logger.info(f"Video dimensions: {width}x{height} (landscape - will crop to {data.orientation} if needed)")
-        generate_avatar_video(audio_url, avatar_id, data.heygen_config.background, out_video, width=width, height=height)
-        logger.info(f"Video segment {idx + 1} saved to: {out_video}")
+        raw_video = raw_video_path(idx)
+        out_video = job.workspace_path(f"video_{idx}.mp4")
         
-        # Crop to portrait if needed
-        if data.orientation == "portrait":
-            logger.info(f"Cropping video segment {idx + 1} to portrait orientation...")
-            cropped_video = os.path.join(settings.TMP_DIR, f"video_{idx}_cropped.mp4")
-            from app.utils.ffmpeg_merge import crop_video_to_portrait
-            crop_video_to_portrait(out_video, cropped_video)
-            # Replace original with cropped version
-            os.remove(out_video)
-            os.rename(cropped_video, out_video)
-            logger.info(f"Video segment {idx + 1} cropped to portrait: {out_video}")
+        # Polling is paced by the length of the audio (when it is still on disk)
+        audio_seconds = media_duration(job.segment(idx)["audio_path"]) if job.has_file(idx, "audio_path") else None
+        # A Heygen slot is held from submission (or polling an earlier attempt's render) to completion:
+        # Heygen counts a render against its concurrency limit until it is done, polled or not
+        with provider_slot("heygen"):
+            # A render submitted by an earlier attempt is polled instead of paid for again
+            video_id = job.segment(idx).get("video_id")
+            video_url = None
+            if video_id:
+                logger.info("Segment %s already submitted to Heygen (video ID: %s), polling existing render", idx + 1, video_id)
+                try:
+                    video_url = poll_avatar_video(video_id, audio_seconds=audio_seconds)
+                except Exception as exc:
+                    logger.warning("Previous Heygen render %s for segment %s is unusable (%s), resubmitting", video_id, idx + 1, exc)
+                    job.forget(idx, "video_id")
+            
+            if video_url is None:
+                logger.info("Generating video for segment %s - %s using avatar ID: %s", idx + 1, speaker, avatar_id)
+                logger.info("Video dimensions: %sx%s (landscape - will crop to %s if needed)", width, height, data.orientation)
+                check_deadline("Heygen render")
+                video_id = submit_avatar_video(audio_url, avatar_id, data.heygen_config.background, width=width, height=height)
+                job.record(idx, video_id=video_id)
+                video_url = poll_avatar_video(video_id, audio_seconds=audio_seconds)
         
-        return idx, out_video
+        # Download and crop are the CPU-heavy part, run wherever the segment backend puts them
+        segment_backend().run(finish_segment_video, idx, video_url, raw_video, out_video, data.orientation,
+                              _crop_preset(job, idx, data.orientation == "portrait"))
+        logger.info("Video segment %s saved to: %s", idx + 1, out_video)
+        return store_video_segment(idx, raw_video, out_video)
     
     # Prepare arguments for concurrent video generation
     video_args = []
-    for idx, (speaker, text) in enumerate(segments):
+    for idx in pending:
+        if idx in failures:
+            continue
+        speaker, text = segments[idx]
         avatar_id = data.heygen_config.host_avatar_id if speaker == "host" else data.heygen_config.guest_avatar_id
-        video_args.append((idx, speaker, audio_urls[idx], avatar_id))
+        video_args.append((idx, speaker, job.segment(idx).get("audio_url"), avatar_id))
     
     # Execute video generation with unlimited concurrent workers (all at once for Heygen)
-    video_files = {}  # {idx: file_path}
-    logger.info(f"Using unlimited concurrent Heygen video generation requests (all {len(segments)} at once)")
+    logger.info("Using unlimited concurrent Heygen video generation requests (all %s at once)", len(video_args))
+    _, video_failures = _run_segments(generate_video_segment, video_args, max(1, len(video_args)), "Video generation", "heygen")
+    failures.update(video_failures)
+    checkpoint("heygen")
     
-    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
-        # Submit all video generation tasks at once
-        future_to_idx = {executor.submit(generate_video_segment, args): args[0] for args in video_args}
-        
-        # Collect results as they complete
-        for future in as_completed(future_to_idx):
-            idx = future_to_idx[future]
-            try:
-                segment_idx, video_path = future.result()
-                video_files[segment_idx] = video_path
-                logger.info(f"Completed video generation for segment {idx + 1}")
-            except Exception as exc:
-                logger.error(f"Video generation for segment {idx + 1} generated an exception: {exc}")
-                raise
+    cache_stats = render_cache().stats()
+    logger.info("Heygen render cache: %s hits, %s misses (hit ratio %.0f%%)", cache_stats['hits'], cache_stats['misses'], cache_stats['hit_ratio'] * 100)
+    
+    # Segments that ran out of time in Heygen are rendered locally rather than left out
+    failures = _render_late_segments(data, job, segments, failures, store_local_segment)
+    
+    # Every segment that could complete is now recorded; fail before merging if any are missing
+    # (unless the deadline has passed, when the completed ones are published)
+    idxs, missing = _publishable(job, failures)
+    durations = _record_durations(job, idxs, "video_path")
+    
+    if stream:
+        for idx in missing:
+            stream.skip(idx)
+        playlist_url = stream.finish()
+        if not data.hls_final_file:
+            job.cleanup()
+            logger.info("=== VIDEO PODCAST STREAM COMPLETE ===")
+            return playlist_url, round(stream.duration), missing
     
     # Step 4: Merge video files in correct sequence
     logger.info("Preparing video files for merging in correct sequence...")
     # Create ordered list of video paths based on segment indices
     ordered_video_paths = []
-    for idx in range(len(segments)):
-        if idx in video_files:
-            ordered_video_paths.append(video_files[idx])
-            logger.info(f"Added video segment {idx + 1} to merge sequence: {video_files[idx]}")
+    for idx in idxs:
+        if job.has_file(idx, "video_path"):
+            ordered_video_paths.append(job.segment(idx)["video_path"])
+            logger.debug("Added video segment %s to merge sequence: %s", idx + 1, job.segment(idx)['video_path'])
         else:
-            logger.error(f"Missing video segment {idx + 1} for merging!")
+            logger.error("Missing video segment %s for merging!", idx + 1)
             raise Exception(f"Missing video segment {idx + 1}")
     
-    logger.info(f"Merging {len(ordered_video_paths)} video segments in sequence...")
-    merged_video = os.path.join(settings.TMP_DIR, "final_podcast.mp4")
-    merge_video_clips(ordered_video_paths, merged_video)
-    logger.info(f"Video merged successfully: {merged_video}")
+    # Local renders are not encoded like Heygen's, so a mix of both cannot be joined by stream copy
+    size = None
+    if any(job.segment(idx).get("degraded") == "local_render" for idx in idxs):
+        layout = LAYOUTS[data.orientation]
+        size = (layout["width"], layout["height"])
+        logger.info("Re-encoding the merge: it mixes Heygen and local renders")
     
-    # Step 5: Upload to S3
-    logger.info("Uploading final video to S3...")
-    s3_key = f"podcasts/video/final_{os.path.basename(merged_video)}"
-    s3_url = upload_to_s3(merged_video, s3_key)
-    logger.info(f"Video uploaded to S3: {s3_url}")
+    s3_key = f"podcasts/video/{job.job_id}.mp4"
+    if settings.STREAM_FINAL_UPLOAD:
+        # Steps 4-5: Merge straight into the S3 upload (as fragmented MP4)
+        s3_url = _stream_merge_to_s3(partial(stream_video_merge, size=size), ordered_video_paths, job, s3_key, "video/mp4")
+        duration = sum(durations)
+    else:
+        logger.info("Merging %s video segments in sequence...", len(ordered_video_paths))
+        merged_video = job.workspace_path("final_podcast.mp4")
+        with span("merge"):
+            merge_video_clips(ordered_video_paths, merged_video, size=size)
+        logger.info("Video merged successfully: %s", merged_video)
+        duration = media_duration(merged_video)
+        checkpoint("merge")
+        
+        # Step 5: Upload to S3
+        logger.info("Uploading final video to S3...")
+        with span("publish"):
+            s3_url = upload_to_s3(merged_video, s3_key)
+    logger.info("Video uploaded to S3: %s", s3_url)
     
     # Step 6: Cleanup
     logger.info("Cleaning up temporary files...")
-    for idx in range(len(segments)):
-        try:
-            os.remove(os.path.join(settings.TMP_DIR, f"audio_{idx}.mp3"))
-            logger.info(f"Removed: audio_{idx}.mp3")
-        except:
-            pass
-        try:
-            os.remove(os.path.join(settings.TMP_DIR, f"video_{idx}.mp4"))
-            logger.info(f"Removed: video_{idx}.mp4")
-        except:
-            pass
-    try:
-        os.remove(merged_video)
-        logger.info(f"Removed: {merged_video}")
-    except:
-        pass
+    job.cleanup()
+    # Intermediates are shared between jobs, so expired ones are swept by age instead
+    collect_garbage_in_background()
+    
+    logger.info("=== VIDEO PODCAST GENERATION COMPLETE ===")
+    logger.info("Final duration: %.1f seconds", duration)
+    logger.info("S3 URL: %s", s3_url)
+    
+    return s3_url, round(duration), missing
+
+def resume_podcast(job_id):
+    """
+    Resume a failed or interrupted job from its manifest.
+    Only segments without recorded artifacts are re-generated; a completed job returns its stored result.
+    """
+    job = JobManifest.load(job_id)
+    logger.info("=== RESUMING %s PODCAST JOB %s (status: %s) ===", job.kind.upper(), job.job_id, job.status)
     
-    duration = len(video_paths) * 30  # Dummy duration
-    logger.info(f"=== VIDEO PODCAST GENERATION COMPLETE ===")
-    logger.info(f"Final duration: {duration} seconds")
-    logger.info(f"S3 URL: {s3_url}")
+    if job.status == "completed":
+        logger.info("Job %s already completed, returning stored result", job.job_id)
+        return job.result["s3_url"], job.result["duration"]
     
-    return s3_url, duration 
\ No newline at end of file
+    if job.kind == "audio":
+        return create_audio_podcast(AudioPodcastRequest(**job.request), job=job)
+    return create_video_podcast(VideoPodcastRequest(**job.request), job=job)
@@ -0,0 +1,98 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from app.config import settings
+from app.utils.s3 import object_exists, put_json, get_json, delete_object, key_from_url
+
+logger = logging.getLogger(__name__)
+
+INDEX_PREFIX = "podcasts/results"
+MEMORY_ENTRIES = 1024
+
+class ResultCache:
+    """
+    Index from request fingerprint to a published podcast (S3 URL and duration).
+    Entries are stored as small JSON objects in S3 so every container shares them, with an
+    in-memory LRU in front. An entry is only reused if it is younger than the TTL and the
+    published object still exists (checked with a HEAD request).
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_key(self, fingerprint):
+        return f"{INDEX_PREFIX}/{fingerprint}.json"
+
+    def _remember(self, fingerprint, entry):
+        with self._lock:
+            self._memory[fingerprint] = entry
+            self._memory.move_to_end(fingerprint)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def invalidate(self, fingerprint):
+        with self._lock:
+            self._memory.pop(fingerprint, None)
+        try:
+            delete_object(self._index_key(fingerprint))
+        except Exception as e:
+            logger.warning("Could not delete result index entry %s: %s", fingerprint, e)
+
+    def lookup(self, fingerprint):
+        """Return the cached entry {"s3_url", "s3_key", "duration", "job_id", "created_at"} or None"""
+        with self._lock:
+            entry = self._memory.get(fingerprint)
+        if entry is None:
+            try:
+                entry = get_json(self._index_key(fingerprint))
+            except Exception as e:
+                logger.warning("Result index lookup failed for %s: %s", fingerprint, e)
+                return None
+            if entry is None:
+                return None
+
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            logger.info("Result cache entry %s expired", fingerprint)
+            self.invalidate(fingerprint)
+            return None
+
+        # The published file may have been deleted or expired by a bucket lifecycle rule
+        try:
+            exists = object_exists(entry["s3_key"]) is not None
+        except Exception as e:
+            logger.warning("Could not verify cached result %s: %s", entry['s3_key'], e)
+            return None
+        if not exists:
+            logger.info("Cached result %s no longer exists in S3", entry['s3_key'])
+            self.invalidate(fingerprint)
+            return None
+
+        self._remember(fingerprint, entry)
+        logger.info("Result cache hit for %s: %s", fingerprint, entry['s3_url'])
+        return entry
+
+    def store(self, fingerprint, s3_url, duration, job_id):
+        s3_key = key_from_url(s3_url)
+        if s3_key is None:
+            return
+        entry = {
+            "s3_url": s3_url,
+            "s3_key": s3_key,
+            "duration": duration,
+            "job_id": job_id,
+            "created_at": time.time(),
+        }
+        self._remember(fingerprint, entry)
+        try:
+            put_json(self._index_key(fingerprint), entry)
+        except Exception as e:
+            logger.warning("Could not write result index entry %s: %s", fingerprint, e)
+
+def is_cacheable(data):
+    """Only scripted requests are deterministic; "idea" requests get a fresh script from OpenAI"""
+    return settings.RESULT_CACHE_ENABLED and data.input_type == "script"
+
+result_cache = ResultCache(settings.RESULT_CACHE_TTL_SECONDS)
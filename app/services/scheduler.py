@@ -0,0 +1,158 @@
+"""
+Fair sharing of provider capacity between the jobs of a process. Each provider listed in
+SCHEDULER_SLOTS has that many slots for the whole process; every segment task that calls it
+(a TTS request, a Heygen render, ...) holds one while it runs, on top of the job's own worker
+pool. When slots are short, waiting tasks are served by start-time fair queuing over flows,
+one flow per job. A flow's weight is its lane's (priority and kind, SCHEDULER_LANE_WEIGHTS)
+times its tenant's (SCHEDULER_TENANT_WEIGHTS), split between the tenant's jobs in that lane,
+so a short job's segments are interleaved with a long job's instead of queuing behind them.
+"""
+import time
+import heapq
+import logging
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from app.config import settings
+from app.utils.cancellation import check_cancelled, on_cancel
+from app.utils.metrics import REGISTRY, Callback, observe_wait
+
+logger = logging.getLogger(__name__)
+
+def _parse_weights(spec):
+    """"elevenlabs=10,heygen=20" -> {name: number}"""
+    weights = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            weights[name.strip()] = float(value)
+    return weights
+
+SLOTS = {name: int(slots) for name, slots in _parse_weights(settings.SCHEDULER_SLOTS).items() if slots > 0}
+LANE_WEIGHTS = _parse_weights(settings.SCHEDULER_LANE_WEIGHTS)
+TENANT_WEIGHTS = _parse_weights(settings.SCHEDULER_TENANT_WEIGHTS)
+
+class Share:
+    """The flow of one job: who it runs for, in which lane, and its finish tag at each provider"""
+
+    def __init__(self, job_id, kind, priority="interactive", tenant="default"):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.lane = f"{priority}-{kind}"
+        self.finish = {}  # {provider: virtual finish time of the flow's last queued task}
+
+# Jobs with a bound share, per (lane, tenant), which split that tenant's weight in the lane
+_active = {}
+_active_lock = threading.Lock()
+
+_current_share = contextvars.ContextVar("lisa_share", default=None)
+_default_share = Share(None, "audio", tenant="default")
+
+def _weight(share):
+    with _active_lock:
+        jobs = len(_active.get((share.lane, share.tenant), ())) or 1
+    return LANE_WEIGHTS.get(share.lane, 1.0) * TENANT_WEIGHTS.get(share.tenant, 1.0) / jobs
+
+@contextmanager
+def fair_share(job_id, kind, priority="interactive", tenant="default"):
+    """Schedule the provider calls of the enclosed block (and copies of its context) as job_id's flow"""
+    share = Share(job_id, kind, priority, tenant)
+    key = (share.lane, share.tenant)
+    with _active_lock:
+        _active.setdefault(key, set()).add(job_id)
+    token = _current_share.set(share)
+    try:
+        yield share
+    finally:
+        _current_share.reset(token)
+        with _active_lock:
+            _active[key].discard(job_id)
+            if not _active[key]:
+                del _active[key]
+
+class FairScheduler:
+    """The slots of one provider, handed out by start-time fair queuing when they are short"""
+
+    def __init__(self, name, slots):
+        self.name = name
+        self.slots = slots
+        self._condition = threading.Condition()
+        self._busy = 0
+        self._waiting = []  # heap of [start tag, sequence, lane, granted]
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _dispatch(self):
+        while self._busy < self.slots and self._waiting:
+            waiter = heapq.heappop(self._waiting)
+            self._virtual_time = waiter[0]
+            waiter[3] = True
+            self._busy += 1
+        self._condition.notify_all()
+
+    def acquire(self, share):
+        """Take a slot for a task of share's flow, waiting for its turn; cancelling the job stops the wait"""
+        with self._condition:
+            if self._busy < self.slots and not self._waiting:
+                self._busy += 1
+                return
+            start = max(self._virtual_time, share.finish.get(self.name, 0.0))
+            share.finish[self.name] = start + 1 / _weight(share)
+            waiter = [start, next(self._sequence), share.lane, False]
+            heapq.heappush(self._waiting, waiter)
+        queued_at = time.perf_counter()
+        try:
+            with on_cancel(self._wake), self._condition:
+                while not waiter[3]:
+                    check_cancelled()
+                    self._condition.wait()
+        except BaseException:
+            with self._condition:
+                if waiter[3]:
+                    self._busy -= 1
+                else:
+                    self._waiting.remove(waiter)
+                    heapq.heapify(self._waiting)
+                self._dispatch()
+            raise
+        observe_wait(f"{self.name}_slot", time.perf_counter() - queued_at)
+
+    def release(self):
+        with self._condition:
+            self._busy -= 1
+            self._dispatch()
+
+    def stats(self):
+        """{"busy", "waiting": {lane: count}}"""
+        with self._condition:
+            waiting = {}
+            for waiter in self._waiting:
+                waiting[waiter[2]] = waiting.get(waiter[2], 0) + 1
+            return {"busy": self._busy, "waiting": waiting}
+
+_schedulers = {name: FairScheduler(name, slots) for name, slots in SLOTS.items()}
+
+@contextmanager
+def provider_slot(provider):
+    """Hold one of provider's slots (if it has a slot limit) for the enclosed call"""
+    scheduler = _schedulers.get(provider)
+    if scheduler is None:
+        yield
+        return
+    scheduler.acquire(_current_share.get() or _default_share)
+    try:
+        yield
+    finally:
+        scheduler.release()
+
+def _queued():
+    return {(name, lane): count for name, scheduler in _schedulers.items() for lane, count in scheduler.stats()["waiting"].items()}
+
+REGISTRY.register(Callback("lisa_scheduler_busy_slots", "Provider slots in use", ("provider",),
+                           lambda: {(name,): scheduler.stats()["busy"] for name, scheduler in _schedulers.items()}))
+REGISTRY.register(Callback("lisa_scheduler_queued_tasks", "Segment tasks waiting for a provider slot", ("provider", "lane"), _queued))
@@ -0,0 +1,110 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+def _normalize_text(text):
+    """Collapse whitespace and drop blank lines; the dialogue parser ignores both"""
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+def request_fingerprint(kind, data):
+    """
+    Stable hash of a podcast request, so that requests differing only in whitespace
+    or field order map to the same key.
+    - kind: "audio" or "video"
+    - data: AudioPodcastRequest or VideoPodcastRequest
+    """
+    payload = _normalize(data.model_dump())
+    # Only decides how the job is scheduled, not what it produces
+    payload.pop("priority", None)
+    payload["input_text"] = _normalize_text(payload["input_text"])
+    canonical = json.dumps({"kind": kind, "request": payload}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with a different request payload"""
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+    The first caller runs the function; callers arriving while it is in flight wait for
+    and receive the same result (or exception).
+    Successful results can optionally be retained for a while (used for idempotency keys),
+    so a client retrying after a timeout still gets the original result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # {key: (future, fingerprint, expires_at or None while in flight)}
+
+    def _expire(self, now):
+        expired = [key for key, (_, _, expires_at) in self._calls.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._calls[key]
+
+    def do(self, key, func, fingerprint=None, retain_seconds=0, on_wait=None, wait_interval=0.5):
+        """
+        Run func() once per key and return (result, shared), where shared is True when
+        this caller attached to an existing call instead of running func itself.
+        - fingerprint: Optional request fingerprint; reusing a key with a different one raises IdempotencyConflict
+        - retain_seconds: How long to keep a successful result for later callers with the same key
+        - on_wait: Called every wait_interval seconds while this caller waits for another's call;
+          whatever it raises ends the wait (e.g. cancellation of the waiting job)
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._calls.get(key)
+            if entry is not None:
+                future, existing_fingerprint, _ = entry
+                if fingerprint and existing_fingerprint and fingerprint != existing_fingerprint:
+                    raise IdempotencyConflict(f"Key {key} was already used for a different request")
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = (future, fingerprint, None)
+                leader = True
+
+        if not leader:
+            logger.info("Attaching to in-flight request %s", key)
+            while True:
+                try:
+                    return future.result(timeout=wait_interval if on_wait else None), True
+                except FutureTimeout:
+                    on_wait()
+
+        try:
+            result = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            with self._lock:
+                self._calls.pop(key, None)
+            raise
+
+        future.set_result(result)
+        with self._lock:
+            if retain_seconds > 0:
+                self._calls[key] = (future, fingerprint, time.monotonic() + retain_seconds)
+            else:
+                self._calls.pop(key, None)
+        return result, False
+
+    def in_flight(self):
+        """Number of calls currently executing"""
+        with self._lock:
+            return sum(1 for _, _, expires_at in self._calls.values() if expires_at is None)
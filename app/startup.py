@@ -1,19 +1,19 @@
-import subprocess
-import sys
+import time
+import shutil
 import logging
+import threading
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
 def check_ffmpeg():
-    """Check if FFmpeg is installed and accessible"""
-    try:
-        result = subprocess.run(["ffmpeg", "-version"], 
-                              capture_output=True, text=True, check=True)
+    """Check if FFmpeg is on the PATH (a lookup, not a subprocess, so it is cheap on cold start)"""
+    if shutil.which("ffmpeg"):
         logger.info("FFmpeg is available")
         return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        logger.error("FFmpeg is not installed or not in PATH")
-        return False
+    logger.error("FFmpeg is not installed or not in PATH")
+    return False
 
 def check_dependencies():
     """Check all required dependencies"""
@@ -27,9 +27,32 @@ def check_dependencies():
             failed_checks.append(name)
     
     if failed_checks:
-        logger.error(f"Missing dependencies: {failed_checks}")
+        logger.error("Missing dependencies: %s", failed_checks)
         logger.error("Please install the missing dependencies and try again")
         return False
     
     logger.info("All dependencies are available")
-    return True 
\ No newline at end of file
+    return True
+
+def warm_up():
+    """
+    Build the provider clients and media caches ahead of the first request (they are otherwise
+    created on first use)
+    """
+    from app.utils.s3 import s3_client
+    from app.utils.openai_gpt import openai_client
+    from app.utils.file_cache import render_cache, tts_cache
+    start = time.perf_counter()
+    # In pipeline order: script generation needs OpenAI first, S3 is only used after TTS
+    for name, create in (("OpenAI client", openai_client), ("TTS cache", tts_cache), ("S3 client", s3_client),
+                         ("render cache", render_cache)):
+        try:
+            create()
+        except Exception as e:
+            logger.warning("Could not warm up the %s: %s", name, e)
+    check_ffmpeg()
+    logger.info("Provider clients and caches ready in %.2fs", time.perf_counter() - start)
+
+def warm_up_in_background():
+    """Run warm_up on a daemon thread so the server starts listening without waiting for it"""
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
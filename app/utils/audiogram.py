@@ -0,0 +1,164 @@
+"""
+Audiogram videos: a backdrop, the image of whoever is speaking, a live waveform and captions,
+rendered from the episode audio with a single ffmpeg filter graph (no Heygen render).
+"""
+import os
+import re
+import logging
+import subprocess
+from app.utils.cancellation import run_process
+from app.utils.ffmpeg_merge import MergeStream
+from app.utils.retry import send, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+FPS = 25
+
+# Frame size, speaker image size and position, waveform band and caption placement per orientation
+LAYOUTS = {
+    "landscape": {"width": 1280, "height": 720, "image": 360, "image_y": 80, "wave_height": 120,
+                  "wave_y": 460, "font_size": 34, "caption_margin": 40},
+    "portrait": {"width": 720, "height": 1280, "image": 480, "image_y": 200, "wave_height": 160,
+                 "wave_y": 740, "font_size": 40, "caption_margin": 180},
+}
+
+# Tiles shown for speakers without an image
+PLACEHOLDER_COLORS = {"host": "0x3b6ea5", "guest": "0xa5573b"}
+DEFAULT_BACKGROUND = "0x101418"
+
+# Longest caption shown at once; longer turns are split at word boundaries
+CAPTION_MAX_CHARS = 90
+
+def download_image(url, output_path):
+    """Download a speaker or background image"""
+    def download():
+        response = send("GET", url, "images", stream=True)
+        with open(output_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+    call_with_retry(download, "images")
+    return output_path
+
+def _ass_time(seconds):
+    centiseconds = int(round(seconds * 100))
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    return f"{hours}:{minutes:02d}:{rest // 100:02d}.{rest % 100:02d}"
+
+def _caption_chunks(text):
+    """Split a turn into captions of at most CAPTION_MAX_CHARS characters"""
+    chunks = []
+    for word in text.split():
+        if chunks and len(chunks[-1]) + 1 + len(word) <= CAPTION_MAX_CHARS:
+            chunks[-1] += " " + word
+        else:
+            chunks.append(word)
+    return chunks
+
+def write_captions(turns, names, layout, output_path):
+    """
+    Write an ASS subtitle file with a caption per chunk of every turn; a turn's time is shared
+    between its chunks in proportion to their length.
+    - turns: [(speaker, text, start, end)]
+    - names: {speaker: display name}
+    """
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {layout['width']}",
+        f"PlayResY: {layout['height']}",
+        "WrapStyle: 0",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, Alignment, "
+        "BorderStyle, Outline, Shadow, MarginL, MarginR, MarginV",
+        f"Style: Default,Arial,{layout['font_size']},&H00FFFFFF,&H00000000,&H80000000,0,2,1,2,0,40,40,{layout['caption_margin']}",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Text",
+    ]
+    for speaker, text, start, end in turns:
+        # Braces start ASS override blocks and backslashes escapes
+        chunks = _caption_chunks(re.sub(r"[{}\\]", "", text))
+        total = sum(len(chunk) for chunk in chunks) or 1
+        position = start
+        for i, chunk in enumerate(chunks):
+            chunk_end = end if i == len(chunks) - 1 else position + (end - start) * len(chunk) / total
+            label = f"{{\\b1}}{names.get(speaker, speaker)}:{{\\b0}} " if i == 0 else ""
+            lines.append(f"Dialogue: 0,{_ass_time(position)},{_ass_time(chunk_end)},Default,{label}{chunk}")
+            position = chunk_end
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return output_path
+
+def _filter_path(path):
+    """Escape a path for use as a filter option value"""
+    return path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+def _enable(spans):
+    return "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in spans) or "0"
+
+def audiogram_command(audio_path, turns, images, background, layout, captions_path, duration):
+    """
+    ffmpeg command (without output options) for an audiogram of audio_path.
+    - turns: [(speaker, text, start, end)] in seconds within the audio
+    - images: {speaker: image path or None for a placeholder tile}
+    - background: "#RRGGBB" colour, an image path, or None
+    """
+    width, height, size = layout["width"], layout["height"], layout["image"]
+    cmd = ["ffmpeg", "-y", "-i", audio_path]
+    if background and not background.startswith("#"):
+        cmd += ["-loop", "1", "-framerate", str(FPS), "-i", background]
+    else:
+        cmd += ["-f", "lavfi", "-i", f"color=c={background or DEFAULT_BACKGROUND}:s={width}x{height}:r={FPS}"]
+    speakers = sorted(images)
+    for speaker in speakers:
+        if images[speaker]:
+            cmd += ["-loop", "1", "-framerate", str(FPS), "-i", images[speaker]]
+        else:
+            cmd += ["-f", "lavfi", "-i", f"color=c={PLACEHOLDER_COLORS.get(speaker, '0x555555')}:s={size}x{size}:r={FPS}"]
+
+    graph = [
+        f"[1:v]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1,fps={FPS}[bg]",
+        f"[0:a]showwaves=s={width}x{layout['wave_height']}:mode=cline:scale=sqrt:rate={FPS}:colors=white[wave]",
+    ]
+    current = "bg"
+    for i, speaker in enumerate(speakers):
+        spans = [(start, end) for turn_speaker, _, start, end in turns if turn_speaker == speaker]
+        graph.append(f"[{i + 2}:v]scale={size}:{size}:force_original_aspect_ratio=increase,crop={size}:{size},setsar=1[img{i}]")
+        # Only the image of whoever is speaking is shown
+        graph.append(f"[{current}][img{i}]overlay=x={(width - size) // 2}:y={layout['image_y']}:enable='{_enable(spans)}'[v{i}]")
+        current = f"v{i}"
+    graph.append(f"[{current}][wave]overlay=x=0:y={layout['wave_y']}[waved]")
+    graph.append(f"[waved]ass=filename='{_filter_path(captions_path)}',format=yuv420p[v]")
+
+    cmd += ["-filter_complex", ";".join(graph), "-map", "[v]", "-map", "0:a", "-t", f"{duration:.3f}",
+            "-c:v", "libx264", "-preset", "veryfast", "-r", str(FPS), "-c:a", "aac", "-b:a", "128k"]
+    return cmd
+
+def render_audiogram(audio_path, turns, images, background, orientation, output_path, names=None):
+    """Render an audiogram MP4 of audio_path to output_path; see audiogram_command"""
+    layout = LAYOUTS[orientation]
+    captions_path = write_captions(turns, names or {}, layout, os.path.splitext(output_path)[0] + ".ass")
+    duration = max(end for _, _, _, end in turns)
+    cmd = audiogram_command(audio_path, turns, images, background, layout, captions_path, duration) + [output_path]
+    logger.info("Rendering %.1fs %s audiogram", duration, orientation)
+    logger.debug("Running: %s", ' '.join(cmd))
+    try:
+        run_process(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("Audiogram render failed: %s", e.stderr)
+        raise
+    finally:
+        os.remove(captions_path)
+    return output_path
+
+def stream_audiogram(audio_path, turns, images, background, orientation, work_dir, names=None):
+    """render_audiogram writing fragmented MP4 to a pipe (see MergeStream)"""
+    layout = LAYOUTS[orientation]
+    captions_path = write_captions(turns, names or {}, layout, os.path.join(work_dir, "captions.ass"))
+    duration = max(end for _, _, _, end in turns)
+    cmd = audiogram_command(audio_path, turns, images, background, layout, captions_path, duration)
+    cmd += ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof", "pipe:1"]
+    logger.info("Rendering %.1fs %s audiogram to a stream", duration, orientation)
+    return MergeStream(cmd, captions_path)
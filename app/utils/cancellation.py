@@ -0,0 +1,170 @@
+"""
+Cooperative cancellation of running jobs. A job runs with a CancelToken bound to its context
+(segment workers see it because their tasks run in a copy of the submitting thread's context).
+Backoff sleeps, Heygen polling and queued segment work check the token, and ffmpeg processes
+started through run_process are killed, so a cancelled job stops within one poll interval.
+"""
+import time
+import logging
+import threading
+import contextvars
+import subprocess
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(BaseException):
+    """
+    Raised in a job's threads once the job has been cancelled. Like KeyboardInterrupt it is not
+    an Exception, so the pipeline's per-segment error handling (which records failures and
+    retries) lets it through instead of treating cancellation as a failed segment.
+    """
+
+class CancelToken:
+    """Cancellation state of one job: a flag, the ffmpeg processes to kill and callbacks to run"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._event = threading.Event()
+        self._processes = set()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Set the flag, kill the job's processes and run its callbacks; False if already cancelled"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._event.set()
+            processes, callbacks = list(self._processes), list(self._callbacks)
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("Cancellation callback of job %s failed: %s", self.job_id, e)
+        return True
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def sleep(self, seconds):
+        """Sleep for seconds, waking up (and raising JobCancelled) as soon as the job is cancelled"""
+        if self._event.wait(seconds):
+            self.raise_if_cancelled()
+
+    def add_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._event.is_set()
+        if cancelled and process.poll() is None:
+            process.kill()
+
+    def discard_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_callback(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+        self.raise_if_cancelled()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+_current_token = contextvars.ContextVar("lisa_cancel_token", default=None)
+
+# Tokens of the jobs running in this process: {job_id: CancelToken}
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+@contextmanager
+def cancellable(job_id):
+    """Run the enclosed block (and copies of its context) as job_id, so cancel(job_id) reaches it"""
+    token = CancelToken(job_id)
+    with _tokens_lock:
+        _tokens[job_id] = token
+    context_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(context_token)
+        with _tokens_lock:
+            if _tokens.get(job_id) is token:
+                del _tokens[job_id]
+
+def cancel(job_id):
+    """Cancel a job running in this process; False if it is not running here or already cancelled"""
+    with _tokens_lock:
+        token = _tokens.get(job_id)
+    if token is None:
+        return False
+    logger.info("Cancelling job %s", job_id)
+    return token.cancel()
+
+def is_running(job_id):
+    with _tokens_lock:
+        return job_id in _tokens
+
+def check_cancelled():
+    """Raise JobCancelled if the job of the current context has been cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+def sleep(seconds):
+    """time.sleep that is cut short by cancellation of the current job"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+@contextmanager
+def on_cancel(callback):
+    """Call callback if the current job is cancelled while the enclosed block runs"""
+    token = _current_token.get()
+    if token is None:
+        yield
+        return
+    token.add_callback(callback)
+    try:
+        yield
+    finally:
+        token.remove_callback(callback)
+
+@contextmanager
+def watch_process(process):
+    """Kill process if the current job is cancelled while the enclosed block runs"""
+    token = _current_token.get()
+    if token is None:
+        yield process
+        return
+    token.add_process(process)
+    try:
+        yield process
+    finally:
+        token.discard_process(process)
+
+def run_process(cmd):
+    """
+    subprocess.run(cmd, check=True, capture_output=True, text=True) whose process is killed
+    when the current job is cancelled (raising JobCancelled instead of CalledProcessError)
+    """
+    check_cancelled()
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as process:
+        with watch_process(process):
+            stdout, stderr = process.communicate()
+    check_cancelled()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
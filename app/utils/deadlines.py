@@ -0,0 +1,51 @@
+"""
+Job deadlines. A job runs with its deadline bound to its context (segment workers see it because
+their tasks run in a copy of the submitting thread's context), so every stage can ask how much
+time is left. Provider retries stop at the deadline itself; work that can be replaced by a
+cheaper local step (Heygen renders, new provider requests) gives up at the soft deadline,
+DEADLINE_RESERVE_SECONDS earlier, leaving time to fall back and publish what is done.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+
+class DeadlineExceeded(Exception):
+    """A stage gave up because the job would not finish before its deadline"""
+
+# (deadline, soft deadline) of the job in the current context, as time.monotonic() values
+_current_deadline = contextvars.ContextVar("lisa_deadline", default=None)
+
+@contextmanager
+def job_deadline(seconds, reserve=0.0):
+    """
+    Run the enclosed block (and copies of its context) with a deadline seconds from now; no
+    deadline when seconds is falsy. The reserve never takes more than half of the budget.
+    """
+    if not seconds:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    token = _current_deadline.set((deadline, deadline - min(reserve, seconds / 2)))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+def deadline():
+    """The current job's deadline (a time.monotonic() value), or None"""
+    deadlines = _current_deadline.get()
+    return deadlines[0] if deadlines else None
+
+def time_left():
+    """Seconds until the current job's soft deadline (negative once passed), or None without a deadline"""
+    deadlines = _current_deadline.get()
+    return deadlines[1] - time.monotonic() if deadlines else None
+
+def past_soft_deadline():
+    left = time_left()
+    return left is not None and left <= 0
+
+def check_deadline(stage):
+    """Raise DeadlineExceeded if the current job's soft deadline has passed"""
+    if past_soft_deadline():
+        raise DeadlineExceeded(f"{stage} skipped: the job deadline is too close")
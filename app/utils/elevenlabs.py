@@ -1,28 +1,21 @@
-import requests
+import base64
 import logging
 from app.config import settings
+from app.utils.retry import send, call_with_retry
 
 logger = logging.getLogger(__name__)
 
-def synthesize_voice(text, voice_id, config, output_path):
-    logger.info(f"ElevenLabs: Synthesizing voice for text (length: {len(text)})")
-    logger.info(f"Voice ID: {voice_id}")
-    logger.info(f"Output path: {output_path}")
-    logger.info(f"Voice settings: stability={config.stability}, similarity_boost={config.similarity_boost}, style={config.style}")
-    logger.info(f"Text preview: {text[:100]}...")
-    
-    # Check if text contains Devanagari script
-    devanagari_chars = [char for char in text if '\u0900' <= char <= '\u097F']
-    if devanagari_chars:
-        logger.info(f"Detected {len(devanagari_chars)} Devanagari characters in text")
-        logger.info(f"Devanagari characters: {devanagari_chars[:10]}...")
-    
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-    headers = {
+# Joins lines in a batched request; a paragraph break gives a natural pause to cut in
+LINE_SEPARATOR = "\n\n"
+
+def _headers():
+    return {
         "xi-api-key": settings.ELEVENLABS_API_KEY,
         "Content-Type": "application/json"
     }
-    payload = {
+
+def _payload(text, config):
+    return {
         "text": text,
         "voice_settings": {
             "stability": config.stability,
@@ -33,18 +26,134 @@ def synthesize_voice(text, voice_id, config, output_path):
         "model_id": config.model_id,
         "output_format": "mp3_44100_128"
     }
+
+def synthesize_voice(text, voice_id, config, output_path, slot=None):
+    """
+    Synthesize text into output_path (MP3).
+    - slot: Held around each attempt, see call_with_retry
+    """
+    logger.info("ElevenLabs: Synthesizing voice %s for text (length: %s)", voice_id, len(text))
+    logger.debug("Output path: %s", output_path)
+    logger.debug("Voice settings: stability=%s, similarity_boost=%s, style=%s", config.stability, config.similarity_boost, config.style)
+    logger.debug("Text preview: %s...", text[:100])
+    
+    # Check if text contains Devanagari script (only worth scanning the text when it will be logged)
+    if logger.isEnabledFor(logging.DEBUG):
+        devanagari_count = sum(1 for char in text if '\u0900' <= char <= '\u097F')
+        if devanagari_count:
+            logger.debug("Detected %s Devanagari characters in text", devanagari_count)
     
-    logger.info("Sending request to ElevenLabs API...")
-    response = requests.post(url, json=payload, stream=True, headers=headers)
+    url = f"{settings.ELEVENLABS_BASE_URL}/v1/text-to-speech/{voice_id}"
+    headers = _headers()
+    payload = _payload(text, config)
     
-    if response.status_code == 200:
-        logger.info("ElevenLabs API response successful")
+    logger.debug("Sending request to ElevenLabs API...")
+    
+    def attempt():
+        # The body is streamed, so a connection dropped mid-download is retried as a whole
+        response = send("POST", url, "elevenlabs", json=payload, stream=True, headers=headers)
+        logger.debug("ElevenLabs API response successful")
         with open(output_path, "wb") as f:
             for chunk in response.iter_content(chunk_size=8192):
                 f.write(chunk)
-        logger.info(f"Audio file saved to: {output_path}")
         return output_path
+    
+    try:
+        call_with_retry(attempt, "elevenlabs", slot=slot)
+    except Exception as e:
+        logger.error("ElevenLabs request failed: %s", e)
+        raise
+    
+    logger.info("Audio file saved to: %s", output_path)
+    return output_path
+
+def batch_lines(texts, max_chars):
+    """
+    Group consecutive texts into batches whose joined text is at most max_chars long
+    (a single longer text gets a batch of its own). Returns lists of indices into texts.
+    """
+    batches = []
+    length = 0
+    for i, text in enumerate(texts):
+        added = len(text) + (len(LINE_SEPARATOR) if batches and batches[-1] else 0)
+        if batches and batches[-1] and length + added <= max_chars:
+            batches[-1].append(i)
+            length += added
+        else:
+            batches.append([i])
+            length = len(text)
+    return batches
+
+class AlignmentMismatch(ValueError):
+    """A with-timestamps response whose character alignment cannot be mapped back to the requested lines"""
+
+def _line_spans(characters, texts):
+    """
+    (first, last) index into characters of each of texts, joined with LINE_SEPARATOR, or None if
+    the lines cannot be told apart
+    """
+    joined = "".join(characters)
+    if len(joined) != len(characters):
+        return None
+    if joined == LINE_SEPARATOR.join(texts):
+        lengths = [len(text) for text in texts]
     else:
-        error_msg = f"ElevenLabs error: {response.text}"
-        logger.error(error_msg)
-        raise Exception(error_msg) 
\ No newline at end of file
+        # Normalized text (numbers, dates, abbreviations spelled out) has other lengths, but
+        # the separators between lines survive it
+        pieces = joined.split(LINE_SEPARATOR)
+        if len(pieces) != len(texts) or not all(pieces):
+            return None
+        lengths = [len(piece) for piece in pieces]
+    spans = []
+    position = 0
+    for length in lengths:
+        spans.append((position, position + length - 1))
+        position += length + len(LINE_SEPARATOR)
+    return spans
+
+def line_times(body, texts):
+    """
+    (start, end) in seconds of each of texts, joined with LINE_SEPARATOR, from the character
+    alignment of a with-timestamps response body (or its normalized_alignment, when ElevenLabs
+    normalized the text). Raises AlignmentMismatch if neither maps back to the lines.
+    """
+    for name in ("alignment", "normalized_alignment"):
+        alignment = body.get(name)
+        if not alignment:
+            continue
+        spans = _line_spans(alignment["characters"], texts)
+        if spans:
+            starts = alignment["character_start_times_seconds"]
+            ends = alignment["character_end_times_seconds"]
+            return [(starts[first], ends[last]) for first, last in spans]
+    raise AlignmentMismatch("ElevenLabs alignment does not match the requested text")
+
+def synthesize_lines(texts, voice_id, config, output_path, slot=None):
+    """
+    Synthesize several lines of one voice in a single request (the with-timestamps endpoint)
+    into output_path. Returns the (start, end) of each line within the audio, in seconds.
+    Raises AlignmentMismatch if the response cannot be split into the lines.
+    - slot: Held around each attempt, see call_with_retry
+    """
+    text = LINE_SEPARATOR.join(texts)
+    logger.info("ElevenLabs: Synthesizing voice %s for %s lines in one request (length: %s)", voice_id, len(texts), len(text))
+    url = f"{settings.ELEVENLABS_BASE_URL}/v1/text-to-speech/{voice_id}/with-timestamps"
+    headers = _headers()
+    payload = _payload(text, config)
+    
+    def attempt():
+        response = send("POST", url, "elevenlabs", json=payload, headers=headers)
+        body = response.json()
+        times = line_times(body, texts)
+        with open(output_path, "wb") as f:
+            f.write(base64.b64decode(body["audio_base64"]))
+        return times
+    
+    try:
+        times = call_with_retry(attempt, "elevenlabs", slot=slot)
+    except Exception as e:
+        logger.error("ElevenLabs request failed: %s", e)
+        raise
+    
+    logger.info("Audio of %s lines saved to: %s", len(texts), output_path)
+    return times
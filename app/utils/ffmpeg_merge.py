@@ -1,141 +1,368 @@
 import subprocess
 import os
+import wave
+import shutil
 import logging
+import tempfile
+from contextlib import ExitStack
+from app.utils.cancellation import check_cancelled, run_process, watch_process
 
 logger = logging.getLogger(__name__)
 
-def merge_audio_clips(audio_paths, output_path):
-    logger.info(f"Merging {len(audio_paths)} audio clips")
-    logger.info(f"Output path: {output_path}")
-    
-    # Verify all input files exist
-    for path in audio_paths:
+# Use re-encoding instead of copy to handle different MP3 encodings
+AUDIO_MERGE_CODEC = ["-acodec", "libmp3lame", "-ar", "44100", "-ab", "128k"]
+
+# Crop square, scale, then pad a 1280x720 render to 720x1280 portrait
+PORTRAIT_FILTER = "crop=720:720:280:0,scale=720:720,pad=720:1280:0:280:black"
+
+# Frame rate and audio sample rate of re-encoded video merges (see normalized_concat)
+MERGE_FPS = 25
+MERGE_AUDIO_RATE = 44100
+
+def _write_concat_list(paths, output_dir):
+    """Verify the inputs exist and write the concat demuxer's inputs.txt; returns its path"""
+    for path in paths:
         if not os.path.exists(path):
-            logger.error(f"Input file does not exist: {path}")
+            logger.error("Input file does not exist: %s", path)
             raise FileNotFoundError(f"Input file does not exist: {path}")
-        logger.info(f"Verified input file exists: {path}")
+        logger.debug("Verified input file exists: %s", path)
     
-    # Create inputs.txt in the same directory as output_path
-    output_dir = os.path.dirname(output_path)
     inputs_file = os.path.join(output_dir, "inputs.txt")
-    
-    logger.info(f"Creating inputs file: {inputs_file}")
+    logger.info("Creating inputs file: %s", inputs_file)
     with open(inputs_file, "w") as f:
-        for path in audio_paths:
+        for path in paths:
             # Use absolute paths and proper escaping for Windows
             abs_path = os.path.abspath(path)
             f.write(f"file '{abs_path}'\n")
-            logger.info(f"Added to inputs: {abs_path}")
+            logger.debug("Added to inputs: %s", abs_path)
+    return inputs_file
+
+def merge_audio_clips(audio_paths, output_path):
+    logger.info("Merging %s audio clips", len(audio_paths))
+    logger.info("Output path: %s", output_path)
     
-    # Use re-encoding instead of copy to handle different MP3 encodings
-    cmd = [
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", inputs_file,
-        "-acodec", "libmp3lame", "-ar", "44100", "-ab", "128k", output_path
-    ]
+    # Create inputs.txt in the same directory as output_path
+    inputs_file = _write_concat_list(audio_paths, os.path.dirname(output_path))
     
-    logger.info(f"Running FFmpeg command: {' '.join(cmd)}")
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", inputs_file] + AUDIO_MERGE_CODEC + [output_path]
+    
+    logger.info("Running FFmpeg command: %s", ' '.join(cmd))
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        result = run_process(cmd)
         logger.info("FFmpeg audio merge completed successfully")
-        logger.info(f"FFmpeg stdout: {result.stdout}")
+        logger.debug("FFmpeg stdout: %s", result.stdout)
     except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg failed with return code: {e.returncode}")
-        logger.error(f"FFmpeg stderr: {e.stderr}")
-        logger.error(f"FFmpeg stdout: {e.stdout}")
+        logger.error("FFmpeg failed with return code: %s", e.returncode)
+        logger.error("FFmpeg stderr: %s", e.stderr)
+        logger.error("FFmpeg stdout: %s", e.stdout)
         raise
     
     # Clean up inputs.txt
     try:
         os.remove(inputs_file)
-        logger.info(f"Cleaned up inputs file: {inputs_file}")
+        logger.info("Cleaned up inputs file: %s", inputs_file)
     except:
-        logger.warning(f"Could not remove inputs file: {inputs_file}")
+        logger.warning("Could not remove inputs file: %s", inputs_file)
     
     return output_path
 
-def merge_video_clips(video_paths, output_path):
-    logger.info(f"Merging {len(video_paths)} video clips")
-    logger.info(f"Output path: {output_path}")
-    
-    # Verify all input files exist
-    for path in video_paths:
+def normalized_concat(video_paths, size):
+    """
+    ffmpeg input and filter arguments that bring every clip to size (width, height), MERGE_FPS
+    and MERGE_AUDIO_RATE stereo audio, and concatenate them, for clips from different sources
+    (Heygen renders next to local renders) that cannot be joined by stream copy. The result
+    is in the [v] and [a] pads.
+    """
+    width, height = size
+    args = []
+    filters = []
+    for i, path in enumerate(video_paths):
         if not os.path.exists(path):
-            logger.error(f"Input file does not exist: {path}")
             raise FileNotFoundError(f"Input file does not exist: {path}")
-        logger.info(f"Verified input file exists: {path}")
-    
-    # Create inputs.txt in the same directory as output_path
-    output_dir = os.path.dirname(output_path)
-    inputs_file = os.path.join(output_dir, "inputs.txt")
-    
-    logger.info(f"Creating inputs file: {inputs_file}")
-    with open(inputs_file, "w") as f:
-        for path in video_paths:
-            # Use absolute paths and proper escaping for Windows
-            abs_path = os.path.abspath(path)
-            f.write(f"file '{abs_path}'\n")
-            logger.info(f"Added to inputs: {abs_path}")
+        args += ["-i", path]
+        filters.append(f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                       f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={MERGE_FPS},format=yuv420p[v{i}]")
+        filters.append(f"[{i}:a]aresample={MERGE_AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo[a{i}]")
+    filters.append("".join(f"[v{i}][a{i}]" for i in range(len(video_paths))) + f"concat=n={len(video_paths)}:v=1:a=1[v][a]")
+    return args + ["-filter_complex", ";".join(filters), "-map", "[v]", "-map", "[a]",
+                   "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-ar", str(MERGE_AUDIO_RATE)]
+
+def merge_video_clips(video_paths, output_path, size=None):
+    """
+    Join video clips by stream copy, or, with size, re-encode them to one format first (see
+    normalized_concat), for clips that do not share codec parameters, frame rate and timebase
+    """
+    logger.info("Merging %s video clips", len(video_paths))
+    logger.info("Output path: %s", output_path)
     
-    # For video, we can use copy since video files are usually more consistent
-    cmd = [
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", inputs_file,
-        "-c", "copy", output_path
-    ]
+    if size:
+        inputs_file = None
+        cmd = ["ffmpeg", "-y"] + normalized_concat(video_paths, size) + ["-movflags", "+faststart", output_path]
+    else:
+        # Create inputs.txt in the same directory as output_path
+        inputs_file = _write_concat_list(video_paths, os.path.dirname(output_path))
+        # Clips from one source share their encoding, so they can be joined without re-encoding
+        cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", inputs_file, "-c", "copy", output_path]
     
-    logger.info(f"Running FFmpeg command: {' '.join(cmd)}")
+    logger.info("Running FFmpeg command: %s", ' '.join(cmd))
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        result = run_process(cmd)
         logger.info("FFmpeg video merge completed successfully")
-        logger.info(f"FFmpeg stdout: {result.stdout}")
+        logger.debug("FFmpeg stdout: %s", result.stdout)
     except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg failed with return code: {e.returncode}")
-        logger.error(f"FFmpeg stderr: {e.stderr}")
-        logger.error(f"FFmpeg stdout: {e.stdout}")
+        logger.error("FFmpeg failed with return code: %s", e.returncode)
+        logger.error("FFmpeg stderr: %s", e.stderr)
+        logger.error("FFmpeg stdout: %s", e.stdout)
         raise
     
     # Clean up inputs.txt
-    try:
-        os.remove(inputs_file)
-        logger.info(f"Cleaned up inputs file: {inputs_file}")
-    except:
-        logger.warning(f"Could not remove inputs file: {inputs_file}")
+    if inputs_file:
+        try:
+            os.remove(inputs_file)
+            logger.info("Cleaned up inputs file: %s", inputs_file)
+        except:
+            logger.warning("Could not remove inputs file: %s", inputs_file)
     
     return output_path 
 
-def crop_video_to_portrait(input_path, output_path):
+class MergeStream:
+    """
+    A running ffmpeg merge that writes the merged file to its stdout, for consumers that
+    upload it while it is produced. Call wait() once stdout is exhausted, and always close().
+    """
+
+    def __init__(self, cmd, inputs_file):
+        logger.info("Running FFmpeg command: %s", ' '.join(cmd))
+        self.inputs_file = inputs_file
+        # stderr goes to a file: a pipe nobody reads could fill up and stall ffmpeg
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=self._stderr)
+        self.stdout = self.process.stdout
+        # Killed if the job is cancelled, which ends stdout early and fails wait()
+        self._watch = ExitStack()
+        self._watch.enter_context(watch_process(self.process))
+
+    def wait(self):
+        """Wait for ffmpeg to exit; raises CalledProcessError if the merge failed"""
+        returncode = self.process.wait()
+        check_cancelled()
+        if returncode != 0:
+            self._stderr.seek(0)
+            stderr = self._stderr.read().decode("utf-8", errors="replace")
+            logger.error("FFmpeg failed with return code: %s", returncode)
+            logger.error("FFmpeg stderr: %s", stderr)
+            raise subprocess.CalledProcessError(returncode, self.process.args, stderr=stderr)
+        logger.info("FFmpeg streaming merge completed successfully")
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self._watch.close()
+        self.stdout.close()
+        self._stderr.close()
+        if self.inputs_file is None:
+            return
+        try:
+            os.remove(self.inputs_file)
+        except OSError:
+            logger.warning("Could not remove inputs file: %s", self.inputs_file)
+
+def stream_audio_merge(audio_paths, work_dir):
+    """Merge audio clips like merge_audio_clips, writing the MP3 to a pipe instead of a file"""
+    logger.info("Merging %s audio clips to a stream", len(audio_paths))
+    inputs_file = _write_concat_list(audio_paths, work_dir)
+    cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", inputs_file] + AUDIO_MERGE_CODEC + ["-f", "mp3", "pipe:1"]
+    return MergeStream(cmd, inputs_file)
+
+def stream_video_merge(video_paths, work_dir, size=None):
+    """
+    Merge video clips like merge_video_clips (re-encoding them with size), writing to a pipe.
+    A regular MP4 needs a seekable output (its index is written last), so the stream is fragmented MP4.
+    """
+    logger.info("Merging %s video clips to a stream", len(video_paths))
+    if size:
+        inputs_file = None
+        cmd = ["ffmpeg", "-y"] + normalized_concat(video_paths, size)
+    else:
+        inputs_file = _write_concat_list(video_paths, work_dir)
+        cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", inputs_file, "-c", "copy"]
+    cmd += ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof", "pipe:1"]
+    return MergeStream(cmd, inputs_file)
+
+def crop_video_to_portrait(input_path, output_path, preset=None):
     """
     Crop a landscape video (1280x720) to portrait (720x1280) by cropping from the center.
+    - preset: x264 preset, e.g. "ultrafast" when the job is short of time (default: x264's)
     """
-    logger.info(f"Cropping video from landscape to portrait")
-    logger.info(f"Input: {input_path}")
-    logger.info(f"Output: {output_path}")
+    logger.info("Cropping video from landscape to portrait")
+    logger.info("Input: %s", input_path)
+    logger.info("Output: %s", output_path)
     
     # Method: Crop to square, then pad to portrait
     # This should definitely create 720x1280 portrait videos
     cmd = [
         "ffmpeg", "-y", "-i", input_path,
-        "-vf", "crop=720:720:280:0,scale=720:720,pad=720:1280:0:280:black",  # Crop square, scale, then pad to portrait
+        "-vf", PORTRAIT_FILTER,
         "-c:v", "libx264",
+    ] + (["-preset", preset] if preset else []) + [
         "-c:a", "copy",
         output_path
     ]
     
-    logger.info(f"Running FFmpeg crop and pad command")
-    logger.info(f"Running: {' '.join(cmd)}")
+    logger.info("Running FFmpeg crop and pad command")
+    logger.info("Running: %s", ' '.join(cmd))
     
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        result = run_process(cmd)
         logger.info("Portrait video created successfully")
         
         # Verify the output dimensions
         verify_cmd = [
             "ffprobe", "-v", "quiet", "-print_format", "json", "-show_streams", output_path
         ]
-        verify_result = subprocess.run(verify_cmd, check=True, capture_output=True, text=True)
-        logger.info(f"Output video info: {verify_result.stdout}")
+        verify_result = run_process(verify_cmd)
+        logger.debug("Output video info: %s", verify_result.stdout)
         
     except subprocess.CalledProcessError as e:
-        logger.error(f"Portrait creation failed: {e.stderr}")
+        logger.error("Portrait creation failed: %s", e.stderr)
+        raise
+    
+    return output_path
+
+def segment_for_hls(input_path, output_pattern, list_path, offset=0.0, segment_seconds=6):
+    """
+    Split a clip into MPEG-TS fragments for an HLS playlist, without re-encoding.
+    - output_pattern: Fragment path pattern, e.g. ".../seg3_%03d.ts"
+    - list_path: Where ffmpeg writes the fragment list (CSV of name, start, end)
+    - offset: Start time of the clip within the stream, so timestamps continue across clips
+    - segment_seconds: Target fragment length; video is only cut at keyframes
+    Returns [(fragment path, duration in seconds)] in playback order.
+    """
+    cmd = [
+        "ffmpeg", "-y", "-i", input_path,
+        # V (not v): cover art embedded in an MP3 is not a video stream
+        "-map", "0:V?", "-map", "0:a?", "-c", "copy",
+        "-f", "segment", "-segment_format", "mpegts", "-segment_time", str(segment_seconds),
+        "-segment_list", list_path, "-segment_list_type", "csv",
+        "-output_ts_offset", f"{offset:.3f}",
+        output_pattern
+    ]
+    logger.debug("Running: %s", ' '.join(cmd))
+    try:
+        run_process(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("HLS segmenting failed: %s", e.stderr)
         raise
     
-    return output_path 
\ No newline at end of file
+    # End times include the offset but the first start time does not, so durations come from the ends
+    fragments = []
+    output_dir = os.path.dirname(output_pattern)
+    previous_end = offset
+    with open(list_path) as f:
+        for line in f:
+            name, _, end = line.strip().rsplit(",", 2)
+            fragments.append((os.path.join(output_dir, name), float(end) - previous_end))
+            previous_end = float(end)
+    os.remove(list_path)
+    return fragments
+
+def decode_to_pcm(audio_paths, output_dir, sample_rate=44100, sample_format="s16le"):
+    """
+    Decode audio clips to raw mono PCM files (<i>.pcm in output_dir) in a single ffmpeg run.
+    - sample_format: ffmpeg raw format, e.g. "s16le" or "f32le"
+    Returns the PCM paths in the order of audio_paths.
+    """
+    pcm_paths = [os.path.join(output_dir, f"{i}.pcm") for i in range(len(audio_paths))]
+    cmd = ["ffmpeg", "-y"]
+    for path in audio_paths:
+        cmd += ["-i", path]
+    for i, pcm_path in enumerate(pcm_paths):
+        cmd += ["-map", f"{i}:a", "-ac", "1", "-ar", str(sample_rate), "-f", sample_format, pcm_path]
+    logger.info("Decoding %s clips to PCM", len(audio_paths))
+    try:
+        run_process(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("FFmpeg decode failed: %s", e.stderr)
+        raise
+    return pcm_paths
+
+def join_audio_with_offsets(audio_paths, output_path, gap_seconds=0.0, sample_rate=44100):
+    """
+    Join audio clips into one MP3 track with gap_seconds of silence between them and return
+    the exact (start, end) time of each clip within the track.
+    Clips are decoded once to PCM (one ffmpeg run for all of them) and joined in Python, so
+    the offsets come from sample counts rather than from MP3 duration estimates.
+    """
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(output_path))
+    try:
+        pcm_paths = decode_to_pcm(audio_paths, work_dir, sample_rate)
+        
+        track_path = os.path.join(work_dir, "track.wav")
+        silence = b"\x00\x00" * int(round(gap_seconds * sample_rate))
+        offsets = []
+        position = 0  # in samples
+        with wave.open(track_path, "wb") as track:
+            track.setnchannels(1)
+            track.setsampwidth(2)
+            track.setframerate(sample_rate)
+            for i, pcm_path in enumerate(pcm_paths):
+                if i:
+                    track.writeframes(silence)
+                    position += len(silence) // 2
+                with open(pcm_path, "rb") as clip:
+                    frames = clip.read()
+                track.writeframes(frames)
+                offsets.append((position / sample_rate, (position + len(frames) // 2) / sample_rate))
+                position += len(frames) // 2
+        
+        cmd = ["ffmpeg", "-y", "-i", track_path] + AUDIO_MERGE_CODEC + [output_path]
+        try:
+            run_process(cmd)
+        except subprocess.CalledProcessError as e:
+            logger.error("FFmpeg track encode failed: %s", e.stderr)
+            raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    logger.info("Joined %s clips into %s (%.1fs)", len(audio_paths), output_path, position / sample_rate)
+    return offsets
+
+def cut_clip(input_path, start, end, output_path, portrait=False, preset=None):
+    """
+    Cut [start, end) seconds out of a video, re-encoding so the cut is frame-accurate.
+    With portrait, the portrait crop is applied in the same encode.
+    - preset: x264 preset (see crop_video_to_portrait)
+    """
+    cmd = ["ffmpeg", "-y", "-ss", f"{start:.3f}", "-i", input_path, "-t", f"{end - start:.3f}"]
+    if portrait:
+        cmd += ["-vf", PORTRAIT_FILTER]
+    cmd += ["-c:v", "libx264"] + (["-preset", preset] if preset else [])
+    cmd += ["-c:a", "aac", "-avoid_negative_ts", "make_zero", output_path]
+    logger.debug("Running: %s", ' '.join(cmd))
+    try:
+        run_process(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("Cutting %s failed: %s", input_path, e.stderr)
+        raise
+    return output_path
+
+def split_audio(input_path, cut_points, output_paths):
+    """
+    Split an audio file at cut_points (seconds, ascending) into len(cut_points) + 1 clips,
+    written to output_paths, in one ffmpeg run. Output-side seeking decodes, so the cuts are
+    sample-accurate; each clip is re-encoded.
+    """
+    bounds = [0.0] + list(cut_points) + [None]
+    cmd = ["ffmpeg", "-y", "-i", input_path]
+    for i, output_path in enumerate(output_paths):
+        cmd += ["-map", "0:a", "-ss", f"{bounds[i]:.3f}"]
+        if bounds[i + 1] is not None:
+            cmd += ["-to", f"{bounds[i + 1]:.3f}"]
+        cmd += AUDIO_MERGE_CODEC + [output_path]
+    logger.debug("Running: %s", ' '.join(cmd))
+    try:
+        run_process(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("Splitting %s failed: %s", input_path, e.stderr)
+        raise
+    return output_paths
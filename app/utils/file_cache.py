@@ -0,0 +1,192 @@
+import os
+import shutil
+import logging
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from app.config import settings
+from app.utils.s3 import upload_to_s3, download_from_s3
+from app.utils.hashing import file_digest, cache_key
+from app.utils.metrics import REGISTRY, Callback
+
+logger = logging.getLogger(__name__)
+
+class FileCache:
+    """
+    Content-addressed cache of generated media files on local disk, with LRU eviction by
+    total size and an optional S3-backed second tier shared between containers.
+    - name: Used for logging and stats (e.g. "heygen")
+    - directory: Local cache directory
+    - max_bytes: Local size budget; least recently used entries are evicted beyond it
+    - s3_prefix: If set, entries are also stored under this S3 prefix
+    - extension: File extension of cached entries
+    """
+
+    def __init__(self, name, directory, max_bytes, s3_prefix=None, extension=""):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.s3_prefix = s3_prefix
+        self.extension = extension
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: size}, least recently used first
+        self._bytes = 0
+        self._hits = {"local": 0, "s3": 0}
+        self._misses = 0
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU order from file modification times left by a previous process"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name[:len(name) - len(self.extension)] if self.extension else name, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.extension}")
+
+    def _s3_key(self, key):
+        return f"{self.s3_prefix}/{key}{self.extension}"
+
+    def get(self, key, output_path):
+        """Copy a cached entry to output_path. Returns True on a hit."""
+        path = self._path(key)
+        with self._lock:
+            local_hit = key in self._entries
+            if local_hit:
+                self._entries.move_to_end(key)
+
+        if local_hit:
+            try:
+                shutil.copyfile(path, output_path)
+                os.utime(path)
+                self._record_hit("local")
+                logger.info("%s cache hit (local): %s", self.name, key)
+                return True
+            except FileNotFoundError:
+                self._drop(key)
+
+        if self.s3_prefix:
+            try:
+                if download_from_s3(self._s3_key(key), output_path):
+                    self._record_hit("s3")
+                    logger.info("%s cache hit (S3): %s", self.name, key)
+                    self._store_local(key, output_path)
+                    return True
+            except Exception as e:
+                logger.warning("%s cache S3 lookup failed for %s: %s", self.name, key, e)
+
+        with self._lock:
+            self._misses += 1
+        return False
+
+    def put(self, key, file_path):
+        """Add a file to the cache (both tiers)"""
+        self._store_local(key, file_path)
+        if self.s3_prefix:
+            try:
+                upload_to_s3(file_path, self._s3_key(key))
+            except Exception as e:
+                logger.warning("%s cache S3 store failed for %s: %s", self.name, key, e)
+
+    def _store_local(self, key, file_path):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("%s cache store failed for %s: %s", self.name, key, e)
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+        if evicted:
+            logger.info("%s cache evicted %s entries", self.name, len(evicted))
+
+    def _drop(self, key):
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+
+    def _record_hit(self, tier):
+        with self._lock:
+            self._hits[tier] += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self._hits["local"] + self._hits["s3"]
+            lookups = hits + self._misses
+            return {
+                "hits": hits,
+                "local_hits": self._hits["local"],
+                "s3_hits": self._hits["s3"],
+                "misses": self._misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+# Built on first use rather than at import: each one creates and scans its directory
+
+@lru_cache(maxsize=None)
+def render_cache():
+    """Heygen renders keyed by audio content + talking photo + background + dimensions"""
+    return FileCache(
+        "heygen",
+        os.path.join(settings.CACHE_DIR, "heygen"),
+        settings.RENDER_CACHE_MAX_BYTES,
+        s3_prefix="podcasts/cache/heygen" if settings.RENDER_CACHE_S3 else None,
+        extension=".mp4"
+    )
+
+@lru_cache(maxsize=None)
+def tts_cache():
+    """
+    ElevenLabs audio keyed by text + voice + voice settings, so unchanged lines keep
+    byte-identical audio (and therefore hit the render cache) across re-renders
+    """
+    return FileCache(
+        "elevenlabs",
+        os.path.join(settings.CACHE_DIR, "elevenlabs"),
+        settings.TTS_CACHE_MAX_BYTES,
+        s3_prefix="podcasts/cache/elevenlabs" if settings.RENDER_CACHE_S3 else None,
+        extension=".mp3"
+    )
+
+def _caches():
+    return (render_cache(), tts_cache())
+
+def _cache_metric(field):
+    return lambda: {(cache.name,): cache.stats()[field] for cache in _caches()}
+
+REGISTRY.register(Callback(
+    "lisa_cache_hits_total", "Media cache hits by tier", ("cache", "tier"),
+    lambda: {(cache.name, tier): cache.stats()[f"{tier}_hits"] for cache in _caches() for tier in ("local", "s3")},
+    kind="counter"))
+REGISTRY.register(Callback("lisa_cache_misses_total", "Media cache misses", ("cache",), _cache_metric("misses"), kind="counter"))
+REGISTRY.register(Callback("lisa_cache_entries", "Entries in the local media cache", ("cache",), _cache_metric("entries")))
+REGISTRY.register(Callback("lisa_cache_bytes", "Size of the local media cache", ("cache",), _cache_metric("bytes")))
+
+def render_key(audio_path, avatar_id, background, width, height):
+    return cache_key("heygen", file_digest(audio_path), avatar_id, background or "", width, height)
+
+def tts_key(text, voice_id, config):
+    return cache_key("elevenlabs", text, voice_id, config.model_dump())
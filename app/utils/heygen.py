@@ -1,11 +1,20 @@
-import requests
 import time
 import logging
 from app.config import settings
+from app.utils.retry import send, request_with_retry, call_with_retry, is_retryable, record_retry
+from app.utils.metrics import span, observe
+from app.utils.cancellation import check_cancelled, sleep
+from app.utils.deadlines import DeadlineExceeded, time_left
 
 logger = logging.getLogger(__name__)
 
-def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_id=None, width=1280, height=720):
+def _headers():
+    return {
+        "X-Api-Key": settings.HEYGEN_API_KEY,
+        "Content-Type": "application/json"
+    }
+
+def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_id=None, width=1280, height=720, on_submitted=None):
     """
     Generate a Heygen talking photo video using a public audio URL.
     - audio_url: Public URL to the audio file (e.g., S3)
@@ -14,18 +23,22 @@ def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_i
     - output_path: Where to save the final video
     - voice_id: Optional Heygen voice ID (if using text input)
     - width, height: Video dimensions
+    - on_submitted: Optional callback called with the Heygen video_id once the render is submitted
     """
-    logger.info(f"Heygen: Generating talking photo video")
-    logger.info(f"Audio URL: {audio_url}")
-    logger.info(f"Talking Photo ID: {avatar_id}")
-    logger.info(f"Background: {background} (type: {type(background)})")
-    logger.info(f"Output path: {output_path}")
+    video_id = submit_avatar_video(audio_url, avatar_id, background, width=width, height=height)
+    if on_submitted:
+        on_submitted(video_id)
+    return wait_for_avatar_video(video_id, output_path)
+
+def submit_avatar_video(audio_url, avatar_id, background, width=1280, height=720):
+    """
+    Submit a Heygen talking photo render and return its video_id without waiting for it.
+    """
+    logger.info("Heygen: Generating talking photo video for %s", avatar_id)
+    logger.debug("Audio URL: %s", audio_url)
+    logger.debug("Background: %s", background)
     
-    api_key = settings.HEYGEN_API_KEY
-    headers = {
-        "X-Api-Key": api_key,
-        "Content-Type": "application/json"
-    }
+    headers = _headers()
     
     # Prepare video_inputs for audio - using the correct Heygen API structure
     video_inputs = [{
@@ -68,85 +81,145 @@ def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_i
         }
     }
     
-    logger.info(f"Heygen payload: {payload}")
-    
-    # Log the complete JSON payload in a readable format
-    logger.info("=== COMPLETE HEYGEN API PAYLOAD ===")
-    import json
-    logger.info(json.dumps(payload, indent=2))
-    logger.info("=== END HEYGEN API PAYLOAD ===")
+    logger.debug("Heygen payload: %s", payload)
     
     # 1. Submit video generation request
-    logger.info("Sending request to Heygen API...")
-    resp = requests.post(
-        "https://api.heygen.com/v2/video/generate",
-        headers=headers,
-        json=payload
-    )
-    
-    logger.info(f"Heygen response status: {resp.status_code}")
-    logger.info(f"Heygen response: {resp.text}")
+    # Submitting is not idempotent, so only errors that guarantee nothing was queued are retried
+    logger.debug("Sending request to Heygen API...")
+    try:
+        with span("heygen_submit"):
+            resp = request_with_retry(
+                "POST",
+                f"{settings.HEYGEN_BASE_URL}/v2/video/generate",
+                "heygen",
+                idempotent=False,
+                headers=headers,
+                json=payload
+            )
+    except Exception as e:
+        raise Exception(f"Heygen video generation error: {e}")
     
-    if resp.status_code != 200:
-        raise Exception(f"Heygen video generation error: {resp.text}")
+    logger.debug("Heygen response (%s): %s", resp.status_code, resp.text)
     
     response_data = resp.json()
     if response_data.get("error"):
         raise Exception(f"Heygen video generation error: {response_data['error']}")
     
     video_id = response_data["data"]["video_id"]
-    logger.info(f"Video ID: {video_id}")
+    logger.info("Video ID: %s", video_id)
+    return video_id
+
+def wait_for_avatar_video(video_id, output_path):
+    """
+    Poll a submitted Heygen render until it completes, then download it to output_path.
+    Safe to call again for a video_id that was submitted by an earlier, failed attempt.
+    """
+    return download_avatar_video(poll_avatar_video(video_id), output_path)
+
+def poll_schedule(audio_seconds=None):
+    """
+    (poll interval, max wait) in seconds for a render of audio_seconds of audio. Renders take
+    about HEYGEN_RENDER_FACTOR seconds per second of audio, so long ones are polled less often
+    (about 20 times over the expected render, at most every HEYGEN_MAX_POLL_INTERVAL) and
+    allowed up to three times the expected render, but never less than the defaults.
+    """
+    if not audio_seconds:
+        return settings.HEYGEN_POLL_INTERVAL, settings.HEYGEN_MAX_WAIT_SECONDS
+    expected = audio_seconds * settings.HEYGEN_RENDER_FACTOR
+    interval = max(settings.HEYGEN_POLL_INTERVAL, min(expected / 20, settings.HEYGEN_MAX_POLL_INTERVAL))
+    return interval, max(settings.HEYGEN_MAX_WAIT_SECONDS, expected * 3)
+
+def poll_avatar_video(video_id, audio_seconds=None):
+    """
+    Poll a submitted Heygen render until it completes and return the URL of the video.
+    - audio_seconds: Length of the rendered audio, to pace polling (see poll_schedule)
+    Polling stops at the job's soft deadline with DeadlineExceeded, so the caller can fall back.
+    """
+    headers = _headers()
     
     # 2. Poll for video status using the correct polling endpoint
     logger.info("Starting polling for video completion...")
-    max_attempts = 60  # 5 minutes max (60 * 5 seconds)
+    poll_interval, max_wait = poll_schedule(audio_seconds)
+    left = time_left()
+    short_of_time = left is not None and left < max_wait
+    if short_of_time:
+        max_wait = max(0.0, left)
+    max_attempts = max(1, int(max_wait / poll_interval))  # 5 minutes max by default (60 * 5 seconds)
     attempts = 0
+    # Queue time lasts until Heygen first reports "processing"; both are only as precise as the poll interval
+    poll_start = time.perf_counter()
+    rendering_since = None
     
     while attempts < max_attempts:
+        if attempts and short_of_time and time_left() <= 0:
+            raise DeadlineExceeded(f"Heygen render {video_id} not finished before the job deadline")
         attempts += 1
-        logger.info(f"Polling attempt {attempts}/{max_attempts}")
+        logger.debug("Polling attempt %s/%s", attempts, max_attempts)
         
-        # Use the correct polling endpoint
-        status_resp = requests.get(
-            f"https://api.heygen.com/v1/video_status.get",
-            headers=headers,
-            params={"video_id": video_id}
-        )
-        
-        if status_resp.status_code != 200:
-            logger.error(f"Status check failed: {status_resp.text}")
-            time.sleep(5)
+        # Use the correct polling endpoint; a failed poll is just retried on the next attempt
+        try:
+            status_resp = send(
+                "GET",
+                f"{settings.HEYGEN_BASE_URL}/v1/video_status.get",
+                "heygen",
+                headers=headers,
+                params={"video_id": video_id}
+            )
+        except Exception as e:
+            if not is_retryable(e):
+                raise Exception(f"Heygen status check error: {e}")
+            logger.error("Status check failed: %s", e)
+            record_retry("heygen")
+            sleep(poll_interval)
             continue
             
         status_data = status_resp.json()
         if status_data.get("error"):
-            logger.error(f"Status check error: {status_data['error']}")
-            time.sleep(5)
+            logger.error("Status check error: %s", status_data['error'])
+            sleep(poll_interval)
             continue
             
         video_status = status_data["data"]["status"]
-        logger.info(f"Video status: {video_status}")
+        logger.debug("Video status: %s", video_status)
+        
+        if video_status == "processing" and rendering_since is None:
+            rendering_since = time.perf_counter()
         
         if video_status == "completed":
             video_url = status_data["data"]["video_url"]
-            logger.info(f"Video completed successfully: {video_url}")
+            logger.info("Video completed successfully: %s", video_url)
+            completed_at = time.perf_counter()
+            rendering_since = rendering_since or completed_at
+            observe("heygen_queue", rendering_since - poll_start, start=poll_start)
+            observe("heygen_render", completed_at - rendering_since, start=rendering_since)
             break
         elif video_status in ("processing", "pending", "started"):
-            logger.info(f"Video still {video_status}, waiting 5 seconds...")
-            time.sleep(5)
+            logger.info("Video still %s, waiting %s seconds...", video_status, poll_interval)
+            sleep(poll_interval)
         elif video_status == "failed":
             raise Exception(f"Heygen video generation failed: {status_data['data']}")
         else:
-            logger.warning(f"Unknown status: {video_status}, waiting 5 seconds...")
-            time.sleep(5)
+            logger.warning("Unknown status: %s, waiting %s seconds...", video_status, poll_interval)
+            sleep(poll_interval)
     else:
+        if short_of_time:
+            raise DeadlineExceeded(f"Heygen render {video_id} not finished before the job deadline")
         raise Exception(f"Video generation timed out after {max_attempts} attempts")
-    
-    # 3. Download the video
+    return video_url
+
+def download_avatar_video(video_url, output_path):
+    """Download a completed Heygen render to output_path"""
     logger.info("Downloading video...")
-    video_content = requests.get(video_url).content
-    with open(output_path, "wb") as f:
-        f.write(video_content)
     
-    logger.info(f"Video saved to: {output_path}")
+    def download():
+        response = send("GET", video_url, "heygen", stream=True)
+        with open(output_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                check_cancelled()
+                f.write(chunk)
+    
+    with span("heygen_download"):
+        call_with_retry(download, "heygen")
+    
+    logger.info("Video saved to: %s", output_path)
     return output_path 
\ No newline at end of file
@@ -0,0 +1,104 @@
+import json
+import logging
+import contextvars
+from contextlib import contextmanager
+from app.config import settings
+from app.utils.metrics import _current_segment
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(job_context)s%(message)s'
+
+# ID of the job being worked on in the current context. Segment workers see it because
+# their tasks run in a copy of the submitting thread's context.
+_current_job_id = contextvars.ContextVar("lisa_job_id", default=None)
+
+@contextmanager
+def bind_job(job_id):
+    """Tag log records emitted in this context (and copies of it) with job_id"""
+    token = _current_job_id.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job_id.reset(token)
+
+def _truncate(value, limit):
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= limit:
+        return value
+    return f"{text[:limit]}... ({len(text)} chars)"
+
+class JobContextFilter(logging.Filter):
+    """
+    Adds job_id and segment to every record, drops INFO/DEBUG records of segments outside
+    the sample, and truncates long arguments. Attached to the handler, so it only runs for
+    records that passed their logger's level.
+    - sample_every: Keep per-segment records of every Nth segment (warnings and errors are always kept)
+    - max_field_chars: Longest rendered argument; 0 disables truncation
+    """
+
+    def __init__(self, sample_every=1, max_field_chars=0):
+        super().__init__()
+        self.sample_every = max(1, sample_every)
+        self.max_field_chars = max_field_chars
+
+    def filter(self, record):
+        record.job_id = _current_job_id.get()
+        if getattr(record, "segment", None) is None:
+            record.segment = _current_segment.get()
+        if (record.segment is not None and record.levelno < logging.WARNING
+                and record.segment % self.sample_every != 0):
+            return False
+
+        context = []
+        if record.job_id:
+            context.append(f"job={record.job_id[:8]}")
+        if record.segment is not None:
+            context.append(f"seg={record.segment + 1}")
+        record.job_context = f"[{' '.join(context)}] " if context else ""
+
+        if self.max_field_chars and record.args:
+            if isinstance(record.args, dict):
+                record.args = {key: _truncate(value, self.max_field_chars) for key, value in record.args.items()}
+            else:
+                record.args = tuple(_truncate(arg, self.max_field_chars) for arg in record.args)
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log pipelines that index fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if getattr(record, "job_id", None):
+            entry["job_id"] = record.job_id
+        if getattr(record, "segment", None) is not None:
+            entry["segment"] = record.segment
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _parse_levels(spec):
+    """"app.utils.heygen=WARNING,botocore=ERROR" -> {logger name: level}"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging():
+    """Configure the root logger from the LOG_* settings (console output only, Modal compatible)"""
+    handler = logging.StreamHandler()
+    handler.addFilter(JobContextFilter(settings.LOG_SEGMENT_SAMPLE_EVERY, settings.LOG_MAX_FIELD_CHARS))
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    logging.basicConfig(level=settings.LOG_LEVEL, handlers=[handler])
+
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
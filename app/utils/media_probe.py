@@ -0,0 +1,169 @@
+"""
+Durations of MP3 and MP4 files, read from the container structure in pure Python (no ffprobe
+process per file). MP3s are measured from their Xing/Info or VBRI header when present, else by
+walking the frame headers; MP4s from the movie (mvhd) or media (mdhd) headers.
+"""
+import os
+import mmap
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bitrates in kbps by (MPEG version 1 or 2, layer), index 1-14 of the frame header
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates by version bits of the frame header (0: MPEG 2.5, 2: MPEG 2, 3: MPEG 1)
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+def _frame(data, offset):
+    """(frame length, samples per frame, sample rate, MPEG 1, mono) of the frame at offset, or None"""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version_bits, layer_bits = (b1 >> 3) & 3, (b1 >> 1) & 3
+    bitrate_index, rate_index, padding = b2 >> 4, (b2 >> 2) & 3, (b2 >> 1) & 1
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, mpeg1, (b3 >> 6) == 3
+    samples = 1152 if mpeg1 or layer == 2 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, mpeg1, (b3 >> 6) == 3
+
+def _id3v2_size(data):
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+def _vbr_header(data, offset, mpeg1, mono):
+    """
+    (frame count, samples of encoder delay and padding) from a Xing/Info or VBRI header in the
+    first frame, or None. Delay and padding come from a LAME tag when there is one.
+    """
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if not flags & 1:
+            return None
+        frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+        # The LAME tag follows the optional byte count, TOC and quality fields
+        lame = xing + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+        if data[lame:lame + 4] in (b"LAME", b"Lavf", b"Lavc"):
+            b0, b1, b2 = data[lame + 21:lame + 24]
+            return frames, (b0 << 4 | b1 >> 4) + ((b1 & 0x0F) << 8 | b2)
+        return frames, 0
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b"VBRI":
+        return struct.unpack(">I", data[vbri + 14:vbri + 18])[0], 0
+    return None
+
+def mp3_duration(path):
+    """Duration of an MP3 file in seconds"""
+    if not os.path.getsize(path):
+        return 0.0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offset = _id3v2_size(data)
+        # Find the first frame, and make sure it is one by checking that the next follows it
+        while True:
+            offset = data.find(b"\xff", offset)
+            if offset < 0:
+                raise ValueError(f"No MPEG audio frames in {path}")
+            frame = _frame(data, offset)
+            if frame and (offset + frame[0] >= len(data) or _frame(data, offset + frame[0])):
+                break
+            offset += 1
+        _, samples, sample_rate, mpeg1, mono = frame
+        header = _vbr_header(data, offset, mpeg1, mono)
+        if header is not None:
+            frames, trimmed = header
+            return max(0, frames * samples - trimmed) / sample_rate
+
+        total = 0
+        while True:
+            frame = _frame(data, offset)
+            if frame is None:
+                # Trailing tags (ID3v1, APE) or garbage; resynchronize on the next frame header
+                offset = data.find(b"\xff", offset + 1)
+                if offset < 0:
+                    break
+                continue
+            length, samples, sample_rate = frame[:3]
+            if offset + length > len(data):
+                break
+            total += samples / sample_rate
+            offset += length
+        return total
+
+def _boxes(f, start, end):
+    """Yield (type, payload offset, payload end) of the MP4 boxes between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            break
+        yield kind, offset + header, min(offset + size, end)
+        offset += size
+
+def _media_header_duration(f, offset):
+    """Duration in seconds from an mvhd or mdhd box payload"""
+    f.seek(offset)
+    version = f.read(4)[0]
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", f.read(28)[16:])
+        unknown = 0xFFFFFFFFFFFFFFFF
+    else:
+        timescale, duration = struct.unpack(">II", f.read(16)[8:])
+        unknown = 0xFFFFFFFF
+    if not timescale or duration == unknown:
+        return 0.0
+    return duration / timescale
+
+def mp4_duration(path):
+    """
+    Duration of an MP4/MOV file in seconds: the movie header's, or the longest track's when the
+    movie header has none. Fragmented MP4 without a duration in its headers reports 0.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        for kind, start, end in _boxes(f, 0, size):
+            if kind != b"moov":
+                continue
+            movie, tracks = 0.0, []
+            for child, child_start, child_end in _boxes(f, start, end):
+                if child == b"mvhd":
+                    movie = _media_header_duration(f, child_start)
+                elif child == b"trak":
+                    for box, box_start, box_end in _boxes(f, child_start, child_end):
+                        if box == b"mdia":
+                            tracks.extend(_media_header_duration(f, media_start)
+                                          for media, media_start, _ in _boxes(f, box_start, box_end) if media == b"mdhd")
+            return movie or max(tracks, default=0.0)
+    raise ValueError(f"No movie header in {path}")
+
+def media_duration(path):
+    """Duration of an MP3 or MP4 file in seconds, by extension"""
+    if os.path.splitext(path)[1].lower() == ".mp3":
+        return mp3_duration(path)
+    return mp4_duration(path)
@@ -0,0 +1,249 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans range from sub-second S3 calls to multi-minute Heygen renders
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. lisa_jobs_total{kind, status}"""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds) in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # {label values: [per-bucket counts..., +Inf count, sum]}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Callback(_Metric):
+    """
+    Metric whose values are read at scrape time from state owned by another module.
+    - func: Returns {label values tuple: value}
+    - kind: "counter" or "gauge"
+    """
+
+    def __init__(self, name, help, labelnames, func, kind="gauge"):
+        super().__init__(name, help, labelnames)
+        self.func = func
+        self.kind = kind
+
+    def _samples(self):
+        try:
+            values = self.func()
+        except Exception as e:
+            logger.warning("Could not collect metric %s: %s", self.name, e)
+            return []
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())]
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "lisa_stage_duration_seconds", "Wall time of pipeline stages (one observation per call)", ("stage", "outcome")))
+LIMITER_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "lisa_limiter_wait_seconds", "Time spent queued for a concurrency limiter before starting", ("limiter",)))
+JOB_SECONDS = REGISTRY.register(Histogram(
+    "lisa_job_duration_seconds", "End-to-end wall time of podcast jobs", ("kind", "status")))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "lisa_jobs_total", "Podcast jobs finished, by kind and status", ("kind", "status")))
+
+# Weight of the newest span in the recent mean of its stage (used by admission control's cost estimates)
+RECENT_WEIGHT = 0.2
+_recent = {}  # {stage: exponentially weighted mean of recent successful spans, in seconds}
+_recent_lock = threading.Lock()
+
+def recent_seconds(stage, default=None):
+    """Recent mean duration of successful spans of stage in this process, or default if none was recorded"""
+    with _recent_lock:
+        return _recent.get(stage, default)
+
+def _observe_recent(stage, seconds):
+    with _recent_lock:
+        previous = _recent.get(stage)
+        _recent[stage] = seconds if previous is None else previous + RECENT_WEIGHT * (seconds - previous)
+
+class JobTimings:
+    """Spans recorded while one job runs, for the per-job breakdown in the status response"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def add(self, stage, start, duration, segment=None, outcome="ok"):
+        span = {"stage": stage, "start": round(start - self._start, 3), "duration": round(duration, 3)}
+        if segment is not None:
+            span["segment"] = segment
+        if outcome != "ok":
+            span["outcome"] = outcome
+        with self._lock:
+            self.spans.append(span)
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def breakdown(self):
+        """{"wall_seconds", "stages": {stage: {"count", "total", "max"}}, "spans": [...]}"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span["stage"], {"count": 0, "total": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["total"] = round(stage["total"] + span["duration"], 3)
+            stage["max"] = max(stage["max"], span["duration"])
+        return {"wall_seconds": round(self.elapsed(), 3), "stages": stages, "spans": spans}
+
+# Timings of the job running in the current context. Worker threads see it because
+# segment work is submitted with a copy of the submitting thread's context.
+_current_job = contextvars.ContextVar("lisa_job_timings", default=None)
+
+# Index of the dialogue segment being worked on in the current context, if any
+_current_segment = contextvars.ContextVar("lisa_segment", default=None)
+
+@contextmanager
+def track_segment(idx):
+    """Label spans recorded in this context with segment idx"""
+    token = _current_segment.set(idx)
+    try:
+        yield
+    finally:
+        _current_segment.reset(token)
+
+@contextmanager
+def track_job(timings):
+    """Attribute spans recorded in this context (and copies of it) to timings"""
+    token = _current_job.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_job.reset(token)
+
+def observe(stage, seconds, segment=None, outcome="ok", start=None):
+    """Record a finished span that was timed by the caller"""
+    STAGE_SECONDS.observe(seconds, stage=stage, outcome=outcome)
+    if outcome == "ok":
+        _observe_recent(stage, seconds)
+    timings = _current_job.get()
+    if timings is not None:
+        if segment is None:
+            segment = _current_segment.get()
+        timings.add(stage, time.perf_counter() - seconds if start is None else start, seconds, segment, outcome)
+
+@contextmanager
+def span(stage, segment=None):
+    """Time the enclosed block as one span of stage"""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, segment, outcome, start)
+
+def replay(spans, started):
+    """
+    Record spans measured in another process (e.g. an offloaded segment task), whose
+    JobTimings was created at wall-clock time started.
+    """
+    # Wall-clock times are the only ones comparable between processes and machines
+    offset = time.perf_counter() - time.time()
+    for span in spans:
+        observe(span["stage"], span["duration"], span.get("segment"), span.get("outcome", "ok"),
+                start=started + span["start"] + offset)
+
+def observe_wait(limiter, seconds):
+    LIMITER_WAIT_SECONDS.observe(seconds, limiter=limiter)
@@ -1,14 +1,34 @@
-import openai
 import logging
+import threading
 from app.config import settings
+from app.utils.retry import call_with_retry
 
 logger = logging.getLogger(__name__)
 
+# The openai package takes over half a second to import, so it is loaded with the first client
+_client = None
+_client_lock = threading.Lock()
+
+def openai_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import openai
+                # Retries are handled by the shared policy so they show up in the retry metrics
+                _client = openai.OpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_BASE_URL,
+                    timeout=openai.Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+                    max_retries=0
+                )
+    return _client
+
 def generate_podcast_script(idea: str, host: str, guest: str, language: str, duration_minutes: int = 5) -> str:
-    logger.info(f"Generating podcast script for topic: '{idea}'")
-    logger.info(f"Target duration: {duration_minutes} minutes")
-    logger.info(f"Language mode: {language}")
-    logger.info(f"Using OpenAI GPT-4o-mini model")
+    logger.info("Generating podcast script for topic: '%s'", idea)
+    logger.info("Target duration: %s minutes", duration_minutes)
+    logger.info("Language mode: %s", language)
+    logger.info("Using OpenAI GPT-4o-mini model")
     
     # Calculate approximate words needed (average speaking rate is 150 words per minute)
     words_per_minute = 150
@@ -58,8 +78,8 @@ def generate_podcast_script(idea: str, host: str, guest: str, language: str, dur
         )
     
     logger.info("Sending request to OpenAI API...")
-    client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-    response = client.chat.completions.create(
+    client = openai_client()
+    response = call_with_retry(lambda: client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a helpful podcast script generator. Always format dialogue with speaker names followed by colons. DO NOT use asterisks, markdown, or any special formatting. For Hindi words, use Devanagari script (हिंदी) not Roman script (Hinglish). Use MODERN, CONVERSATIONAL Hindi that people actually speak today - casual, contemporary expressions, natural code-switching, and everyday language patterns."},
@@ -67,11 +87,11 @@ def generate_podcast_script(idea: str, host: str, guest: str, language: str, dur
         ],
         max_tokens=min(800, target_words * 2),  # Adjust max_tokens based on target length
         temperature=0.7,
-    )
+    ), "openai")
     
     script = response.choices[0].message.content.strip()
-    logger.info(f"OpenAI response received. Script length: {len(script)} characters")
-    logger.info(f"Estimated words: {len(script.split())}")
-    logger.info(f"Script preview: {script[:200]}...")
+    logger.info("OpenAI response received. Script length: %s characters", len(script))
+    logger.info("Estimated words: %s", len(script.split()))
+    logger.debug("Script preview: %s...", script[:200])
     
     return script 
\ No newline at end of file
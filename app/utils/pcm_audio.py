@@ -0,0 +1,110 @@
+"""
+PCM-native assembly of audio episodes. Clips are decoded once, mixed into a memory-mapped
+float32 buffer with NumPy (gaps, crossfades, loudness leveling) and encoded once, instead of
+being concatenated and re-encoded by ffmpeg. The merge functions here are drop-in
+replacements for merge_audio_clips / stream_audio_merge.
+"""
+import os
+import shutil
+import logging
+import subprocess
+import tempfile
+import numpy as np
+from app.utils.cancellation import run_process
+from app.utils.ffmpeg_merge import AUDIO_MERGE_CODEC, MergeStream, decode_to_pcm
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 44100
+# Samples per block when scanning the whole episode buffer, so it never has to fit in memory
+BLOCK_SAMPLES = 1 << 20
+
+def _fade(length):
+    """Equal-power fade-in curve (uncorrelated voices keep a constant loudness through a crossfade)"""
+    return np.sin(0.5 * np.pi * (np.arange(length, dtype=np.float32) + 0.5) / length)
+
+def _level(clip, target_dbfs, max_gain_db):
+    """Gain that brings the clip's RMS level to target_dbfs, limited to +/- max_gain_db"""
+    rms = np.sqrt(np.mean(np.square(clip, dtype=np.float64)))
+    if rms < 1e-6:
+        return 1.0
+    gain_db = np.clip(target_dbfs - 20 * np.log10(rms), -max_gain_db, max_gain_db)
+    return float(10 ** (gain_db / 20))
+
+def mix_clips(audio_paths, work_dir, gap_seconds=0.0, crossfade_seconds=0.0, target_dbfs=None,
+              max_gain_db=12.0, sample_rate=SAMPLE_RATE):
+    """
+    Mix audio clips, in order, into one mono float32 PCM file in work_dir.
+    - gap_seconds: Silence between consecutive clips
+    - crossfade_seconds: Length of the fade at each join; consecutive clips overlap by this much,
+      so with no gap the turns crossfade
+    - target_dbfs: RMS level every clip is brought to (None keeps the levels as they are)
+    - max_gain_db: Largest boost or cut applied by leveling
+    The episode is scaled down if the mix would clip. Returns (PCM path, duration in seconds).
+    """
+    decode_dir = tempfile.mkdtemp(dir=work_dir)
+    try:
+        pcm_paths = decode_to_pcm(audio_paths, decode_dir, sample_rate, sample_format="f32le")
+        clips = [np.memmap(path, dtype="<f4", mode="r") if os.path.getsize(path) else np.zeros(0, dtype="<f4")
+                 for path in pcm_paths]
+
+        gap = int(round(gap_seconds * sample_rate))
+        fade = int(round(crossfade_seconds * sample_rate))
+        offsets = []
+        position = 0
+        for clip in clips:
+            offsets.append(position)
+            position = max(position, position + len(clip) + gap - min(fade, len(clip) // 2))
+        total = max([offset + len(clip) for offset, clip in zip(offsets, clips)] + [0])
+
+        output_path = os.path.join(work_dir, "episode.pcm")
+        episode = np.memmap(output_path, dtype="<f4", mode="w+", shape=(max(total, 1),))  # zero-filled
+        for i, (offset, clip) in enumerate(zip(offsets, clips)):
+            if not len(clip):
+                continue
+            samples = np.array(clip, dtype=np.float32)
+            if target_dbfs is not None:
+                samples *= _level(samples, target_dbfs, max_gain_db)
+            length = min(fade, len(samples) // 2)
+            if length:
+                curve = _fade(length)
+                if i > 0:
+                    samples[:length] *= curve
+                if i < len(clips) - 1:
+                    samples[-length:] *= curve[::-1]
+            episode[offset:offset + len(samples)] += samples
+
+        peak = max((float(np.abs(episode[start:start + BLOCK_SAMPLES]).max()) for start in range(0, len(episode), BLOCK_SAMPLES)), default=0.0)
+        if peak > 1.0:
+            logger.info("Scaling episode by %.2f dB to avoid clipping", -20 * np.log10(peak))
+            for start in range(0, len(episode), BLOCK_SAMPLES):
+                episode[start:start + BLOCK_SAMPLES] /= peak
+        episode.flush()
+        del episode
+    finally:
+        shutil.rmtree(decode_dir, ignore_errors=True)
+    duration = total / sample_rate
+    logger.info("Mixed %s clips in PCM (%.1fs)", len(audio_paths), duration)
+    return output_path, duration
+
+def _encode_cmd(pcm_path, sample_rate):
+    return ["ffmpeg", "-y", "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", pcm_path] + AUDIO_MERGE_CODEC
+
+def merge_audio_pcm(audio_paths, output_path, sample_rate=SAMPLE_RATE, **mix):
+    """merge_audio_clips through mix_clips: one decode and one encode for the whole episode"""
+    logger.info("Merging %s audio clips in PCM", len(audio_paths))
+    pcm_path, _ = mix_clips(audio_paths, os.path.dirname(output_path), sample_rate=sample_rate, **mix)
+    try:
+        run_process(_encode_cmd(pcm_path, sample_rate) + [output_path])
+    except subprocess.CalledProcessError as e:
+        logger.error("FFmpeg encode failed: %s", e.stderr)
+        raise
+    finally:
+        os.remove(pcm_path)
+    return output_path
+
+def stream_audio_merge_pcm(audio_paths, work_dir, sample_rate=SAMPLE_RATE, **mix):
+    """stream_audio_merge through mix_clips; the PCM file is removed when the stream is closed"""
+    logger.info("Merging %s audio clips in PCM to a stream", len(audio_paths))
+    pcm_path, _ = mix_clips(audio_paths, work_dir, sample_rate=sample_rate, **mix)
+    return MergeStream(_encode_cmd(pcm_path, sample_rate) + ["-f", "mp3", "pipe:1"], pcm_path)
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import tracemalloc
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PREFIX = "podcasts/profiles"
+MAX_STACK_DEPTH = 64
+TOP_ALLOCATIONS = 25
+
+# tracemalloc is process-wide; it runs while at least one profiled request is active
+# (unless it was already enabled, e.g. with PYTHONTRACEMALLOC, in which case it is left alone)
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_tracemalloc_lock = threading.Lock()
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+def _fold(frame):
+    """Stack of a frame in collapsed format, root first: "file:function;file:function" """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class RequestProfiler:
+    """
+    Sampling CPU profile and tracemalloc snapshots for one job.
+    A background thread samples the stacks of the threads working on the job (the request
+    thread and its segment workers) every PROFILE_SAMPLE_INTERVAL seconds. Memory snapshots
+    are taken at pipeline stage boundaries. Time spent in ffmpeg subprocesses appears as
+    the Python frame waiting for them.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or settings.PROFILE_SAMPLE_INTERVAL
+        self.output_dir = job.workspace_path("profile")
+        self.stacks = Counter()
+        self.samples = 0
+        self.checkpoints = []
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._start = None
+        self._previous_snapshot = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        _start_tracemalloc()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.job.job_id[:8]}", daemon=True)
+        self._sampler.start()
+        self.checkpoint("start")
+        return self
+
+    def add_thread(self, ident):
+        with self._lock:
+            self._threads.add(ident)
+
+    def remove_thread(self, ident):
+        with self._lock:
+            self._threads.discard(ident)
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            stacks = [_fold(frames[ident]) for ident in threads if ident in frames]
+            with self._lock:
+                self.samples += 1
+                self.stacks.update(stacks)
+
+    def checkpoint(self, label):
+        """Record traced memory and the top allocation sites (and their growth since the previous checkpoint)"""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        if self._previous_snapshot is None:
+            stats = snapshot.statistics("lineno")
+            top = [{"site": str(stat.traceback), "size": stat.size, "count": stat.count} for stat in stats[:TOP_ALLOCATIONS]]
+        else:
+            stats = snapshot.compare_to(self._previous_snapshot, "lineno")
+            top = [{"site": str(stat.traceback), "size": stat.size, "size_diff": stat.size_diff, "count": stat.count}
+                   for stat in stats[:TOP_ALLOCATIONS]]
+        self._previous_snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self.checkpoints.append({
+                "label": label,
+                "t": round(time.perf_counter() - self._start, 3),
+                "traced_bytes": current,
+                "traced_peak_bytes": peak,
+                "top": top,
+            })
+
+    def stop(self):
+        """Stop sampling, write the profile files and return {name: URL or local path}"""
+        self.checkpoint("end")
+        self._stop.set()
+        self._sampler.join()
+        self._previous_snapshot = None
+        _stop_tracemalloc()
+        return self._publish(self._write())
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        files = {}
+
+        # Collapsed stacks, for flamegraph.pl, speedscope or inferno
+        files["cpu"] = os.path.join(self.output_dir, "cpu.folded")
+        with open(files["cpu"], "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Functions by samples in which they were on the stack (inclusive) or on top (self)
+        inclusive = Counter()
+        own = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                inclusive[name] += count
+        total = sum(self.stacks.values()) or 1
+        files["cpu_top"] = os.path.join(self.output_dir, "cpu_top.txt")
+        with open(files["cpu_top"], "w") as f:
+            f.write(f"{self.samples} samples every {self.interval * 1000:g} ms, {total} thread stacks\n\n")
+            f.write(f"{'self %':>7} {'total %':>8}  function\n")
+            for name, count in inclusive.most_common(50):
+                f.write(f"{100 * own[name] / total:>7.1f} {100 * count / total:>8.1f}  {name}\n")
+
+        files["memory"] = os.path.join(self.output_dir, "memory.json")
+        with open(files["memory"], "w") as f:
+            json.dump({"job_id": self.job.job_id, "checkpoints": self.checkpoints}, f, indent=2)
+        return files
+
+    def _publish(self, files):
+        if not settings.PROFILE_UPLOAD:
+            return files
+        from app.utils.s3 import upload_to_s3
+        links = {}
+        for name, path in files.items():
+            try:
+                links[name] = upload_to_s3(path, f"{PROFILE_PREFIX}/{self.job.job_id}/{os.path.basename(path)}")
+            except Exception as e:
+                logger.warning("Could not upload profile %s: %s", path, e)
+                links[name] = path
+        return links
+
+_active = contextvars.ContextVar("lisa_profiler", default=None)
+
+@contextmanager
+def profile_job(job, enabled):
+    """
+    Profile the enclosed pipeline run when enabled; yields a dict that is filled with the
+    profile links when the block exits. When disabled, nothing is started.
+    """
+    links = {}
+    if not enabled:
+        yield links
+        return
+    profiler = RequestProfiler(job).start()
+    token = _active.set(profiler)
+    profiler.add_thread(threading.get_ident())
+    logger.info("Profiling job %s", job.job_id)
+    try:
+        yield links
+    finally:
+        profiler.remove_thread(threading.get_ident())
+        _active.reset(token)
+        try:
+            links.update(profiler.stop())
+            logger.info("Profile for job %s: %s", job.job_id, links)
+        except Exception as e:
+            logger.warning("Could not write profile for job %s: %s", job.job_id, e)
+
+def checkpoint(label):
+    """Take a memory snapshot if the current job is being profiled"""
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.checkpoint(label)
+
+@contextmanager
+def profiled_thread():
+    """Include the current (worker) thread in the CPU samples of the job being profiled, if any"""
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profiler.add_thread(ident)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(ident)
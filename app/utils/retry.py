@@ -0,0 +1,208 @@
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import requests
+from app.config import settings
+from app.utils.metrics import REGISTRY, Callback
+from app.utils.cancellation import check_cancelled, sleep
+from app.utils.deadlines import deadline as job_deadline
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: throttling, timeouts and server-side failures
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# For non-idempotent calls (e.g. submitting a Heygen render) only retry statuses
+# that guarantee the request was not processed, so we never pay for a render twice
+NON_IDEMPOTENT_RETRYABLE_STATUS_CODES = {429, 503}
+
+# Transport errors from requests, botocore and openai, matched by class name so this
+# module does not need to import every provider SDK
+RETRYABLE_EXCEPTION_NAMES = {
+    "ConnectionError", "ConnectionResetError", "Timeout", "ChunkedEncodingError",
+    "EndpointConnectionError", "ConnectTimeoutError", "ReadTimeoutError", "ConnectionClosedError",
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+}
+# Errors that are safe to retry even when the request is not idempotent, because
+# the request never reached the provider
+PRE_SEND_EXCEPTION_NAMES = {"ConnectTimeout", "ConnectTimeoutError", "EndpointConnectionError"}
+RETRYABLE_S3_ERROR_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestTimeout", "InternalError", "ServiceUnavailable"}
+
+class ProviderError(Exception):
+    """
+    An error response from a provider API.
+    - status_code: HTTP status of the response, if any
+    - retry_after: Seconds the provider asked us to wait (Retry-After header), if any
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+# Per-provider call/retry counters: {provider: {"calls": n, "retries": n, "failures": n}}
+_retry_metrics = {}
+_metrics_lock = threading.Lock()
+
+def _count(provider, counter):
+    with _metrics_lock:
+        counters = _retry_metrics.setdefault(provider, {"calls": 0, "retries": 0, "failures": 0})
+        counters[counter] += 1
+
+def record_retry(provider):
+    """Count a retry made outside call_with_retry (e.g. a failed Heygen status poll)"""
+    _count(provider, "retries")
+
+def get_retry_metrics():
+    """Snapshot of the per-provider call, retry and failure counters"""
+    with _metrics_lock:
+        return {provider: dict(counters) for provider, counters in _retry_metrics.items()}
+
+def _counter_values(counter):
+    return lambda: {(provider,): counters[counter] for provider, counters in get_retry_metrics().items()}
+
+REGISTRY.register(Callback("lisa_provider_attempts_total", "Provider API call attempts", ("provider",),
+                           _counter_values("calls"), kind="counter"))
+REGISTRY.register(Callback("lisa_provider_retries_total", "Provider API calls retried after a transient error", ("provider",),
+                           _counter_values("retries"), kind="counter"))
+REGISTRY.register(Callback("lisa_provider_failures_total", "Provider API calls that failed after all retries", ("provider",),
+                           _counter_values("failures"), kind="counter"))
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt, base_delay=None, max_delay=None):
+    """Exponential backoff with full jitter for the given (1-based) attempt number"""
+    base_delay = settings.RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = settings.RETRY_MAX_DELAY if max_delay is None else max_delay
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        # botocore ClientError
+        response = getattr(exc, "response", None)
+        if isinstance(response, dict):
+            status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        elif response is not None:
+            # requests.HTTPError / openai.APIStatusError
+            status = getattr(response, "status_code", None)
+    return status
+
+def is_retryable(exc, idempotent=True):
+    """
+    Classify an exception as transient (worth retrying) or fatal.
+    Wrapper exceptions (e.g. boto3's S3UploadFailedError) are classified by their cause.
+    """
+    names = {cls.__name__ for cls in type(exc).__mro__}
+
+    status = _status_code(exc)
+    if status is not None:
+        allowed = RETRYABLE_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRYABLE_STATUS_CODES
+        if status in allowed:
+            return True
+        if "ClientError" in names:
+            code = exc.response.get("Error", {}).get("Code")
+            return idempotent and code in RETRYABLE_S3_ERROR_CODES
+        return False
+
+    if not idempotent:
+        return bool(names & PRE_SEND_EXCEPTION_NAMES)
+    if names & RETRYABLE_EXCEPTION_NAMES:
+        return True
+
+    cause = exc.__cause__ or exc.__context__
+    if cause is not None and cause is not exc:
+        return is_retryable(cause, idempotent)
+    return False
+
+def _retry_after(exc):
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is None:
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is not None:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+    return retry_after
+
+def call_with_retry(func, provider, idempotent=True, max_attempts=None, deadline=None, slot=None):
+    """
+    Call func() and retry transient failures with jittered exponential backoff.
+    - provider: Name used for logging and metrics (e.g. "elevenlabs")
+    - idempotent: If False, only retry errors that guarantee the call was not processed
+    - max_attempts: Total attempts including the first (defaults to RETRY_MAX_ATTEMPTS)
+    - deadline: Optional time.monotonic() value after which no further retries are made
+      (defaults to the current job's deadline, see app.utils.deadlines)
+    - slot: Optional context manager factory entered around each attempt (e.g. a provider
+      slot, see app.services.scheduler), so it is not held during backoff
+    A Retry-After from the provider is respected when it is longer than the backoff delay.
+    Nothing is sent once the current job has been cancelled, and backoff ends early.
+    """
+    max_attempts = max_attempts or settings.RETRY_MAX_ATTEMPTS
+    deadline = deadline if deadline is not None else job_deadline()
+    attempt = 0
+    while True:
+        attempt += 1
+        check_cancelled()
+        _count(provider, "calls")
+        try:
+            if slot is None:
+                return func()
+            with slot():
+                return func()
+        except Exception as exc:
+            if not is_retryable(exc, idempotent) or attempt >= max_attempts:
+                _count(provider, "failures")
+                raise
+
+            delay = backoff_delay(attempt)
+            retry_after = _retry_after(exc)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, settings.RETRY_MAX_DELAY))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                logger.warning("%s: not retrying after %s, deadline would be exceeded", provider, exc)
+                _count(provider, "failures")
+                raise
+
+            _count(provider, "retries")
+            logger.warning("%s: attempt %s/%s failed (%s), retrying in %.2fs", provider, attempt, max_attempts, exc, delay)
+            sleep(delay)
+
+def http_timeout():
+    """(connect, read) timeout tuple for requests calls"""
+    return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+def send(method, url, provider, **kwargs):
+    """
+    Make a single HTTP request with connect/read timeouts.
+    Raises ProviderError for non-2xx responses, carrying the status code and Retry-After.
+    """
+    kwargs.setdefault("timeout", http_timeout())
+    response = requests.request(method, url, **kwargs)
+    if response.status_code >= 400:
+        raise ProviderError(
+            f"{provider} error (HTTP {response.status_code}): {response.text}",
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get("Retry-After"))
+        )
+    return response
+
+def request_with_retry(method, url, provider, idempotent=True, deadline=None, **kwargs):
+    """send() wrapped in the shared retry policy"""
+    return call_with_retry(lambda: send(method, url, provider, **kwargs), provider,
+                           idempotent=idempotent, deadline=deadline)
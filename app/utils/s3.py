@@ -1,26 +1,273 @@
-import boto3
+import json
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from app.config import settings
+from app.utils.retry import call_with_retry
+from app.utils.hashing import file_digest
 
 logger = logging.getLogger(__name__)
 
-s3 = boto3.client(
-    "s3",
-    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-)
+# Created on first use: importing boto3 and building a client costs a few hundred
+# milliseconds, which would otherwise be paid on every cold start before serving anything
+_client = None
+_client_lock = threading.Lock()
 
-def upload_to_s3(file_path, s3_key):
-    logger.info(f"Uploading file to S3: {file_path}")
-    logger.info(f"S3 key: {s3_key}")
-    logger.info(f"S3 bucket: {settings.AWS_S3_BUCKET}")
+def s3_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import boto3
+                from botocore.config import Config
+                _client = boto3.client(
+                    "s3",
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    endpoint_url=settings.S3_ENDPOINT_URL,
+                    config=Config(
+                        connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+                        read_timeout=settings.HTTP_READ_TIMEOUT,
+                        # botocore's own retries are disabled so every retry goes through the shared policy
+                        retries={"total_max_attempts": 1}
+                    )
+                )
+    return _client
+
+def object_url(s3_key):
+    """Public URL of an object in the podcast bucket"""
+    if settings.S3_ENDPOINT_URL:
+        # Custom endpoints (S3-compatible stores, local fakes) use path-style URLs
+        return f"{settings.S3_ENDPOINT_URL.rstrip('/')}/{settings.AWS_S3_BUCKET}/{s3_key}"
+    return f"https://{settings.AWS_S3_BUCKET}.s3.amazonaws.com/{s3_key}"
+
+def key_from_url(url):
+    """Inverse of object_url; returns None for URLs outside the podcast bucket"""
+    prefix = object_url("")
+    return url[len(prefix):] if url.startswith(prefix) else None
+
+def _is_not_found(exc):
+    code = getattr(exc, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+def _none_if_missing(func):
+    """Wrap an S3 call so a missing object returns None, rather than counting as a failed call"""
+    def call():
+        try:
+            return func()
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+    return call
+
+def object_exists(s3_key):
+    """HEAD an object; returns its metadata dict, or None if it does not exist"""
+    return call_with_retry(_none_if_missing(lambda: s3_client().head_object(Bucket=settings.AWS_S3_BUCKET, Key=s3_key)), "s3")
+
+def put_json(s3_key, data):
+    body = json.dumps(data).encode("utf-8")
+    call_with_retry(lambda: s3_client().put_object(Bucket=settings.AWS_S3_BUCKET, Key=s3_key, Body=body,
+                                                   ContentType="application/json"), "s3")
+
+def put_text(s3_key, text, content_type, cache_control=None):
+    """Write a small text object, e.g. a playlist that players re-fetch while it grows"""
+    extra = {"CacheControl": cache_control} if cache_control else {}
+    call_with_retry(lambda: s3_client().put_object(Bucket=settings.AWS_S3_BUCKET, Key=s3_key, Body=text.encode("utf-8"),
+                                                   ContentType=content_type, **extra), "s3")
+    return object_url(s3_key)
+
+def get_json(s3_key):
+    """Read a JSON object; returns None if it does not exist"""
+    response = call_with_retry(_none_if_missing(lambda: s3_client().get_object(Bucket=settings.AWS_S3_BUCKET, Key=s3_key)), "s3")
+    if response is None:
+        return None
+    return json.loads(response["Body"].read())
+
+def delete_object(s3_key):
+    call_with_retry(lambda: s3_client().delete_object(Bucket=settings.AWS_S3_BUCKET, Key=s3_key), "s3")
+
+def upload_to_s3(file_path, s3_key, content_type=None):
+    logger.info("Uploading file to S3: %s", file_path)
+    logger.info("S3 key: %s", s3_key)
+    logger.info("S3 bucket: %s", settings.AWS_S3_BUCKET)
     
+    extra_args = {"ContentType": content_type} if content_type else None
     try:
-        s3.upload_file(file_path, settings.AWS_S3_BUCKET, s3_key)
-        url = f"https://{settings.AWS_S3_BUCKET}.s3.amazonaws.com/{s3_key}"
-        logger.info(f"File uploaded successfully to: {url}")
+        call_with_retry(lambda: s3_client().upload_file(file_path, settings.AWS_S3_BUCKET, s3_key, ExtraArgs=extra_args), "s3")
+        url = object_url(s3_key)
+        logger.info("File uploaded successfully to: %s", url)
         return url
     except Exception as e:
         error_msg = f"S3 upload failed: {str(e)}"
         logger.error(error_msg)
-        raise Exception(error_msg) 
\ No newline at end of file
+        raise Exception(error_msg)
+
+def download_from_s3(s3_key, file_path):
+    """Download an object to file_path; returns None if it does not exist"""
+    return call_with_retry(_none_if_missing(lambda: s3_client().download_file(settings.AWS_S3_BUCKET, s3_key, file_path) or file_path), "s3")
+
+MIN_PART_SIZE = 5 * 1024 ** 2  # S3 minimum for every part but the last
+
+def upload_stream(stream, s3_key, content_type=None, before_complete=None):
+    """
+    Upload a file-like stream of unknown length with a multipart upload, sending parts in
+    parallel while the stream is still being produced. At most S3_UPLOAD_CONCURRENCY + 1
+    parts of S3_PART_SIZE are held in memory. The upload is aborted on any error.
+    - before_complete: Called once the stream is exhausted and every part is uploaded; raising
+      from it aborts the upload (e.g. when the producer of the stream exited with an error)
+    Returns the object URL.
+    """
+    part_size = max(settings.S3_PART_SIZE, MIN_PART_SIZE)
+    extra = {"ContentType": content_type} if content_type else {}
+    upload_id = call_with_retry(lambda: s3_client().create_multipart_upload(
+        Bucket=settings.AWS_S3_BUCKET, Key=s3_key, **extra)["UploadId"], "s3")
+    logger.info("Streaming upload to S3: %s (upload ID %s)", s3_key, upload_id)
+
+    def upload_part(number, body):
+        try:
+            response = call_with_retry(lambda: s3_client().upload_part(
+                Bucket=settings.AWS_S3_BUCKET, Key=s3_key, UploadId=upload_id, PartNumber=number, Body=body), "s3")
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        finally:
+            buffered.release()
+
+    buffered = threading.BoundedSemaphore(settings.S3_UPLOAD_CONCURRENCY + 1)
+    futures = []
+    size = 0
+    try:
+        with ThreadPoolExecutor(max_workers=settings.S3_UPLOAD_CONCURRENCY, thread_name_prefix="s3-part") as executor:
+            while True:
+                buffered.acquire()
+                body = stream.read(part_size)
+                if not body and futures:
+                    buffered.release()
+                    break
+                size += len(body)
+                futures.append(executor.submit(upload_part, len(futures) + 1, body))
+                if not body:
+                    # An empty stream still needs one (empty) part
+                    break
+                # Surface a failed part now rather than after reading the whole stream
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise future.exception()
+            parts = [future.result() for future in futures]
+        if before_complete:
+            before_complete()
+        call_with_retry(lambda: s3_client().complete_multipart_upload(
+            Bucket=settings.AWS_S3_BUCKET, Key=s3_key, UploadId=upload_id, MultipartUpload={"Parts": parts}), "s3")
+    except BaseException:
+        logger.error("Streaming upload to %s failed, aborting", s3_key)
+        try:
+            s3_client().abort_multipart_upload(Bucket=settings.AWS_S3_BUCKET, Key=s3_key, UploadId=upload_id)
+        except Exception as e:
+            logger.warning("Could not abort multipart upload %s: %s", upload_id, e)
+        raise
+    url = object_url(s3_key)
+    logger.info("Streamed %s bytes in %s parts to: %s", size, len(parts), url)
+    return url
+
+# Content-addressed intermediates (e.g. segment audio handed to Heygen)
+INTERMEDIATE_PREFIX = "podcasts/intermediate"
+DELETE_BATCH_SIZE = 1000  # DeleteObjects limit
+
+# Local index of intermediates this container uploaded or verified: {s3_key: upload time}
+_known_intermediates = {}
+_intermediates_lock = threading.Lock()
+
+def upload_content_addressed(file_path, prefix=INTERMEDIATE_PREFIX, extension=""):
+    """
+    Upload a file under a key derived from its SHA-256, skipping the upload when an
+    identical object already exists (checked against a local index, then with HEAD).
+    Objects older than half of INTERMEDIATE_TTL_SECONDS are re-uploaded, which refreshes
+    their LastModified so garbage collection never removes an object a job is about to use.
+    Returns the object URL.
+    """
+    s3_key = f"{prefix}/{file_digest(file_path)}{extension}"
+    fresh_after = time.time() - settings.INTERMEDIATE_TTL_SECONDS / 2
+
+    with _intermediates_lock:
+        uploaded_at = _known_intermediates.get(s3_key)
+    if uploaded_at is None:
+        metadata = object_exists(s3_key)
+        if metadata is not None:
+            uploaded_at = metadata["LastModified"].timestamp()
+
+    if uploaded_at is not None and uploaded_at > fresh_after:
+        logger.info("Intermediate already in S3, skipping upload: %s", s3_key)
+        url = object_url(s3_key)
+    else:
+        url = upload_to_s3(file_path, s3_key)
+        uploaded_at = time.time()
+
+    with _intermediates_lock:
+        _known_intermediates[s3_key] = uploaded_at
+    return url
+
+def delete_expired(prefix, max_age_seconds):
+    """
+    Batch-delete objects under prefix whose LastModified is older than max_age_seconds,
+    using DeleteObjects (up to 1000 keys per call). Returns the number of deleted objects.
+    """
+    cutoff = time.time() - max_age_seconds
+    expired = [obj["Key"] for obj in _list_objects(prefix) if obj["LastModified"].timestamp() < cutoff]
+    deleted = _delete_keys(expired)
+
+    with _intermediates_lock:
+        for key in expired:
+            _known_intermediates.pop(key, None)
+    logger.info("Deleted %s expired objects under %s", deleted, prefix)
+    return deleted
+
+def delete_prefix(prefix):
+    """Batch-delete every object under prefix (e.g. the HLS fragments of a cancelled job)"""
+    deleted = _delete_keys([obj["Key"] for obj in _list_objects(prefix)])
+    logger.info("Deleted %s objects under %s", deleted, prefix)
+    return deleted
+
+def _list_objects(prefix):
+    paginator = s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=settings.AWS_S3_BUCKET, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+def _delete_keys(keys):
+    """Delete keys with DeleteObjects, DELETE_BATCH_SIZE at a time; returns the number deleted"""
+    deleted = 0
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        response = call_with_retry(lambda: s3_client().delete_objects(
+            Bucket=settings.AWS_S3_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        ), "s3")
+        for error in response.get("Errors", []):
+            logger.warning("Could not delete %s: %s", error['Key'], error.get('Message'))
+        deleted += len(batch) - len(response.get("Errors", []))
+    return deleted
+
+_last_gc = 0.0
+_gc_lock = threading.Lock()
+
+def collect_garbage(force=False):
+    """
+    Delete expired intermediates under every INTERMEDIATE_GC_PREFIXES prefix.
+    Unless forced, runs at most once per INTERMEDIATE_GC_INTERVAL_SECONDS per process.
+    Returns the number of deleted objects, or None if skipped.
+    """
+    global _last_gc
+    with _gc_lock:
+        if not force and time.time() - _last_gc < settings.INTERMEDIATE_GC_INTERVAL_SECONDS:
+            return None
+        _last_gc = time.time()
+    deleted = 0
+    for prefix in settings.INTERMEDIATE_GC_PREFIXES:
+        try:
+            deleted += delete_expired(prefix, settings.INTERMEDIATE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning("Garbage collection failed for %s: %s", prefix, e)
+    return deleted
+
+def collect_garbage_in_background():
+    """Run collect_garbage on a daemon thread so it never delays a response"""
+    threading.Thread(target=collect_garbage, name="s3-gc", daemon=True).start()
@@ -0,0 +1,155 @@
+"""
+Cold-start benchmark: import time of the app modules and time to first response of a fresh server.
+
+    python -m benchmarks.cold_start --modules app.main,modal_app --target app.main:app --runs 5
+
+Import time comes from `python -X importtime` in a fresh interpreter per run, reported as the
+total for the module plus the packages that account for most of it. Time to first response
+spawns the app under uvicorn (as a container start would), waits until it answers, then sends
+one audio podcast request against the local provider fakes; a second request shows the warm
+latency for comparison.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import statistics
+import subprocess
+from collections import defaultdict
+
+import requests
+
+from benchmarks.fakes import FakeConfig, FakeProviders, FakeS3, add_fake_arguments
+from benchmarks.load_test import ServerProcess, REPO_ROOT
+from benchmarks.run_pipeline import request_payload, app_environment
+
+logger = logging.getLogger("benchmarks.cold_start")
+
+def parse_importtime(output):
+    """[(module, self_us, cumulative_us)] from the stderr of python -X importtime"""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+def import_time(module, runs):
+    """Median import time of module in a fresh interpreter, and the packages it spends it in"""
+    totals = []
+    walls = []
+    by_package = defaultdict(list)
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+        entries = parse_importtime(result.stderr)
+        totals.append(next(cumulative for name, _, cumulative in entries if name == module) / 1e6)
+        packages = defaultdict(int)
+        for name, self_us, _ in entries:
+            packages[name.split(".")[0]] += self_us
+        for package, self_us in packages.items():
+            by_package[package].append(self_us / 1e6)
+    return {
+        "module": module,
+        "runs": runs,
+        "import_seconds": statistics.median(totals),
+        "interpreter_seconds": statistics.median(walls),
+        "packages": dict(sorted(((package, statistics.median(samples)) for package, samples in by_package.items()),
+                                key=lambda item: -item[1])),
+    }
+
+def timed_payload(segments, input_type):
+    """Audio request; "script" input skips script generation, and with it the OpenAI client"""
+    payload = request_payload("audio", segments)
+    if input_type == "script":
+        payload["input_type"] = "script"
+        payload["input_text"] = "\n".join(f"{'Host' if idx % 2 == 0 else 'Guest'}: Cold start line {idx + 1}."
+                                          for idx in range(segments))
+    return payload
+
+def first_request(target, runs, providers, s3, work_dir, segments, input_type="idea", log_file=None):
+    """Startup, first-request and warm-request latency of fresh server processes"""
+    samples = defaultdict(list)
+    for run in range(runs):
+        server = ServerProcess(target, app_environment(providers, s3), os.path.join(work_dir, f"tmp_{run}"))
+        try:
+            server.start(log_file=log_file, poll_interval=0.01)
+            for label in ("first_request", "warm_request"):
+                start = time.perf_counter()
+                response = requests.post(f"{server.base_url}/v1/lisa-audio-podcast",
+                                         json=timed_payload(segments, input_type), timeout=300)
+                response.raise_for_status()
+                samples[label].append(time.perf_counter() - start)
+            samples["startup"].append(server.startup_seconds)
+            samples["time_to_first_response"].append(server.startup_seconds + samples["first_request"][-1])
+        finally:
+            server.stop()
+    medians = {label: statistics.median(values) for label, values in samples.items()}
+    return {"target": target, "input_type": input_type, "runs": runs, **medians}
+
+def print_report(imports, requests_result):
+    for result in imports:
+        print(f"\nimport {result['module']}: {result['import_seconds']:.3f}s "
+              f"(interpreter start to exit {result['interpreter_seconds']:.3f}s, median of {result['runs']})")
+        for package, seconds in list(result["packages"].items())[:12]:
+            print(f"  {package:<24} {seconds * 1000:8.1f} ms")
+    if requests_result:
+        print(f"\n{requests_result['target']}, {requests_result['input_type']} input (median of {requests_result['runs']} fresh servers)")
+        for label in ("startup", "first_request", "warm_request", "time_to_first_response"):
+            print(f"  {label:<24} {requests_result[label]:8.3f}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and time to first response of a cold server")
+    parser.add_argument("--modules", default="app.main,modal_app", help="Comma-separated modules to time the import of")
+    parser.add_argument("--target", default="app.main:app", help="ASGI app for the first-request measurement; empty to skip")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters / servers per measurement")
+    parser.add_argument("--segments", type=int, default=2, help="Dialogue segments of the timed request")
+    parser.add_argument("--input-type", default="idea", choices=["idea", "script"], help="Input type of the timed request")
+    add_fake_arguments(parser)
+    parser.add_argument("--work-dir", default=None, help="Directory for fixtures and server temp dirs (default: a temp dir)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    imports = [import_time(module, args.runs) for module in args.modules.split(",") if module]
+
+    requests_result = None
+    if args.target:
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix="lisa_cold_")
+        config = FakeConfig.from_args(args)
+        config.script_lines = args.segments
+        providers = FakeProviders(config, os.path.join(work_dir, "fixtures")).start()
+        s3 = FakeS3().start()
+        server_log = None if args.verbose else open(os.path.join(work_dir, "server.log"), "wb")
+        try:
+            requests_result = first_request(args.target, args.runs, providers, s3, work_dir, args.segments,
+                                           args.input_type, server_log)
+        finally:
+            providers.stop()
+            s3.stop()
+            if server_log:
+                server_log.close()
+
+    print_report(imports, requests_result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "imports": imports, "first_request": requests_result}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Local stand-ins for OpenAI, ElevenLabs, Heygen and S3, so the pipeline can be measured
+without API keys. Latency, error rate and payload size of every fake endpoint are configurable.
+"""
+import os
+import json
+import math
+import time
+import uuid
+import base64
+import random
+import logging
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+class LatencyModel:
+    """
+    A latency distribution in seconds.
+    - kind: "fixed", "uniform" or "lognormal"
+    - a, b: fixed -> (value, unused); uniform -> (low, high); lognormal -> (median, sigma)
+    """
+
+    def __init__(self, kind="fixed", a=0.0, b=0.0):
+        self.kind = kind
+        self.a = a
+        self.b = b
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse "fixed:0.1", "uniform:0.1:0.5" or "lognormal:0.3:0.5" """
+        parts = spec.split(":")
+        values = [float(value) for value in parts[1:]] + [0.0, 0.0]
+        return cls(parts[0], values[0], values[1])
+
+    def sample(self):
+        if self.kind == "uniform":
+            return random.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return random.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        return self.a
+
+    def __repr__(self):
+        return f"{self.kind}:{self.a}:{self.b}"
+
+class FakeConfig:
+    """Behaviour of the fake providers"""
+
+    def __init__(self, openai_latency="fixed:0.5", tts_latency="lognormal:0.4:0.3",
+                 heygen_submit_latency="fixed:0.2", heygen_render_latency="lognormal:2.0:0.3",
+                 download_latency="fixed:0.05", error_rate=0.0, audio_seconds=5.0, render_seconds=None,
+                 video_width=1280, video_height=720, script_lines=10, host_name="Host", guest_name="Guest"):
+        self.openai_latency = LatencyModel.parse(openai_latency)
+        self.tts_latency = LatencyModel.parse(tts_latency)
+        self.heygen_submit_latency = LatencyModel.parse(heygen_submit_latency)
+        self.heygen_render_latency = LatencyModel.parse(heygen_render_latency)
+        self.download_latency = LatencyModel.parse(download_latency)
+        self.error_rate = error_rate
+        self.audio_seconds = audio_seconds
+        self.render_seconds = render_seconds or audio_seconds
+        self.video_width = video_width
+        self.video_height = video_height
+        self.script_lines = script_lines
+        self.host_name = host_name
+        self.guest_name = guest_name
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            openai_latency=args.openai_latency,
+            tts_latency=args.tts_latency,
+            heygen_submit_latency=args.heygen_submit_latency,
+            heygen_render_latency=args.heygen_render_latency,
+            download_latency=args.download_latency,
+            error_rate=args.error_rate,
+            audio_seconds=args.audio_seconds,
+            render_seconds=args.render_seconds,
+        )
+
+def add_fake_arguments(parser):
+    """Command line options for FakeConfig, shared by the benchmark scripts"""
+    parser.add_argument("--openai-latency", default="fixed:0.5", help="Latency model, e.g. fixed:0.5, uniform:0.2:1, lognormal:0.5:0.3")
+    parser.add_argument("--tts-latency", default="lognormal:0.4:0.3")
+    parser.add_argument("--heygen-submit-latency", default="fixed:0.2")
+    parser.add_argument("--heygen-render-latency", default="lognormal:2.0:0.3")
+    parser.add_argument("--download-latency", default="fixed:0.05")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 429/500/503 per provider call")
+    parser.add_argument("--audio-seconds", type=float, default=5.0, help="Length (and so payload size) of each fake segment")
+    parser.add_argument("--render-seconds", type=float, default=None,
+                        help="Length of fake Heygen renders (default: --audio-seconds); per-speaker renders need a whole speaker's lines")
+
+def make_fixtures(directory, audio_seconds=5.0, width=1280, height=720, render_seconds=None):
+    """
+    Generate the MP3 returned by fake ElevenLabs and the MP4 returned by fake Heygen.
+    Payload size scales with audio_seconds (and render_seconds, default audio_seconds). Requires ffmpeg.
+    """
+    render_seconds = render_seconds or audio_seconds
+    os.makedirs(directory, exist_ok=True)
+    mp3_path = os.path.join(directory, f"tts_{audio_seconds:g}s.mp3")
+    mp4_path = os.path.join(directory, f"render_{width}x{height}_{render_seconds:g}s.mp4")
+    if not os.path.exists(mp3_path):
+        subprocess.run([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency=220:duration={audio_seconds}",
+            "-ac", "1", "-ar", "44100", "-acodec", "libmp3lame", "-ab", "128k", mp3_path
+        ], check=True, capture_output=True)
+    if not os.path.exists(mp4_path):
+        subprocess.run([
+            "ffmpeg", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate=25:duration={render_seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={render_seconds}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest", mp4_path
+        ], check=True, capture_output=True)
+    return mp3_path, mp4_path
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_file(self, path, content_type, trailer=b""):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(os.path.getsize(path) + len(trailer)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+        self.wfile.write(trailer)
+
+    def _maybe_fail(self, endpoint):
+        """Inject a transient provider error with the configured probability"""
+        if random.random() >= self.fake.config.error_rate:
+            return False
+        self.fake.count(f"{endpoint}_errors")
+        status = random.choice([429, 500, 503])
+        self._send_json(status, {"error": "injected failure"}, {"Retry-After": "0"} if status == 429 else None)
+        return True
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        if path.endswith("/chat/completions"):
+            self._openai_chat()
+        elif path.startswith("/v1/text-to-speech/") and path.endswith("/with-timestamps"):
+            self._elevenlabs_tts_with_timestamps(json.loads(body))
+        elif path.startswith("/v1/text-to-speech/"):
+            self._elevenlabs_tts()
+        elif path == "/v2/video/generate":
+            self._heygen_generate()
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {path}"})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/v1/video_status.get":
+            self._heygen_status(parse_qs(parsed.query).get("video_id", [""])[0])
+        elif parsed.path.startswith("/files/"):
+            self._heygen_download()
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {parsed.path}"})
+
+    def _openai_chat(self):
+        config = self.fake.config
+        time.sleep(config.openai_latency.sample())
+        if self._maybe_fail("openai"):
+            return
+        self.fake.count("openai_requests")
+        lines = []
+        for i in range(config.script_lines):
+            speaker = config.host_name if i % 2 == 0 else config.guest_name
+            lines.append(f"{speaker}: This is generated line {i + 1} of the benchmark conversation, nonce {uuid.uuid4().hex[:8]}.")
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-4o-mini",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "\n".join(lines)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def _elevenlabs_tts(self):
+        time.sleep(self.fake.config.tts_latency.sample())
+        if self._maybe_fail("elevenlabs"):
+            return
+        self.fake.count("elevenlabs_requests")
+        # A unique ID3v1 tag makes every response byte-distinct, like real TTS output,
+        # so the render cache does not short-circuit the Heygen stage
+        tag = b"TAG" + uuid.uuid4().hex.encode("ascii").ljust(30, b"\0") + b"\0" * 94 + b"\xff"
+        self._send_file(self.fake.mp3_path, "audio/mpeg", trailer=tag)
+
+    def _elevenlabs_tts_with_timestamps(self, request):
+        """
+        Every paragraph of the text is read as one fixture-length clip (the fixture MP3 repeated),
+        with its characters spread evenly over the clip after a short lead-in and before a pause
+        that the paragraph break falls into.
+        """
+        time.sleep(self.fake.config.tts_latency.sample())
+        if self._maybe_fail("elevenlabs"):
+            return
+        self.fake.count("elevenlabs_requests")
+        paragraphs = request["text"].split("\n\n")
+        seconds = self.fake.config.audio_seconds
+        lead, pause = 0.05 * seconds, 0.15 * seconds
+        characters, starts, ends = [], [], []
+
+        def spread(chars, begin, end):
+            step = (end - begin) / max(1, len(chars))
+            for i, char in enumerate(chars):
+                characters.append(char)
+                starts.append(round(begin + i * step, 3))
+                ends.append(round(begin + (i + 1) * step, 3))
+
+        for i, paragraph in enumerate(paragraphs):
+            if i:
+                spread("\n\n", i * seconds - pause, i * seconds + lead)
+            spread(paragraph, i * seconds + lead, (i + 1) * seconds - pause)
+        with open(self.fake.mp3_path, "rb") as f:
+            clip = f.read()
+        # Unique like real TTS output (see _elevenlabs_tts)
+        tag = b"TAG" + uuid.uuid4().hex.encode("ascii").ljust(30, b"\0") + b"\0" * 94 + b"\xff"
+        alignment = {"characters": characters, "character_start_times_seconds": starts, "character_end_times_seconds": ends}
+        self._send_json(200, {
+            "audio_base64": base64.b64encode(clip * len(paragraphs) + tag).decode("ascii"),
+            "alignment": alignment,
+            "normalized_alignment": alignment,
+        })
+
+    def _heygen_generate(self):
+        time.sleep(self.fake.config.heygen_submit_latency.sample())
+        if self._maybe_fail("heygen"):
+            return
+        self.fake.count("heygen_renders")
+        video_id = uuid.uuid4().hex
+        with self.fake.lock:
+            self.fake.renders[video_id] = time.monotonic() + self.fake.config.heygen_render_latency.sample()
+        self._send_json(200, {"error": None, "data": {"video_id": video_id}})
+
+    def _heygen_status(self, video_id):
+        with self.fake.lock:
+            ready_at = self.fake.renders.get(video_id)
+        if ready_at is None:
+            self._send_json(200, {"error": None, "data": {"status": "failed", "error": "unknown video_id"}})
+        elif time.monotonic() < ready_at:
+            self._send_json(200, {"error": None, "data": {"status": "processing"}})
+        else:
+            self._send_json(200, {"error": None, "data": {
+                "status": "completed",
+                "video_url": f"{self.fake.base_url}/files/{video_id}.mp4"
+            }})
+
+    def _heygen_download(self):
+        time.sleep(self.fake.config.download_latency.sample())
+        self.fake.count("heygen_downloads")
+        self._send_file(self.fake.mp4_path, "video/mp4")
+
+class FakeProviders:
+    """
+    One local HTTP server that speaks enough of the OpenAI, ElevenLabs and Heygen APIs
+    for the pipeline. Point OPENAI_BASE_URL at base_url + "/v1" and ELEVENLABS_BASE_URL /
+    HEYGEN_BASE_URL at base_url.
+    """
+
+    def __init__(self, config, fixtures_dir, host="127.0.0.1", port=0):
+        self.config = config
+        self.mp3_path, self.mp4_path = make_fixtures(
+            fixtures_dir, config.audio_seconds, config.video_width, config.video_height, config.render_seconds)
+        self.lock = threading.Lock()
+        self.renders = {}  # {video_id: monotonic time the render completes}
+        self.counters = {}
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-providers", daemon=True)
+        self._thread.start()
+        logger.info(f"Fake providers listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def environment(self):
+        """Environment variables that point the app at these fakes"""
+        return {
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "OPENAI_API_KEY": "fake",
+            "ELEVENLABS_BASE_URL": self.base_url,
+            "ELEVENLABS_API_KEY": "fake",
+            "HEYGEN_BASE_URL": self.base_url,
+            "HEYGEN_API_KEY": "fake",
+        }
+
+class FakeS3:
+    """moto's S3 server on a local port, with the podcast bucket created"""
+
+    def __init__(self, bucket="lisa-benchmark", host="127.0.0.1", port=0):
+        from moto.server import ThreadedMotoServer
+        self.bucket = bucket
+        self._server = ThreadedMotoServer(ip_address=host, port=port)
+
+    @property
+    def endpoint_url(self):
+        host, port = self._server.get_host_and_port()
+        return f"http://{host}:{port}"
+
+    def start(self):
+        import boto3
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # moto logs every request otherwise
+        self._server.start()
+        boto3.client(
+            "s3", endpoint_url=self.endpoint_url, region_name="us-east-1",
+            aws_access_key_id="fake", aws_secret_access_key="fake"
+        ).create_bucket(Bucket=self.bucket)
+        logger.info(f"Fake S3 listening on {self.endpoint_url}")
+        return self
+
+    def stop(self):
+        self._server.stop()
+
+    def environment(self):
+        return {
+            "S3_ENDPOINT_URL": self.endpoint_url,
+            "AWS_S3_BUCKET_NAME": self.bucket,
+            "AWS_ACCESS_KEY_ID": "fake",
+            "AWS_SECRET_ACCESS_KEY": "fake",
+            "AWS_DEFAULT_REGION": "us-east-1",
+        }
@@ -0,0 +1,390 @@
+"""
+HTTP load and soak test of the podcast API against local provider fakes.
+
+    python -m benchmarks.load_test --target app.main:app --rates 0.25,0.5,1,2 --step-seconds 120
+    python -m benchmarks.load_test --target modal_app:web_app --rates 0.5 --step-seconds 3600   # soak
+
+The target ASGI app runs under uvicorn in a child process (one process is one container).
+Requests arrive as a Poisson process at each offered rate in turn, with a configurable mix of
+audio and video jobs. Async APIs that answer with a task_id (modal_app_simple_async) are
+polled until the task finishes. Each step reports throughput, latency percentiles and errors;
+the server's threads, open file descriptors, RSS and temp-disk usage are sampled throughout,
+and their growth rate over the run is reported to spot leaks on long soaks.
+
+Resource sampling reads /proc and so needs Linux.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fakes import FakeConfig, FakeProviders, FakeS3, add_fake_arguments
+from benchmarks.run_pipeline import percentile, request_payload, app_environment
+
+logger = logging.getLogger("benchmarks.load_test")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class ServerProcess:
+    """The target app under uvicorn in a child process with its own temp directory"""
+
+    def __init__(self, target, env, tmp_dir, port=None):
+        self.target = target
+        self.tmp_dir = tmp_dir
+        self.port = port or _free_port()
+        self.env = dict(os.environ, **env, TMPDIR=tmp_dir, PYTHONPATH=REPO_ROOT)
+        self.process = None
+        self.startup_seconds = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=60, log_file=None, poll_interval=0.2):
+        """Spawn the server and wait until it answers; startup_seconds is the time that took"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        spawned = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", self.target, "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=REPO_ROOT, env=self.env, stdout=log_file, stderr=subprocess.STDOUT if log_file else None
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.target} exited with code {self.process.returncode} during startup")
+            try:
+                requests.get(f"{self.base_url}/docs", timeout=1)
+                self.startup_seconds = time.perf_counter() - spawned
+                logger.info(f"{self.target} listening on {self.base_url} (pid {self.process.pid})")
+                return self
+            except requests.RequestException:
+                time.sleep(poll_interval)
+        self.stop()
+        raise RuntimeError(f"{self.target} did not start within {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def sample(self):
+        """Current threads, open file descriptors, RSS and temp-disk usage of the server"""
+        pid = self.process.pid
+        sample = {"threads": None, "rss_bytes": None, "open_fds": None}
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("Threads:"):
+                        sample["threads"] = int(line.split()[1])
+                    elif line.startswith("VmRSS:"):
+                        sample["rss_bytes"] = int(line.split()[1]) * 1024
+            sample["open_fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+        except OSError:
+            pass
+        sample["tmp_bytes"] = _directory_bytes(self.tmp_dir)
+        return sample
+
+class ResourceMonitor:
+    """Samples the server every interval seconds in the background"""
+
+    def __init__(self, server, interval=1.0):
+        self.server = server
+        self.interval = interval
+        self.samples = []
+        self.in_flight = lambda: 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    def start(self):
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            sample = self.server.sample()
+            sample["t"] = time.monotonic() - self._start
+            sample["in_flight"] = self.in_flight()
+            self.samples.append(sample)
+            if self._stop.wait(self.interval):
+                break
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        """Peak, final and growth per hour (least-squares slope) of each sampled metric"""
+        summary = {}
+        for metric in ("threads", "open_fds", "rss_bytes", "tmp_bytes", "in_flight"):
+            points = [(s["t"], s[metric]) for s in self.samples if s.get(metric) is not None]
+            if not points:
+                continue
+            n = len(points)
+            mean_t = sum(t for t, _ in points) / n
+            mean_v = sum(v for _, v in points) / n
+            var_t = sum((t - mean_t) ** 2 for t, _ in points)
+            slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t if var_t else 0.0
+            summary[metric] = {"peak": max(v for _, v in points), "final": points[-1][1], "growth_per_hour": slope * 3600}
+        return summary
+
+class LoadGenerator:
+    """Open-loop Poisson arrivals of audio/video requests against one server"""
+
+    def __init__(self, base_url, video_fraction, segments, orientation, request_timeout, poll_interval, max_in_flight):
+        self.base_url = base_url
+        self.video_fraction = video_fraction
+        self.segments = segments
+        self.orientation = orientation
+        self.request_timeout = request_timeout
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="load")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def _wait_for_task(self, task_id, deadline):
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            response = requests.get(f"{self.base_url}/v1/status/{task_id}", timeout=30)
+            response.raise_for_status()
+            task = response.json()
+            if task.get("status") == "completed":
+                return
+            if task.get("status") == "failed":
+                raise RuntimeError(f"Task {task_id} failed: {task.get('error')}")
+        raise TimeoutError(f"Task {task_id} did not finish within {self.request_timeout}s")
+
+    def _request(self, kind):
+        start = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            response = requests.post(
+                f"{self.base_url}/v1/lisa-{kind}-podcast",
+                json=request_payload(kind, self.segments, self.orientation),
+                timeout=self.request_timeout
+            )
+            response.raise_for_status()
+            body = response.json()
+            # Async APIs answer immediately with a task to poll
+            if body.get("task_id") and not body.get("s3_url"):
+                self._wait_for_task(body["task_id"], start + self.request_timeout)
+            return {"kind": kind, "ok": True, "latency": time.monotonic() - start, "status": response.status_code}
+        except Exception as exc:
+            status = getattr(getattr(exc, "response", None), "status_code", None)
+            return {"kind": kind, "ok": False, "latency": time.monotonic() - start, "status": status, "error": str(exc)[:200]}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def run_step(self, rate, duration, drain=True):
+        """Offer `rate` requests/second for `duration` seconds and collect the outcomes"""
+        futures = []
+        start = time.monotonic()
+        next_arrival = start + random.expovariate(rate)
+        while next_arrival < start + duration:
+            delay = next_arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            kind = "video" if random.random() < self.video_fraction else "audio"
+            futures.append(self._executor.submit(self._request, kind))
+            next_arrival += random.expovariate(rate)
+
+        if drain:
+            outcomes = [future.result() for future in futures]
+        else:
+            remaining = max(0.0, start + duration - time.monotonic())
+            time.sleep(remaining)
+            outcomes = [future.result() for future in futures if future.done()]
+        elapsed = time.monotonic() - start
+        return summarize_step(rate, duration, elapsed, len(futures), outcomes)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+def summarize_step(rate, duration, elapsed, sent, outcomes):
+    ok = [o for o in outcomes if o["ok"]]
+    latencies = [o["latency"] for o in ok]
+    errors = {}
+    for outcome in outcomes:
+        if not outcome["ok"]:
+            key = str(outcome["status"] or "exception")
+            errors[key] = errors.get(key, 0) + 1
+    by_kind = {}
+    for kind in ("audio", "video"):
+        kind_latencies = [o["latency"] for o in ok if o["kind"] == kind]
+        if kind_latencies:
+            by_kind[kind] = {"completed": len(kind_latencies), "p50": percentile(kind_latencies, 50),
+                             "p95": percentile(kind_latencies, 95)}
+    return {
+        "offered_rate": rate,
+        "duration": duration,
+        "elapsed": elapsed,
+        "sent": sent,
+        "completed": len(ok),
+        "failed": len(outcomes) - len(ok),
+        "errors": errors,
+        "throughput": len(ok) / elapsed if elapsed else 0.0,
+        "latency": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                    "p99": percentile(latencies, 99), "max": max(latencies) if latencies else 0.0},
+        "by_kind": by_kind,
+    }
+
+def is_saturated(step, baseline, slo_seconds, max_error_rate=0.05, max_latency_inflation=2.0):
+    """
+    Errors climbed, requests were left unfinished, p95 broke the SLO, or queueing pushed p95
+    past max_latency_inflation times that of the first (lightest) step
+    """
+    if step["sent"] and step["failed"] / step["sent"] > max_error_rate:
+        return True
+    if step["completed"] < 0.9 * step["sent"]:
+        return True
+    if slo_seconds and step["latency"]["p95"] > slo_seconds:
+        return True
+    return step is not baseline and step["latency"]["p95"] > max_latency_inflation * baseline["latency"]["p95"]
+
+def print_report(target, steps, resources, saturation):
+    print(f"\n{target}")
+    print(f"  {'offered/s':>9} {'sent':>5} {'ok':>5} {'fail':>5} {'thru/s':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for step in steps:
+        latency = step["latency"]
+        print(f"  {step['offered_rate']:>9.3f} {step['sent']:>5} {step['completed']:>5} {step['failed']:>5} "
+              f"{step['throughput']:>7.3f} {latency['p50']:>7.2f}s {latency['p95']:>7.2f}s {latency['p99']:>7.2f}s")
+        if step["errors"]:
+            print(f"  {'':>9} errors: {json.dumps(step['errors'], sort_keys=True)}")
+    print("\n  Server resources (peak / final / growth per hour):")
+    for metric, values in resources.items():
+        scale, unit = (1024 ** 2, " MiB") if metric.endswith("_bytes") else (1, "")
+        print(f"  {metric:<10} {values['peak'] / scale:>10.1f}{unit} {values['final'] / scale:>10.1f}{unit} "
+              f"{values['growth_per_hour'] / scale:>+10.1f}{unit}")
+    if saturation is None:
+        print("\n  No saturation within the offered rates")
+    else:
+        print(f"\n  Saturated at {saturation:g} requests/s offered")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP load and soak test of the podcast API against local fakes")
+    parser.add_argument("--target", default="app.main:app",
+                        help="ASGI app to serve: app.main:app, modal_app:web_app or modal_app_simple_async:web_app")
+    parser.add_argument("--rates", default="0.25,0.5,1,2", help="Comma-separated offered request rates (requests/second), one step each")
+    parser.add_argument("--step-seconds", type=float, default=60, help="Arrival window of each step; use a long single step to soak")
+    parser.add_argument("--no-drain", action="store_true", help="Do not wait for a step's requests to finish before the next step")
+    parser.add_argument("--stop-at-saturation", action="store_true", help="Skip higher rates once the server saturates")
+    parser.add_argument("--video-fraction", type=float, default=0.3, help="Share of requests that are video podcasts")
+    parser.add_argument("--segments", type=int, default=6, help="Dialogue segments per podcast")
+    parser.add_argument("--orientation", default="landscape", choices=["landscape", "portrait"])
+    parser.add_argument("--slo-seconds", type=float, default=None, help="p95 latency above which a step counts as saturated")
+    parser.add_argument("--request-timeout", type=float, default=900)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Status polling interval for async APIs")
+    parser.add_argument("--max-in-flight", type=int, default=512, help="Client-side cap on concurrent requests")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Server resource sampling interval")
+    add_fake_arguments(parser)
+    parser.add_argument("--work-dir", default=None, help="Directory for fixtures and the server's temp dir (default: a temp dir)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write steps and resource samples to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="lisa_load_")
+    config = FakeConfig.from_args(args)
+    config.script_lines = args.segments
+    providers = FakeProviders(config, os.path.join(work_dir, "fixtures")).start()
+    s3 = FakeS3().start()
+
+    server_log = None if args.verbose else open(os.path.join(work_dir, "server.log"), "wb")
+    server = ServerProcess(args.target, app_environment(providers, s3), os.path.join(work_dir, "tmp"))
+    steps = []
+    saturation = None
+    server_metrics = None
+    try:
+        server.start(log_file=server_log)
+        generator = LoadGenerator(server.base_url, args.video_fraction, args.segments, args.orientation,
+                                  args.request_timeout, args.poll_interval, args.max_in_flight)
+        monitor = ResourceMonitor(server, args.sample_interval)
+        monitor.in_flight = generator.in_flight
+        monitor.start()
+        try:
+            for rate in [float(rate) for rate in args.rates.split(",") if rate]:
+                logger.info(f"Offering {rate:g} requests/s for {args.step_seconds:g}s")
+                step = generator.run_step(rate, args.step_seconds, drain=not args.no_drain)
+                steps.append(step)
+                logger.info(f"{rate:g}/s: {step['completed']} ok, {step['failed']} failed, "
+                            f"p95 {step['latency']['p95']:.2f}s, throughput {step['throughput']:.3f}/s")
+                if saturation is None and is_saturated(step, steps[0], args.slo_seconds):
+                    saturation = rate
+                    if args.stop_at_saturation:
+                        break
+        finally:
+            generator.shutdown()
+            monitor.stop()
+        # Stage timings from the server itself, where it exposes them (app.main:app)
+        try:
+            response = requests.get(f"{server.base_url}/metrics", timeout=10)
+            server_metrics = response.text if response.status_code == 200 else None
+        except requests.RequestException:
+            server_metrics = None
+    finally:
+        server.stop()
+        providers.stop()
+        s3.stop()
+        if server_log:
+            server_log.close()
+
+    resources = monitor.summary()
+    print_report(args.target, steps, resources, saturation)
+    print(f"  Provider calls: {json.dumps(providers.counters, sort_keys=True)}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "config": vars(args),
+                "steps": steps,
+                "saturation_rate": saturation,
+                "resources": resources,
+                "samples": monitor.samples,
+                "provider_calls": providers.counters,
+                "server_metrics": server_metrics,
+            }, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
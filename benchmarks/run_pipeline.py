@@ -0,0 +1,235 @@
+"""
+End-to-end benchmark of create_audio_podcast and create_video_podcast against local fakes.
+
+    python -m benchmarks.run_pipeline --segments 4,16 --orientations landscape,portrait --runs 3
+
+Starts fake OpenAI/ElevenLabs/Heygen servers and a moto S3 server, points the app at them
+through environment variables, runs every (kind, segments, orientation) case and reports
+per-stage and end-to-end p50/p95 latency plus peak RSS. Use --json to keep the numbers for
+comparison between commits.
+"""
+import os
+import sys
+import json
+import time
+import math
+import uuid
+import argparse
+import logging
+import resource
+import tempfile
+import threading
+from collections import defaultdict
+
+from benchmarks.fakes import FakeConfig, FakeProviders, FakeS3, add_fake_arguments
+
+logger = logging.getLogger("benchmarks.run_pipeline")
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+class RssSampler:
+    """Samples the resident set size of this process in the background and keeps the peak"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+def _children_peak_rss():
+    """Peak RSS of the largest child process so far (ffmpeg)"""
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def request_payload(kind, segments, orientation="landscape", render_mode="segment"):
+    """JSON body of a podcast request; the fake OpenAI script decides the segment count"""
+    payload = {
+        "input_type": "idea",
+        # A nonce keeps runs from sharing anything through the request-level caches
+        "input_text": f"Benchmark podcast {uuid.uuid4().hex} with {segments} lines",
+        "language": "english",
+        "host_name": "Host",
+        "guest_name": "Guest",
+        "host_voice_id": "bench-host-voice",
+        "guest_voice_id": "bench-guest-voice",
+        "elevenlabs_config": {"stability": 0.5, "similarity_boost": 0.75, "style": 0.0, "model_id": "eleven_multilingual_v2"},
+        "duration_minutes": 1,
+    }
+    if kind == "video":
+        payload["orientation"] = orientation
+        payload["heygen_config"] = {"host_avatar_id": "bench-host-avatar", "guest_avatar_id": "bench-guest-avatar",
+                                    "render_mode": render_mode}
+    return payload
+
+def build_request(kind, segments, orientation, render_mode="segment"):
+    from app.models import AudioPodcastRequest, VideoPodcastRequest
+    model = AudioPodcastRequest if kind == "audio" else VideoPodcastRequest
+    return model(**request_payload(kind, segments, orientation, render_mode))
+
+def run_case(kind, segments, orientation, runs, providers, render_mode="segment"):
+    from app.services.jobs import JobManifest
+    from app.services.podcast import create_audio_podcast, create_video_podcast
+    create = create_audio_podcast if kind == "audio" else create_video_podcast
+    providers.config.script_lines = segments
+
+    totals = []
+    stages = defaultdict(list)
+    errors = 0
+    peak_rss = 0
+    for run in range(runs):
+        data = build_request(kind, segments, orientation, render_mode)
+        job = JobManifest.create(kind, data)
+        start = time.perf_counter()
+        with RssSampler() as rss:
+            try:
+                create(data, job=job)
+            except Exception as exc:
+                errors += 1
+                logger.error(f"{kind} run {run + 1} failed: {exc}")
+        totals.append(time.perf_counter() - start)
+        peak_rss = max(peak_rss, rss.peak)
+        # Spans recorded by the pipeline itself; per-segment stages contribute one sample per call
+        for span in (job.timings or {}).get("spans", []):
+            stages[span["stage"]].append(span["duration"])
+
+    return {
+        "kind": kind,
+        "segments": segments,
+        "orientation": orientation if kind == "video" else None,
+        "runs": runs,
+        "errors": errors,
+        "end_to_end": {"p50": percentile(totals, 50), "p95": percentile(totals, 95)},
+        "stages": {
+            stage: {"calls": len(samples), "p50": percentile(samples, 50), "p95": percentile(samples, 95)}
+            for stage, samples in stages.items()
+        },
+        "peak_rss_bytes": peak_rss,
+    }
+
+def print_report(results):
+    for result in results:
+        label = f"{result['kind']} segments={result['segments']}"
+        if result["orientation"]:
+            label += f" orientation={result['orientation']}"
+        e2e = result["end_to_end"]
+        print(f"\n{label} runs={result['runs']} errors={result['errors']}")
+        print(f"  {'end-to-end':<16} p50 {e2e['p50']:8.3f}s  p95 {e2e['p95']:8.3f}s")
+        for stage, timing in sorted(result["stages"].items()):
+            print(f"  {stage:<16} p50 {timing['p50']:8.3f}s  p95 {timing['p95']:8.3f}s  ({timing['calls']} calls)")
+        print(f"  {'peak RSS':<16} {result['peak_rss_bytes'] / 1024 ** 2:.1f} MiB")
+
+def app_environment(providers, s3):
+    """Environment that points the app at the fakes, with polling and backoff scaled down to match"""
+    env = dict(providers.environment())
+    env.update(s3.environment())
+    env.update({
+        "HEYGEN_POLL_INTERVAL": "0.2",
+        "HEYGEN_RENDER_FACTOR": "0.1",
+        "RETRY_BASE_DELAY": "0.05",
+        "RETRY_MAX_DELAY": "0.5",
+        "RESULT_CACHE_ENABLED": "false",
+        "RENDER_CACHE_S3": "false",
+    })
+    return env
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end podcast pipeline benchmark against local fakes")
+    parser.add_argument("--kinds", default="audio,video", help="Comma-separated: audio,video")
+    parser.add_argument("--segments", default="4,16", help="Comma-separated dialogue segment counts")
+    parser.add_argument("--orientations", default="landscape,portrait", help="Comma-separated video orientations")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per case")
+    parser.add_argument("--backend", default="threads", choices=["threads", "processes"],
+                        help="SEGMENT_BACKEND for the render download and portrait crop")
+    parser.add_argument("--render-mode", default="segment", choices=["segment", "speaker", "audiogram"],
+                        help="Heygen render_mode of video requests")
+    parser.add_argument("--tts-batching", action="store_true", help="Synthesize lines in batched requests (TTS_BATCHING)")
+    add_fake_arguments(parser)
+    parser.add_argument("--work-dir", default=None, help="Directory for fixtures, job workspaces and caches (default: a temp dir)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline logs")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="lisa_bench_")
+    config = FakeConfig.from_args(args)
+    providers = FakeProviders(config, os.path.join(work_dir, "fixtures")).start()
+    s3 = FakeS3().start()
+
+    # The app reads its settings at import time, so the environment must be set first
+    os.environ.update(app_environment(providers, s3))
+    os.environ.update({
+        "JOBS_DIR": os.path.join(work_dir, "jobs"),
+        "CACHE_DIR": os.path.join(work_dir, "cache"),
+        "SEGMENT_BACKEND": args.backend,
+        "TTS_BATCHING": "true" if args.tts_batching else "false",
+    })
+
+    results = []
+    try:
+        for kind in [kind for kind in args.kinds.split(",") if kind]:
+            orientations = [o for o in args.orientations.split(",") if o] if kind == "video" else [None]
+            for segments in [int(count) for count in args.segments.split(",") if count]:
+                for orientation in orientations:
+                    logger.info(f"Running {kind} segments={segments} orientation={orientation} x{args.runs}")
+                    results.append(run_case(kind, segments, orientation, args.runs, providers, args.render_mode))
+    finally:
+        providers.stop()
+        s3.stop()
+
+    print_report(results)
+    print(f"\nPeak child process RSS (ffmpeg): {_children_peak_rss() / 1024 ** 2:.1f} MiB")
+    print(f"Provider calls: {json.dumps(providers.counters, sort_keys=True)}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "config": vars(args),
+                "results": results,
+                "children_peak_rss_bytes": _children_peak_rss(),
+                "provider_calls": providers.counters,
+            }, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    return 1 if any(result["errors"] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
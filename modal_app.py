@@ -2,15 +2,16 @@ import modal
 import logging
 import os
 import tempfile
-import requests
-import boto3
 import subprocess
 import time
 import re
+import hashlib
+import shutil
+import uuid
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Literal, Dict
 from pydantic import BaseModel, Field
-import openai
 
 # Configure logging
 logging.basicConfig(
@@ -42,6 +43,10 @@ image = (
     ])
 )
 
+# Functions that use the app package's code: segment tasks offloaded by the FastAPI service
+# (SEGMENT_BACKEND=modal) and the podcast pipelines below (for media_probe)
+app_image = image.add_local_python_source("app")
+
 # Pydantic Models
 class ElevenLabsConfig(BaseModel):
     stability: float = Field(ge=0.0, le=1.0, description="Stability setting (0.0 to 1.0)")
@@ -88,9 +93,46 @@ class Settings:
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "your-aws-secret-key")
     AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET_NAME", "your-s3-bucket")
     TMP_DIR = tempfile.gettempdir()
+    # Provider endpoints (overridable to point at local fakes, e.g. for load tests)
+    ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
+    HEYGEN_BASE_URL = os.getenv("HEYGEN_BASE_URL", "https://api.heygen.com").rstrip("/")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+    HEYGEN_POLL_INTERVAL = float(os.getenv("HEYGEN_POLL_INTERVAL", "5"))
+    # Video renders stop this long before the function timeout, leaving time to merge what is done
+    DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "60"))
 
 settings = Settings()
 
+# boto3 and openai are imported with their first client rather than at module import: this
+# module is imported on every container start (and by `modal deploy`), before any request
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _client(name):
+    if name not in _clients:
+        with _clients_lock:
+            if name not in _clients:
+                if name == "s3":
+                    import boto3
+                    _clients[name] = boto3.client(
+                        "s3",
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                        endpoint_url=settings.S3_ENDPOINT_URL
+                    )
+                else:
+                    import openai
+                    _clients[name] = openai.OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+    return _clients[name]
+
+def _warm_up_clients():
+    for name in ("s3", "openai"):
+        try:
+            _client(name)
+        except Exception as e:
+            logger.warning(f"Could not warm up the {name} client: {e}")
+
 # Utility Functions
 def generate_podcast_script(idea: str, host: str, guest: str, language: str, duration_minutes: int = 5) -> str:
     logger.info(f"Generating podcast script for topic: '{idea}'")
@@ -143,7 +185,7 @@ def generate_podcast_script(idea: str, host: str, guest: str, language: str, dur
         )
 
     logger.info("Sending request to OpenAI API...")
-    client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+    client = _client("openai")
     response = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
@@ -173,7 +215,7 @@ def synthesize_voice(text, voice_id, config, output_path):
         logger.info(f"Detected {len(devanagari_chars)} Devanagari characters in text")
         logger.info(f"Devanagari characters: {devanagari_chars[:10]}...")
 
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    url = f"{settings.ELEVENLABS_BASE_URL}/v1/text-to-speech/{voice_id}"
     headers = {
         "xi-api-key": settings.ELEVENLABS_API_KEY,
         "Content-Type": "application/json"
@@ -191,6 +233,7 @@ def synthesize_voice(text, voice_id, config, output_path):
     }
 
     logger.info("Sending request to ElevenLabs API...")
+    import requests
     response = requests.post(url, json=payload, stream=True, headers=headers)
 
     if response.status_code == 200:
@@ -205,7 +248,10 @@ def synthesize_voice(text, voice_id, config, output_path):
         logger.error(error_msg)
         raise Exception(error_msg)
 
-def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_id=None, width=1280, height=720):
+def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_id=None, width=1280, height=720, deadline=None):
+    """deadline: time.monotonic() value after which the render is given up (not submitted, or no longer polled)"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise Exception("Video generation skipped: the function deadline is too close")
     logger.info(f"Heygen: Generating talking photo video")
     logger.info(f"Audio URL: {audio_url}")
     logger.info(f"Talking Photo ID: {avatar_id}")
@@ -262,8 +308,9 @@ def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_i
     logger.info(json.dumps(payload, indent=2))
     logger.info("=== END HEYGEN API PAYLOAD ===")
 
+    import requests
     resp = requests.post(
-        "https://api.heygen.com/v2/video/generate",
+        f"{settings.HEYGEN_BASE_URL}/v2/video/generate",
         headers=headers,
         json=payload
     )
@@ -286,24 +333,26 @@ def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_i
     attempts = 0
 
     while attempts < max_attempts:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise Exception(f"Video generation stopped at the function deadline after {attempts} attempts")
         attempts += 1
         logger.info(f"Polling attempt {attempts}/{max_attempts}")
 
         status_resp = requests.get(
-            f"https://api.heygen.com/v1/video_status.get",
+            f"{settings.HEYGEN_BASE_URL}/v1/video_status.get",
             headers=headers,
             params={"video_id": video_id}
         )
 
         if status_resp.status_code != 200:
             logger.error(f"Status check failed: {status_resp.text}")
-            time.sleep(5)
+            time.sleep(settings.HEYGEN_POLL_INTERVAL)
             continue
 
         status_data = status_resp.json()
         if status_data.get("error"):
             logger.error(f"Status check error: {status_data['error']}")
-            time.sleep(5)
+            time.sleep(settings.HEYGEN_POLL_INTERVAL)
             continue
 
         video_status = status_data["data"]["status"]
@@ -314,13 +363,13 @@ def generate_avatar_video(audio_url, avatar_id, background, output_path, voice_i
             logger.info(f"Video completed successfully: {video_url}")
             break
         elif video_status in ("processing", "pending", "started"):
-            logger.info(f"Video still {video_status}, waiting 5 seconds...")
-            time.sleep(5)
+            logger.info(f"Video still {video_status}, waiting {settings.HEYGEN_POLL_INTERVAL:g} seconds...")
+            time.sleep(settings.HEYGEN_POLL_INTERVAL)
         elif video_status == "failed":
             raise Exception(f"Heygen video generation failed: {status_data['data']}")
         else:
-            logger.warning(f"Unknown status: {video_status}, waiting 5 seconds...")
-            time.sleep(5)
+            logger.warning(f"Unknown status: {video_status}, waiting {settings.HEYGEN_POLL_INTERVAL:g} seconds...")
+            time.sleep(settings.HEYGEN_POLL_INTERVAL)
     else:
         raise Exception(f"Video generation timed out after {max_attempts} attempts")
 
@@ -457,11 +506,7 @@ def upload_to_s3(file_path, s3_key):
     logger.info(f"S3 bucket: {settings.AWS_S3_BUCKET}")
 
     try:
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-        )
+        s3 = _client("s3")
         s3.upload_file(file_path, settings.AWS_S3_BUCKET, s3_key)
         url = f"https://{settings.AWS_S3_BUCKET}.s3.amazonaws.com/{s3_key}"
         logger.info(f"File uploaded successfully to: {url}")
@@ -471,6 +516,51 @@ def upload_to_s3(file_path, s3_key):
         logger.error(error_msg)
         raise Exception(error_msg)
 
+TEMP_PREFIX = "podcasts/temp"
+TEMP_TTL_SECONDS = 24 * 3600
+
+def upload_content_addressed(file_path, prefix=TEMP_PREFIX, extension=".mp3"):
+    """Upload under a content-hash key, skipping the upload if a fresh identical object exists"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    s3_key = f"{prefix}/{digest.hexdigest()}{extension}"
+
+    s3 = _client("s3")
+    from botocore.exceptions import ClientError
+    try:
+        head = s3.head_object(Bucket=settings.AWS_S3_BUCKET, Key=s3_key)
+    except ClientError as e:
+        # Only a missing object means it has to be uploaded; other errors (credentials,
+        # throttling, ...) would fail the upload too
+        if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+            logger.error(f"S3 HEAD failed for {s3_key}: {e}")
+            raise
+        head = None
+    # Objects past half their lifetime are re-uploaded so cleanup never removes one in use
+    if head and time.time() - head["LastModified"].timestamp() < TEMP_TTL_SECONDS / 2:
+        logger.info(f"Intermediate already in S3, skipping upload: {s3_key}")
+        return f"https://{settings.AWS_S3_BUCKET}.s3.amazonaws.com/{s3_key}"
+    return upload_to_s3(file_path, s3_key)
+
+def delete_expired_temp_objects(prefix=TEMP_PREFIX, max_age_seconds=TEMP_TTL_SECONDS):
+    """Batch-delete expired intermediates with DeleteObjects (1000 keys per call)"""
+    s3 = _client("s3")
+    cutoff = time.time() - max_age_seconds
+    expired = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=settings.AWS_S3_BUCKET, Prefix=f"{prefix}/"):
+        expired.extend(obj["Key"] for obj in page.get("Contents", []) if obj["LastModified"].timestamp() < cutoff)
+
+    for start in range(0, len(expired), 1000):
+        batch = expired[start:start + 1000]
+        s3.delete_objects(
+            Bucket=settings.AWS_S3_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        )
+    logger.info(f"Deleted {len(expired)} expired objects under {prefix}/")
+    return len(expired)
+
 def process_dialogue(script, host, guest):
     logger.info(f"Processing dialogue with {host} (host) and {guest} (guest)")
     
@@ -510,6 +600,14 @@ def process_dialogue(script, host, guest):
     return segments
 
 def create_audio_podcast(data):
+    # Each request gets its own workspace: requests share the container's temp directory
+    workspace = tempfile.mkdtemp(prefix="podcast_", dir=settings.TMP_DIR)
+    try:
+        return _create_audio_podcast(data, workspace)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def _create_audio_podcast(data, workspace):
     logger.info("=== STARTING AUDIO PODCAST GENERATION ===")
     
     # Step 1: Generate script
@@ -538,7 +636,7 @@ def create_audio_podcast(data):
         futures = []
         for i, segment in enumerate(segments):
             voice_id = data.host_voice_id if segment['speaker'] == 'host' else data.guest_voice_id
-            output_path = os.path.join(settings.TMP_DIR, f"audio_segment_{i}.mp3")
+            output_path = os.path.join(workspace, f"audio_segment_{i}.mp3")
             
             future = executor.submit(
                 synthesize_voice,
@@ -560,12 +658,14 @@ def create_audio_podcast(data):
     
     # Step 4: Merge audio files
     logger.info("Merging audio files...")
-    merged_audio = os.path.join(settings.TMP_DIR, "merged_audio.mp3")
+    merged_audio = os.path.join(workspace, "merged_audio.mp3")
     merge_audio_clips(audio_files, merged_audio)
+    from app.utils.media_probe import media_duration  # Only in app_image containers
+    duration = media_duration(merged_audio)
     
     # Step 5: Upload to S3
     logger.info("Uploading to S3...")
-    s3_key = f"podcasts/audio/{int(time.time())}.mp3"
+    s3_key = f"podcasts/audio/{int(time.time())}_{uuid.uuid4().hex[:8]}.mp3"
     s3_url = upload_to_s3(merged_audio, s3_key)
     
     # Step 6: Cleanup
@@ -580,11 +680,18 @@ def create_audio_podcast(data):
     except:
         pass
     
-    duration = len(segments) * 10  # Rough estimate
-    logger.info(f"Audio podcast generation completed. S3 URL: {s3_url}")
-    return s3_url, duration
+    logger.info(f"Audio podcast generation completed ({duration:.1f}s). S3 URL: {s3_url}")
+    return s3_url, round(duration)
+
+def create_video_podcast(data, deadline=None):
+    """Returns (s3_url, duration, indices of segments left out because they missed the deadline)"""
+    workspace = tempfile.mkdtemp(prefix="podcast_", dir=settings.TMP_DIR)
+    try:
+        return _create_video_podcast(data, workspace, deadline)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
 
-def create_video_podcast(data):
+def _create_video_podcast(data, workspace, deadline):
     logger.info("=== STARTING VIDEO PODCAST GENERATION ===")
     
     # Step 1: Generate script
@@ -613,7 +720,7 @@ def create_video_podcast(data):
         futures = []
         for i, segment in enumerate(segments):
             voice_id = data.host_voice_id if segment['speaker'] == 'host' else data.guest_voice_id
-            output_path = os.path.join(settings.TMP_DIR, f"audio_segment_{i}.mp3")
+            output_path = os.path.join(workspace, f"audio_segment_{i}.mp3")
             
             future = executor.submit(
                 synthesize_voice,
@@ -641,8 +748,7 @@ def create_video_podcast(data):
     with ThreadPoolExecutor(max_workers=max_s3_concurrent) as executor:
         futures = []
         for audio_path, i in audio_files:
-            s3_key = f"podcasts/temp/audio_{int(time.time())}_{i}.mp3"
-            future = executor.submit(upload_to_s3, audio_path, s3_key)
+            future = executor.submit(upload_content_addressed, audio_path)
             futures.append((future, i))
         
         for future, i in futures:
@@ -659,12 +765,12 @@ def create_video_podcast(data):
     video_files = []
     
     def generate_video_segment(audio_url, avatar_id, segment_index):
-        out_video = os.path.join(settings.TMP_DIR, f"video_segment_{segment_index}.mp4")
-        cropped_video = os.path.join(settings.TMP_DIR, f"video_segment_{segment_index}_cropped.mp4")
+        out_video = os.path.join(workspace, f"video_segment_{segment_index}.mp4")
+        cropped_video = os.path.join(workspace, f"video_segment_{segment_index}_cropped.mp4")
         
         # Always generate landscape videos (1280x720) for better compatibility
         width, height = 1280, 720
-        generate_avatar_video(audio_url, avatar_id, data.heygen_config.background, out_video, width=width, height=height)
+        generate_avatar_video(audio_url, avatar_id, data.heygen_config.background, out_video, width=width, height=height, deadline=deadline)
         
         # Crop to portrait if needed
         if data.orientation == "portrait":
@@ -680,26 +786,35 @@ def create_video_podcast(data):
         for audio_url, i in audio_urls:
             avatar_id = data.heygen_config.host_avatar_id if segments[i]['speaker'] == 'host' else data.heygen_config.guest_avatar_id
             future = executor.submit(generate_video_segment, audio_url, avatar_id, i)
-            futures.append(future)
+            futures.append((future, i))
         
-        for future in futures:
+        missing = []
+        for future, i in futures:
             try:
                 video_path, segment_index = future.result()
                 video_files.append((video_path, segment_index))
                 logger.info(f"Video segment {segment_index} generated: {video_path}")
             except Exception as e:
-                logger.error(f"Failed to generate video segment: {e}")
-                raise
+                # Past the deadline, a partial episode of the segments that did finish beats none
+                if deadline is None or time.monotonic() < deadline:
+                    logger.error(f"Failed to generate video segment {i}: {e}")
+                    raise
+                logger.warning(f"Leaving out video segment {i}, it missed the deadline: {e}")
+                missing.append(i)
+    if not video_files:
+        raise Exception("No video segment finished before the deadline")
     
     # Step 4: Merge video files in correct sequence
     logger.info("Merging video files in sequence...")
     ordered_video_paths = [path for path, _ in sorted(video_files, key=lambda x: x[1])]
-    merged_video = os.path.join(settings.TMP_DIR, "merged_video.mp4")
+    merged_video = os.path.join(workspace, "merged_video.mp4")
     merge_video_clips(ordered_video_paths, merged_video)
+    from app.utils.media_probe import media_duration  # Only in app_image containers
+    duration = media_duration(merged_video)
     
     # Step 5: Upload final video to S3
     logger.info("Uploading final video to S3...")
-    s3_key = f"podcasts/video/{int(time.time())}.mp4"
+    s3_key = f"podcasts/video/{int(time.time())}_{uuid.uuid4().hex[:8]}.mp4"
     s3_url = upload_to_s3(merged_video, s3_key)
     
     # Step 6: Cleanup
@@ -719,9 +834,23 @@ def create_video_podcast(data):
     except:
         pass
     
-    duration = len(segments) * 10  # Rough estimate
-    logger.info(f"Video podcast generation completed. S3 URL: {s3_url}")
-    return s3_url, duration
+    logger.info(f"Video podcast generation completed ({duration:.1f}s). S3 URL: {s3_url}")
+    return s3_url, round(duration), missing
+
+# Function timeouts; video renders are given up DEADLINE_RESERVE_SECONDS before them
+WEB_TIMEOUT_SECONDS = 300
+AUDIO_TIMEOUT_SECONDS = 300
+VIDEO_TIMEOUT_SECONDS = 600
+
+def _video_response(data, timeout_seconds):
+    deadline = time.monotonic() + timeout_seconds - min(settings.DEADLINE_RESERVE_SECONDS, timeout_seconds / 2)
+    s3_url, duration, missing = create_video_podcast(data, deadline=deadline)
+    logger.info(f"Video podcast completed. S3 URL: {s3_url}")
+    response = {"status": "success", "s3_url": s3_url, "duration": duration}
+    if missing:
+        response["partial"] = True
+        response["missing_segments"] = missing
+    return response
 
 # Create FastAPI app
 from fastapi import FastAPI
@@ -740,16 +869,14 @@ def lisa_audio_podcast(data: AudioPodcastRequest):
 def lisa_video_podcast(data: VideoPodcastRequest):
     logger.info("=== VIDEO PODCAST REQUEST RECEIVED ===")
     logger.info(f"Request data: {data}")
-    s3_url, duration = create_video_podcast(data)
-    logger.info(f"Video podcast completed. S3 URL: {s3_url}")
-    return {"status": "success", "s3_url": s3_url, "duration": duration}
+    return _video_response(data, WEB_TIMEOUT_SECONDS)
 
 # Deploy the complete FastAPI application with Modal 1.1
 @app.function(
-    image=image,
+    image=app_image,
     cpu=2,
     memory=4096,
-    timeout=300,
+    timeout=WEB_TIMEOUT_SECONDS,
     min_containers=0,  # Start idle, scale up when needed
     max_containers=10,
     secrets=[modal.Secret.from_name("lisa-podcast-secrets")]
@@ -757,14 +884,16 @@ def lisa_video_podcast(data: VideoPodcastRequest):
 @modal.asgi_app()
 def fastapi_app():
     """Deploy the complete FastAPI application"""
+    # Load the provider SDKs while the container waits for its first request
+    threading.Thread(target=_warm_up_clients, name="warm-up", daemon=True).start()
     return web_app
 
 # Individual endpoint functions for specific use cases
 @app.function(
-    image=image,
+    image=app_image,
     cpu=2,
     memory=4096,
-    timeout=300,
+    timeout=AUDIO_TIMEOUT_SECONDS,
     min_containers=0,  # Start idle, scale up when needed
     max_containers=5,
     secrets=[modal.Secret.from_name("lisa-podcast-secrets")]
@@ -774,14 +903,38 @@ def audio_podcast_function(data: AudioPodcastRequest):
     return lisa_audio_podcast(data)
 
 @app.function(
-    image=image,
+    image=app_image,
     cpu=4,
     memory=8192,
-    timeout=600,
+    timeout=VIDEO_TIMEOUT_SECONDS,
     min_containers=0,  # Start idle, scale up when needed
     max_containers=3,
     secrets=[modal.Secret.from_name("lisa-podcast-secrets")]
 )
 def video_podcast_function(data: VideoPodcastRequest):
     """Video podcast generation function"""
-    return lisa_video_podcast(data)
\ No newline at end of file
+    logger.info("=== VIDEO PODCAST REQUEST RECEIVED ===")
+    return _video_response(data, VIDEO_TIMEOUT_SECONDS)
+
+@app.function(
+    image=app_image,
+    cpu=2,
+    memory=2048,
+    timeout=600,
+    min_containers=0,  # Start idle, scale up when needed
+    max_containers=50,
+    secrets=[modal.Secret.from_name("lisa-podcast-secrets")]
+)
+def run_segment_task(task: dict) -> dict:
+    """Run one segment task for app.services.backends.ModalBackend (outputs are returned via S3)"""
+    from app.services.backends import run_remote_task
+    return run_remote_task(task)
+
+@app.function(
+    image=image,
+    schedule=modal.Period(hours=6),
+    secrets=[modal.Secret.from_name("lisa-podcast-secrets")]
+)
+def cleanup_temp_objects():
+    """Periodically remove expired per-segment audio uploaded for Heygen"""
+    return delete_expired_temp_objects()
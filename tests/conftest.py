@@ -0,0 +1,57 @@
+"""
+Fixtures for tests that run the pipeline end to end against the local provider fakes of the
+benchmarks (an OpenAI/ElevenLabs/Heygen HTTP fake and moto's S3 server), with job workspaces
+and media caches in a temporary directory.
+"""
+import logging
+import pytest
+
+@pytest.fixture(scope="session")
+def fakes(tmp_path_factory):
+    from benchmarks.fakes import FakeConfig, FakeProviders, FakeS3
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    config = FakeConfig(openai_latency="fixed:0.05", tts_latency="fixed:0.05", heygen_submit_latency="fixed:0.05",
+                        heygen_render_latency="fixed:0.3", download_latency="fixed:0", audio_seconds=1.0, script_lines=4)
+    providers = FakeProviders(config, str(tmp_path_factory.mktemp("fixtures"))).start()
+    s3 = FakeS3().start()
+    yield providers, s3
+    providers.stop()
+    s3.stop()
+
+@pytest.fixture
+def pipeline(fakes, tmp_path, monkeypatch):
+    """Point the app at the fakes; returns the FakeProviders, whose counters start at zero"""
+    from app.config import settings
+    from app.utils import s3, openai_gpt, file_cache
+    providers, fake_s3 = fakes
+    overrides = {
+        "OPENAI_BASE_URL": f"{providers.base_url}/v1",
+        "ELEVENLABS_BASE_URL": providers.base_url,
+        "HEYGEN_BASE_URL": providers.base_url,
+        "S3_ENDPOINT_URL": fake_s3.endpoint_url,
+        "AWS_S3_BUCKET": fake_s3.bucket,
+        "AWS_ACCESS_KEY_ID": "fake",
+        "AWS_SECRET_ACCESS_KEY": "fake",
+        "JOBS_DIR": str(tmp_path / "jobs"),
+        "CACHE_DIR": str(tmp_path / "cache"),
+        "HEYGEN_POLL_INTERVAL": 0.1,
+        "HEYGEN_RENDER_FACTOR": 0.1,
+        "RETRY_BASE_DELAY": 0.01,
+        "RETRY_MAX_DELAY": 0.05,
+        "RESULT_CACHE_ENABLED": False,
+        "RENDER_CACHE_S3": False,
+        "WARM_UP_CLIENTS": False,
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # Clients and caches are built on first use from the settings above
+    monkeypatch.setattr(s3, "_client", None)
+    monkeypatch.setattr(openai_gpt, "_client", None)
+    file_cache.render_cache.cache_clear()
+    file_cache.tts_cache.cache_clear()
+    providers.counters.clear()
+    providers.config.script_lines = 4
+    yield providers
+    file_cache.render_cache.cache_clear()
+    file_cache.tts_cache.cache_clear()
@@ -0,0 +1,86 @@
+"""
+AdmissionController: requests are admitted first come, first served, and a request expected to
+wait too long is rejected with the expected wait as its Retry-After (also as a 429 response).
+The controller's clock is fixed, so expected ends are exact.
+"""
+import threading
+import types
+import pytest
+from app.services import admission
+from app.services.admission import AdmissionController, Overloaded, DEFAULT_WALL_RATIO
+from app.utils.cancellation import JobCancelled
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def test_admits_within_budget(clock):
+    controller = AdmissionController(budget=10, max_queue_seconds=100)
+    first, second = controller.reserve("audio", 6), controller.reserve("audio", 4)
+    assert first.admitted and second.admitted
+    assert controller.stats()["in_flight"] == 10
+
+def test_costlier_than_budget_runs_alone(clock):
+    controller = AdmissionController(budget=10, max_queue_seconds=100)
+    assert controller.reserve("video", 50).admitted
+    assert not controller.reserve("audio", 1).admitted
+
+def test_queue_is_first_come_first_served(clock):
+    controller = AdmissionController(budget=10, max_queue_seconds=100)
+    running = controller.reserve("audio", 8)
+    big = controller.reserve("audio", 5)
+    small = controller.reserve("audio", 1)
+    # small would fit next to running, but big is ahead of it
+    assert running.admitted and not big.admitted and not small.admitted
+
+    waiter = threading.Thread(target=controller.wait, args=(small,))
+    waiter.start()
+    controller.release(running)
+    waiter.join(0.2)
+    assert waiter.is_alive() and not small.admitted
+
+    controller.wait(big)
+    waiter.join(5)
+    assert big.admitted and small.admitted
+    assert controller.stats()["queued_jobs"] == 0
+
+def test_withdrawn_ticket_stops_waiting(clock):
+    controller = AdmissionController(budget=10, max_queue_seconds=100)
+    controller.reserve("audio", 10)
+    queued = controller.reserve("audio", 5, job_id="job-1")
+    assert controller.withdraw("job-1")
+    with pytest.raises(JobCancelled):
+        controller.wait(queued)
+
+def test_retry_after_is_the_expected_wait(clock):
+    controller = AdmissionController(budget=10, max_queue_seconds=4)
+    controller.reserve("audio", 10)           # expected to end in 10 * DEFAULT_WALL_RATIO = 2.5s
+    queued = controller.reserve("audio", 10)  # admitted at 2.5s, expected to end at 5s
+    assert not queued.admitted
+    with pytest.raises(Overloaded) as exc:
+        controller.reserve("audio", 10)
+    assert exc.value.retry_after == 5 == 2 * 10 * DEFAULT_WALL_RATIO
+    assert exc.value.cost == 10
+
+def test_overdue_jobs_are_expected_to_end_within_a_second(clock):
+    controller = AdmissionController(budget=10, max_queue_seconds=0)
+    controller.reserve("audio", 10)
+    clock[0] += 60
+    with pytest.raises(Overloaded) as exc:
+        controller.reserve("audio", 10)
+    assert exc.value.retry_after == 1
+
+def test_endpoint_answers_429_with_retry_after(clock, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from benchmarks.run_pipeline import request_payload
+    controller = AdmissionController(budget=1, max_queue_seconds=0)
+    monkeypatch.setattr(admission, "controller", controller)
+    controller.reserve("video", 100)  # expected to end in 25s
+
+    response = TestClient(app).post("/v1/lisa-audio-podcast", json=request_payload("audio", 4))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "25"
+    assert response.json()["detail"]["retry_after"] == 25
@@ -0,0 +1,70 @@
+"""
+POST /v1/batch: identical items share one job, "idea" items with the same idea share one
+generated script, and an item cancelled while its batch is queued is skipped when the batch
+runs. Batches are run synchronously here instead of on a background thread. Runs against the
+local provider fakes (see conftest.py).
+"""
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import batches
+from benchmarks.run_pipeline import request_payload
+
+@pytest.fixture
+def submit(pipeline, monkeypatch):
+    """Submit a batch without running it; returns (response body, run), run() runs the batch"""
+    started = []
+    monkeypatch.setattr(batches, "_run_in_background", lambda *args: started.append(args))
+    client = TestClient(app)
+
+    def submit(items):
+        response = client.post("/v1/batch", json={"items": items})
+        assert response.status_code == 202, response.text
+        return response.json(), lambda: batches._run_batch(*started.pop())
+    return submit
+
+def _status(batch_id):
+    return TestClient(app).get(f"/v1/batch/{batch_id}").json()
+
+def _script(lines):
+    return "\n".join(f"{'Host' if i % 2 == 0 else 'Guest'}: {line}" for i, line in enumerate(lines))
+
+def test_identical_items_share_a_job(submit, pipeline, monkeypatch):
+    # One job at a time, so the second job of the shared idea finds every line in the TTS cache
+    monkeypatch.setattr(batches.settings, "BATCH_MAX_CONCURRENT_JOBS", 1)
+    idea = dict(request_payload("audio", 4), type="audio")
+    # Same request with other whitespace, and the same idea with other output: one script for all
+    reformatted = dict(idea, input_text=f"  {idea['input_text']}  ")
+    same_idea = dict(idea, output_format="hls")
+    scripted = dict(request_payload("audio", 2), type="audio", input_type="script", input_text=_script(["Hi", "Hello"]))
+    body, run = submit([idea, reformatted, same_idea, scripted, dict(scripted)])
+
+    job_ids = [item["job_id"] for item in body["items"]]
+    assert job_ids[0] == job_ids[1] and job_ids[3] == job_ids[4]
+    assert len(set(job_ids)) == 3
+    assert _status(body["batch_id"])["counts"] == {"queued": 5}
+
+    run()
+    status = _status(body["batch_id"])
+    assert status["status"] == "completed"
+    assert status["counts"] == {"completed": 5}
+    assert pipeline.counters["openai_requests"] == 1
+    # Four lines of the shared idea for its two jobs, and two of the script
+    assert pipeline.counters["elevenlabs_requests"] == 6
+
+def test_cancelled_item_is_skipped(submit, pipeline):
+    client = TestClient(app)
+    first = dict(request_payload("audio", 2), type="audio", input_type="script", input_text=_script(["One", "Two"]))
+    second = dict(first, input_text=_script(["Three", "Four"]))
+    body, run = submit([first, second, dict(second)])
+    cancelled = body["items"][1]["job_id"]
+
+    response = client.delete(f"/v1/tasks/{cancelled}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+
+    run()
+    status = _status(body["batch_id"])
+    assert [item["status"] for item in status["items"]] == ["completed", "cancelled", "cancelled"]
+    assert status["status"] == "partial"
+    assert pipeline.counters["elevenlabs_requests"] == 2
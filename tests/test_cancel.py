@@ -0,0 +1,65 @@
+"""
+DELETE /v1/tasks/{task_id}: a job cancelled between its creation and the start of its run
+never starts (nothing is sent to a provider); a job running in another worker cannot be
+cancelled here, while one whose worker is gone is cleaned up. Runs against the local provider
+fakes (see conftest.py).
+"""
+import os
+import json
+import time
+import socket
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import AudioPodcastRequest
+from app.services.jobs import HEARTBEAT_FILE, JobManifest
+from app.services.podcast import create_audio_podcast
+from app.utils.cancellation import JobCancelled
+from benchmarks.run_pipeline import request_payload
+
+def _running_elsewhere(job, host, pid, age=0):
+    """Make job look like it runs in process pid on host, with a heartbeat age seconds old"""
+    job.set_status("running")
+    path = job.workspace_path(HEARTBEAT_FILE)
+    with open(path, "w") as f:
+        json.dump({"host": host, "pid": pid}, f)
+    os.utime(path, (time.time() - age, time.time() - age))
+
+def test_cancel_before_the_job_starts(pipeline):
+    client = TestClient(app)
+    data = AudioPodcastRequest(**request_payload("audio", 4))
+    job = JobManifest.create("audio", data)
+
+    response = client.delete(f"/v1/tasks/{job.job_id}")
+    assert response.status_code == 200
+    assert response.json() == {"status": "cancelled", "job_id": job.job_id}
+
+    # The worker that created the job gets to run it only now
+    with pytest.raises(JobCancelled):
+        create_audio_podcast(data, job=job)
+    assert JobManifest.load(job.job_id).status == "cancelled"
+    assert pipeline.counters == {}
+    assert client.delete(f"/v1/tasks/{job.job_id}").status_code == 409
+
+def test_job_running_in_another_worker_is_not_cancelled(pipeline):
+    client = TestClient(app)
+    job = JobManifest.create("audio", AudioPodcastRequest(**request_payload("audio", 4)))
+    _running_elsewhere(job, "other-host", 1234)
+
+    response = client.delete(f"/v1/tasks/{job.job_id}")
+    assert response.status_code == 409
+    assert JobManifest.load(job.job_id).status == "running"
+
+@pytest.mark.parametrize("host, age", [
+    ("other-host", 3600),  # heartbeat stopped
+    (None, 0),             # same host, but the process is gone
+])
+def test_orphaned_job_is_cancelled(pipeline, host, age):
+    client = TestClient(app)
+    job = JobManifest.create("audio", AudioPodcastRequest(**request_payload("audio", 4)))
+    # Above the largest PID Linux hands out, so no such process exists
+    _running_elsewhere(job, host or socket.gethostname(), 2 ** 22 + 1, age)
+
+    response = client.delete(f"/v1/tasks/{job.job_id}")
+    assert response.status_code == 200
+    assert JobManifest.load(job.job_id).status == "cancelled"
@@ -0,0 +1,62 @@
+"""
+Merging video clips that were not encoded alike (a Heygen render next to a local audiogram
+render: other frame rate, size and audio sample rate) re-encodes them to one format, so the
+merged file plays every clip in full with audio and video in step. Clips are generated with
+ffmpeg lavfi sources.
+"""
+import re
+import subprocess
+import pytest
+from app.utils.ffmpeg_merge import MERGE_FPS, merge_video_clips, stream_video_merge
+from app.utils.media_probe import mp4_duration
+
+TOLERANCE = 0.15
+
+def _clip(path, seconds, size, fps, audio_rate):
+    subprocess.run([
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=size={size}:rate={fps}:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate={audio_rate}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", str(path),
+    ], check=True, capture_output=True)
+    return str(path)
+
+def _decode(path, stream):
+    """ffmpeg's description of the file's first stream of a kind ("v" or "a") and its decoded length"""
+    result = subprocess.run(["ffmpeg", "-i", path, "-map", f"0:{stream}:0", "-f", "null", "-"],
+                            capture_output=True, text=True)
+    kind = "Video" if stream == "v" else "Audio"
+    info = re.search(rf"Stream #0:\d+.*: {kind}: .*", result.stderr).group(0)
+    hours, minutes, seconds = re.findall(r"time=(\d+):(\d+):([\d.]+)", result.stderr)[-1]
+    return info, int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def _check_merged(path):
+    video, video_seconds = _decode(path, "v")
+    audio, audio_seconds = _decode(path, "a")
+    assert "320x180" in video and f"{MERGE_FPS} fps" in video
+    # Every clip is played in full, and the video runs as long as the audio
+    assert video_seconds == pytest.approx(5.0, abs=TOLERANCE)
+    assert audio_seconds == pytest.approx(video_seconds, abs=TOLERANCE)
+
+@pytest.fixture
+def mixed_clips(tmp_path):
+    return [
+        _clip(tmp_path / "heygen_0.mp4", 2, "320x180", 30, 48000),
+        _clip(tmp_path / "local_1.mp4", 1, "160x90", MERGE_FPS, 22050),
+        _clip(tmp_path / "heygen_2.mp4", 2, "320x180", 30, 48000),
+    ]
+
+def test_mixed_clips_are_merged_in_full(mixed_clips, tmp_path):
+    output = str(tmp_path / "merged.mp4")
+    merge_video_clips(mixed_clips, output, size=(320, 180))
+    assert mp4_duration(output) == pytest.approx(5.0, abs=TOLERANCE)
+    _check_merged(output)
+
+def test_mixed_clips_stream_merge(mixed_clips, tmp_path):
+    output = tmp_path / "streamed.mp4"
+    merge = stream_video_merge(mixed_clips, str(tmp_path), size=(320, 180))
+    try:
+        output.write_bytes(merge.stdout.read())
+        merge.wait()
+    finally:
+        merge.close()
+    _check_merged(str(output))
@@ -0,0 +1,72 @@
+"""
+HlsPublisher: segments finishing in any order are published in dialogue order, without blocking
+the threads that finish them on an upload in progress; and the playlist's target duration covers
+its longest fragment. Uploads are recorded instead of sent to S3.
+"""
+import re
+import subprocess
+import threading
+import pytest
+from app.services import hls
+from app.services.hls import HlsPublisher
+from app.services.jobs import JobManifest
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(hls.settings, "JOBS_DIR", str(tmp_path / "jobs"))
+    uploaded = {"fragments": [], "playlists": []}
+    monkeypatch.setattr(hls, "upload_to_s3", lambda path, key, content_type=None: uploaded["fragments"].append(key))
+    monkeypatch.setattr(hls, "put_text", lambda key, text, content_type, cache_control=None: uploaded["playlists"].append(text))
+    return uploaded
+
+def _clip(path, seconds, keyframe_seconds=1):
+    subprocess.run([
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=size=64x64:rate=10:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-g", str(10 * keyframe_seconds),
+        "-c:a", "aac", "-shortest", str(path),
+    ], check=True, capture_output=True)
+    return str(path)
+
+def _extinfs(playlist):
+    return [float(value) for value in re.findall(r"#EXTINF:([\d.]+),", playlist)]
+
+def _target_duration(playlist):
+    return int(re.search(r"#EXT-X-TARGETDURATION:(\d+)", playlist).group(1))
+
+def test_target_duration_covers_the_longest_fragment(uploads, tmp_path):
+    publisher = HlsPublisher(JobManifest("job-1", "video", {}), segment_seconds=2, target_duration=2)
+    # Keyframes 5 seconds apart: stream copy cannot cut the clip any shorter
+    publisher.add(0, _clip(tmp_path / "clip.mp4", 5, keyframe_seconds=5))
+    playlist = uploads["playlists"][-1]
+    assert max(_extinfs(playlist)) > 2
+    assert _target_duration(playlist) >= max(_extinfs(playlist))
+
+def test_segments_are_published_in_order_without_blocking(uploads, tmp_path, monkeypatch):
+    clips = [_clip(tmp_path / f"clip{i}.mp4", 1) for i in range(3)]
+    publisher = HlsPublisher(JobManifest("job-1", "video", {}), segment_seconds=2)
+    uploading, release = threading.Event(), threading.Event()
+    upload = hls.upload_to_s3
+
+    def slow_upload(path, key, content_type=None):
+        uploading.set()
+        release.wait(5)
+        upload(path, key, content_type)
+
+    monkeypatch.setattr(hls, "upload_to_s3", slow_upload)
+    publisher.add(2, clips[2])
+    first = threading.Thread(target=publisher.add, args=(0, clips[0]))
+    first.start()
+    assert uploading.wait(5)
+    # Segment 0 is being uploaded; segment 1 is handed over to that thread
+    publisher.add(1, clips[1])
+    assert uploads["fragments"] == []
+    release.set()
+    publisher.finish()
+    first.join(5)
+
+    assert [key.rsplit("/", 1)[1] for key in uploads["fragments"]] == ["seg0_000.ts", "seg1_000.ts", "seg2_000.ts"]
+    playlist = uploads["playlists"][-1]
+    assert playlist.endswith("#EXT-X-ENDLIST\n")
+    assert len(_extinfs(playlist)) == 3
+    assert publisher.duration == pytest.approx(3.0, abs=0.2)
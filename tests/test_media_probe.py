@@ -0,0 +1,37 @@
+"""
+Probed durations of small fixture files against the length they were generated with (ffmpeg
+lavfi sources, see tests/fixtures/README.md). Files without a LAME header include the encoder
+padding, up to a few frames, hence the tolerance.
+"""
+import os
+import pytest
+from app.utils.media_probe import media_duration, mp3_duration, mp4_duration
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+TOLERANCE = 0.1
+
+@pytest.mark.parametrize("name, seconds", [
+    ("cbr_2s.mp3", 2.0),         # constant bitrate, Info header with LAME delay and padding
+    ("vbr_3s.mp3", 3.0),         # variable bitrate, Xing header
+    ("noheader_1.5s.mp3", 1.5),  # no Xing/Info header: frames are walked
+])
+def test_mp3_duration(name, seconds):
+    assert mp3_duration(os.path.join(FIXTURES, name)) == pytest.approx(seconds, abs=TOLERANCE)
+
+def test_mp4_duration():
+    assert mp4_duration(os.path.join(FIXTURES, "clip_2s.mp4")) == pytest.approx(2.0, abs=TOLERANCE)
+
+def test_media_duration_by_extension():
+    assert media_duration(os.path.join(FIXTURES, "vbr_3s.mp3")) == pytest.approx(3.0, abs=TOLERANCE)
+    assert media_duration(os.path.join(FIXTURES, "clip_2s.mp4")) == pytest.approx(2.0, abs=TOLERANCE)
+
+def test_empty_mp3(tmp_path):
+    path = tmp_path / "empty.mp3"
+    path.write_bytes(b"")
+    assert mp3_duration(str(path)) == 0.0
+
+def test_mp4_without_movie_header(tmp_path):
+    path = tmp_path / "broken.mp4"
+    path.write_bytes(b"\x00\x00\x00\x08free")
+    with pytest.raises(ValueError):
+        mp4_duration(str(path))
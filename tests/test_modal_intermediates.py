@@ -0,0 +1,46 @@
+"""
+upload_content_addressed (modal_app): an intermediate missing from S3 is uploaded, a fresh one
+is reused, and any other error of the existence check is raised rather than taken for a miss.
+S3 calls go to a stub client.
+"""
+import datetime
+import pytest
+from botocore.exceptions import ClientError
+import modal_app
+
+class StubS3:
+    def __init__(self, head):
+        self.head = head
+
+    def head_object(self, Bucket, Key):
+        if isinstance(self.head, Exception):
+            raise self.head
+        return self.head
+
+def _error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "HeadObject")
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    path = tmp_path / "clip.mp3"
+    path.write_bytes(b"audio")
+    uploaded = []
+    monkeypatch.setattr(modal_app, "upload_to_s3", lambda file_path, s3_key: uploaded.append(s3_key) or s3_key)
+
+    def run(head):
+        monkeypatch.setitem(modal_app._clients, "s3", StubS3(head))
+        return modal_app.upload_content_addressed(str(path)), uploaded
+    return run
+
+@pytest.mark.parametrize("code", ["404", "NoSuchKey"])
+def test_missing_object_is_uploaded(upload, code):
+    key, uploaded = upload(_error(code))
+    assert uploaded == [key]
+
+def test_fresh_object_is_reused(upload):
+    _, uploaded = upload({"LastModified": datetime.datetime.now(datetime.timezone.utc)})
+    assert uploaded == []
+
+def test_other_errors_are_raised(upload):
+    with pytest.raises(ClientError):
+        upload(_error("403"))
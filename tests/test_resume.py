@@ -0,0 +1,81 @@
+"""
+Resuming a failed job re-runs only the segments that are missing from its manifest: the script,
+the audio and the renders that completed are reused, and no provider is asked for them again.
+Runs against the local provider fakes (see conftest.py).
+"""
+import re
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import podcast
+from app.utils.retry import ProviderError
+from benchmarks.run_pipeline import request_payload
+
+@pytest.fixture
+def failures(monkeypatch):
+    """
+    Make provider calls fail with a non-retryable error: failures[name] is a predicate on the
+    arguments of podcast.<name>. Every call is recorded in failures["calls"][name].
+    """
+    failures = {"calls": {}}
+
+    def wrap(name):
+        func = getattr(podcast, name)
+
+        def call(*args, **kwargs):
+            failures["calls"].setdefault(name, []).append(args)
+            if failures.get(name, lambda *_: False)(*args):
+                raise ProviderError(f"injected {name} failure (HTTP 400)", status_code=400)
+            return func(*args, **kwargs)
+        monkeypatch.setattr(podcast, name, call)
+
+    wrap("synthesize_voice")
+    wrap("submit_avatar_video")
+    return failures
+
+def _line(text):
+    return int(re.search(r"line (\d+) ", text).group(1))
+
+def _fail(client, kind, payload):
+    response = client.post(f"/v1/lisa-{kind}-podcast", json=payload)
+    assert response.status_code == 500
+    job_id = response.json()["detail"]["job_id"]
+    assert client.get(f"/v1/jobs/{job_id}").json()["status"] == "failed"
+    return job_id
+
+def _resume(client, job_id):
+    response = client.post(f"/v1/jobs/{job_id}/resume")
+    assert response.status_code == 200, response.text
+    assert response.json()["job_id"] == job_id
+    assert client.get(f"/v1/jobs/{job_id}").json()["status"] == "completed"
+
+def test_audio_resume_synthesizes_only_missing_lines(pipeline, failures):
+    client = TestClient(app)
+    failures["synthesize_voice"] = lambda text, *_: _line(text) in (2, 4)
+    job_id = _fail(client, "audio", request_payload("audio", 4))
+    assert pipeline.counters["elevenlabs_requests"] == 2
+
+    failures.pop("synthesize_voice")
+    failures["calls"].clear()
+    _resume(client, job_id)
+    assert sorted(_line(text) for text, *_ in failures["calls"]["synthesize_voice"]) == [2, 4]
+    assert pipeline.counters["elevenlabs_requests"] == 4
+    # The dialogue was kept with the job, so OpenAI is not asked for a new one
+    assert pipeline.counters["openai_requests"] == 1
+
+def test_video_resume_renders_only_missing_segments(pipeline, failures):
+    client = TestClient(app)
+    submitted = []
+    # The third render submission fails; the others complete
+    failures["submit_avatar_video"] = lambda *_: submitted.append(1) or len(submitted) == 3
+    job_id = _fail(client, "video", request_payload("video", 4))
+    assert pipeline.counters["heygen_renders"] == 3
+    assert pipeline.counters["elevenlabs_requests"] == 4
+
+    failures.pop("submit_avatar_video")
+    failures["calls"].clear()
+    _resume(client, job_id)
+    assert len(failures["calls"]["submit_avatar_video"]) == 1
+    assert "synthesize_voice" not in failures["calls"]
+    assert pipeline.counters["heygen_renders"] == 4
+    assert pipeline.counters["elevenlabs_requests"] == 4
@@ -0,0 +1,93 @@
+"""
+Retry policy of provider calls: which failures are transient (retryable) for idempotent and
+non-idempotent calls, full-jitter exponential backoff, and call_with_retry giving up on fatal
+errors or after the last attempt. Backoff delays are scaled down to milliseconds.
+"""
+import random
+import pytest
+import requests
+from botocore.exceptions import ClientError
+from app.utils import retry
+from app.utils.retry import ProviderError, backoff_delay, call_with_retry, is_retryable
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(retry.settings, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(retry.settings, "RETRY_MAX_DELAY", 0.004)
+    monkeypatch.setattr(retry.settings, "RETRY_MAX_ATTEMPTS", 4)
+
+def _s3_error(code, status):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "PutObject")
+
+@pytest.mark.parametrize("status, idempotent, retryable", [
+    (429, True, True), (500, True, True), (502, True, True), (503, True, True), (504, True, True), (408, True, True),
+    (400, True, False), (401, True, False), (404, True, False), (422, True, False),
+    # A render that may have been processed is not submitted (and paid for) twice
+    (429, False, True), (503, False, True), (500, False, False), (502, False, False), (504, False, False),
+])
+def test_status_codes(status, idempotent, retryable):
+    assert is_retryable(ProviderError("error", status_code=status), idempotent) is retryable
+
+def test_s3_error_codes():
+    assert is_retryable(_s3_error("SlowDown", 503))
+    assert is_retryable(_s3_error("RequestTimeout", 400))
+    assert not is_retryable(_s3_error("NoSuchKey", 404))
+    assert not is_retryable(_s3_error("AccessDenied", 403))
+
+def test_transport_errors():
+    assert is_retryable(requests.ConnectionError())
+    assert is_retryable(requests.ReadTimeout())
+    # Without a response, only a connection that was never made is safe to repeat
+    assert is_retryable(requests.ConnectTimeout(), idempotent=False)
+    assert not is_retryable(requests.ReadTimeout(), idempotent=False)
+    assert not is_retryable(ValueError("bad response"))
+
+def test_wrapped_errors_are_classified_by_their_cause():
+    try:
+        try:
+            raise requests.ConnectionError()
+        except requests.ConnectionError as exc:
+            raise RuntimeError("upload failed") from exc
+    except RuntimeError as exc:
+        assert is_retryable(exc)
+
+def test_backoff_is_full_jitter():
+    random.seed(7)
+    for attempt, cap in ((1, 1.0), (2, 2.0), (3, 4.0), (6, 10.0), (10, 10.0)):
+        delays = [backoff_delay(attempt, base_delay=1.0, max_delay=10.0) for _ in range(500)]
+        # Uniform over [0, min(max_delay, base_delay * 2^(attempt - 1))]
+        assert 0 <= min(delays) < 0.1 * cap
+        assert 0.9 * cap < max(delays) <= cap
+
+def _flaky(errors):
+    """A call that raises errors in turn, then returns the number of attempts"""
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        return len(attempts)
+    return call, attempts
+
+def test_transient_errors_are_retried():
+    call, _ = _flaky([ProviderError("busy", status_code=429), requests.ConnectionError()])
+    assert call_with_retry(call, "test") == 3
+
+def test_fatal_errors_are_not_retried():
+    call, attempts = _flaky([ProviderError("bad request", status_code=400)])
+    with pytest.raises(ProviderError):
+        call_with_retry(call, "test")
+    assert len(attempts) == 1
+
+def test_non_idempotent_calls_retry_only_unprocessed_requests():
+    call, attempts = _flaky([ProviderError("busy", status_code=503), ProviderError("failed", status_code=500)])
+    with pytest.raises(ProviderError) as exc:
+        call_with_retry(call, "test", idempotent=False)
+    assert exc.value.status_code == 500 and len(attempts) == 2
+
+def test_gives_up_after_the_last_attempt():
+    call, attempts = _flaky([ProviderError("down", status_code=503)] * 10)
+    with pytest.raises(ProviderError):
+        call_with_retry(call, "test", max_attempts=3)
+    assert len(attempts) == 3
@@ -0,0 +1,109 @@
+"""
+FairScheduler: when slots are short, waiting tasks are served by start-time fair queuing, so
+flows get slots in proportion to their weight (lane weight times tenant weight, split between
+a tenant's jobs in the lane). Tasks are queued one by one behind a held slot and released in
+turn, which makes the grant order deterministic.
+"""
+import time
+import threading
+from functools import partial
+import pytest
+from app.services import scheduler
+from app.services.scheduler import FairScheduler, Share, fair_share, provider_slot
+from app.utils import retry
+from app.utils.cancellation import JobCancelled, cancellable, cancel
+from app.utils.retry import ProviderError, call_with_retry
+
+@pytest.fixture(autouse=True)
+def weights(monkeypatch):
+    monkeypatch.setattr(scheduler, "LANE_WEIGHTS", {"interactive-audio": 4, "batch-audio": 1})
+    monkeypatch.setattr(scheduler, "TENANT_WEIGHTS", {"acme": 2})
+
+def _wait_queued(pool, count):
+    deadline = time.monotonic() + 5
+    while sum(pool.stats()["waiting"].values()) < count:
+        assert time.monotonic() < deadline, "tasks were not queued"
+        time.sleep(0.001)
+
+def _grant_order(waiters):
+    """Labels of waiters [(label, share)] in the order a single-slot scheduler serves them"""
+    pool = FairScheduler("test", 1)
+    pool.acquire(Share(None, "audio"))
+    granted = []
+    threads = []
+    for label, share in waiters:
+        def task(label=label, share=share):
+            pool.acquire(share)
+            granted.append(label)
+            pool.release()
+        thread = threading.Thread(target=task)
+        thread.start()
+        threads.append(thread)
+        _wait_queued(pool, len(threads))
+    pool.release()
+    for thread in threads:
+        thread.join(5)
+    return granted
+
+def test_free_slot_is_taken_without_queuing():
+    pool = FairScheduler("test", 2)
+    pool.acquire(Share("a", "audio"))
+    pool.acquire(Share("b", "audio"))
+    assert pool.stats() == {"busy": 2, "waiting": {}}
+
+def test_tenants_share_by_weight():
+    acme, other = Share("a", "audio", "batch", "acme"), Share("b", "audio", "batch", "other")
+    granted = _grant_order([("acme", acme)] * 6 + [("other", other)] * 6)
+    # acme (weight 2) gets two slots for each of other's (weight 1) while both are waiting
+    assert granted[:9].count("acme") == 6
+    assert granted[:9].count("other") == 3
+    assert granted.count("acme") == granted.count("other") == 6
+
+def test_interactive_lane_overtakes_queued_batch_work():
+    batch, interactive = Share("long", "audio", "batch"), Share("short", "audio", "interactive")
+    granted = _grant_order([("batch", batch)] * 8 + [("interactive", interactive)] * 2)
+    # Queued last, the interactive job's tasks are served right after the batch job's first one
+    assert granted[:3] == ["batch", "interactive", "interactive"]
+
+def test_tenant_weight_is_split_between_its_jobs():
+    with fair_share("a1", "audio", "batch", "acme"), fair_share("a2", "audio", "batch", "acme"):
+        first, second = Share("a1", "audio", "batch", "acme"), Share("a2", "audio", "batch", "acme")
+        other = Share("b", "audio", "batch", "other")
+        granted = _grant_order([("acme", first)] * 3 + [("acme", second)] * 3 + [("other", other)] * 3)
+    # Each of acme's two jobs has weight 1, the same as other's single job
+    assert granted[:6].count("other") == 2
+
+def test_cancelled_task_leaves_the_queue():
+    pool = FairScheduler("test", 1)
+    pool.acquire(Share(None, "audio"))
+    errors = []
+
+    def task():
+        with cancellable("job-1"):
+            try:
+                pool.acquire(Share("job-1", "audio"))
+            except JobCancelled as exc:
+                errors.append(exc)
+
+    thread = threading.Thread(target=task)
+    thread.start()
+    _wait_queued(pool, 1)
+    cancel("job-1")
+    thread.join(5)
+    assert errors and pool.stats() == {"busy": 1, "waiting": {}}
+
+def test_slot_is_released_during_backoff(monkeypatch):
+    pool = FairScheduler("elevenlabs", 1)
+    monkeypatch.setattr(scheduler, "_schedulers", {"elevenlabs": pool})
+    busy = []
+    monkeypatch.setattr(retry, "sleep", lambda seconds: busy.append(("sleep", pool.stats()["busy"])))
+
+    def attempt():
+        busy.append(("attempt", pool.stats()["busy"]))
+        if len(busy) == 1:
+            raise ProviderError("elevenlabs error (HTTP 503)", status_code=503)
+        return "ok"
+
+    assert call_with_retry(attempt, "elevenlabs", slot=partial(provider_slot, "elevenlabs")) == "ok"
+    assert busy == [("attempt", 1), ("sleep", 0), ("attempt", 1)]
+    assert pool.stats()["busy"] == 0
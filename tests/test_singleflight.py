@@ -0,0 +1,112 @@
+"""
+Request coalescing: requests that differ only in whitespace, field order or float noise share a
+fingerprint, and identical requests arriving while the first is in flight attach to it, so only
+one job is created and every caller gets its result. Idempotency keys keep the result for a
+while and reject a different payload.
+"""
+import time
+import threading
+import pytest
+from app.models import AudioPodcastRequest
+from app.services import jobs
+from app.services.jobs import JobManifest
+from app.services.singleflight import IdempotencyConflict, SingleFlight, request_fingerprint
+
+def _request(**changes):
+    payload = {
+        "input_type": "script",
+        "input_text": "Host: Welcome to the show.\nGuest: Glad to be here.",
+        "language": "english",
+        "host_name": "Host",
+        "guest_name": "Guest",
+        "host_voice_id": "host-voice",
+        "guest_voice_id": "guest-voice",
+        "elevenlabs_config": {"stability": 0.5, "similarity_boost": 0.75, "style": 0.0, "model_id": "eleven_multilingual_v2"},
+        "duration_minutes": 1,
+    }
+    payload.update(changes)
+    return AudioPodcastRequest(**payload)
+
+def _wait_attached(caplog, count):
+    """Wait until count callers attached to an in-flight call"""
+    deadline = time.monotonic() + 5
+    while sum("Attaching" in record.getMessage() for record in caplog.records) < count:
+        assert time.monotonic() < deadline, "callers did not attach"
+        time.sleep(0.01)
+
+def test_fingerprint_ignores_formatting():
+    reformatted = _request(input_text="  Host:   Welcome to the show.\n\n\nGuest: Glad to be here.  ",
+                           elevenlabs_config={"model_id": "eleven_multilingual_v2", "style": 0.0,
+                                              "similarity_boost": 0.7500000001, "stability": 0.5})
+    assert request_fingerprint("audio", reformatted) == request_fingerprint("audio", _request())
+    assert request_fingerprint("audio", _request(host_voice_id="other")) != request_fingerprint("audio", _request())
+    assert request_fingerprint("video", _request()) != request_fingerprint("audio", _request())
+
+def test_concurrent_identical_requests_create_one_job(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(jobs.settings, "JOBS_DIR", str(tmp_path))
+    caplog.set_level("INFO", logger="app.services.singleflight")
+    inflight = SingleFlight()
+    requests = [_request(), _request(input_text=" Host: Welcome to the show.\nGuest: Glad to be here.\n")] * 3
+    release = threading.Event()
+    results = [None] * len(requests)
+
+    def run(data):
+        job = JobManifest.create("audio", data)
+        release.wait(5)
+        return {"job_id": job.job_id}
+
+    def post(i, data):
+        results[i] = inflight.do(f"request:{request_fingerprint('audio', data)}", lambda: run(data))
+
+    threads = [threading.Thread(target=post, args=(i, data)) for i, data in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    # Every request but the first attaches to its call
+    _wait_attached(caplog, len(requests) - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(list(tmp_path.iterdir())) == 1
+    assert len({result["job_id"] for result, _ in results}) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * (len(requests) - 1)
+    assert inflight.in_flight() == 0
+
+def test_followers_get_the_leaders_error(caplog):
+    caplog.set_level("INFO", logger="app.services.singleflight")
+    inflight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("provider down")
+
+    def call(func):
+        try:
+            inflight.do("key", func)
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    leader = threading.Thread(target=call, args=(fail,))
+    leader.start()
+    while not inflight.in_flight():
+        time.sleep(0.01)
+    follower = threading.Thread(target=call, args=(lambda: "not run",))
+    follower.start()
+    _wait_attached(caplog, 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # A failed call is not retained
+    assert inflight.do("key", lambda: "retried") == ("retried", False)
+
+def test_idempotency_key_keeps_the_result(monkeypatch):
+    inflight = SingleFlight()
+    calls = []
+    first = inflight.do("idempotency:audio:abc", lambda: calls.append(1) or "result", fingerprint="f1", retain_seconds=60)
+    again = inflight.do("idempotency:audio:abc", lambda: calls.append(1) or "other", fingerprint="f1", retain_seconds=60)
+    assert first == ("result", False) and again == ("result", True) and len(calls) == 1
+    with pytest.raises(IdempotencyConflict):
+        inflight.do("idempotency:audio:abc", lambda: "other", fingerprint="f2", retain_seconds=60)
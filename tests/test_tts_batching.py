@@ -0,0 +1,68 @@
+"""
+Batched speech synthesis: line times come from the with-timestamps alignment, or from its
+normalized_alignment when ElevenLabs normalized the text (numbers spelled out, ...). A response
+that maps back to neither is synthesized again line by line instead of failing the batch.
+"""
+import types
+import pytest
+from app.models import ElevenLabsConfig
+from app.services import podcast
+from app.services.jobs import JobManifest
+from app.utils.elevenlabs import LINE_SEPARATOR, AlignmentMismatch, line_times
+from app.utils.file_cache import FileCache
+
+def _alignment(text, seconds_per_char=0.1):
+    return {
+        "characters": list(text),
+        "character_start_times_seconds": [i * seconds_per_char for i in range(len(text))],
+        "character_end_times_seconds": [(i + 1) * seconds_per_char for i in range(len(text))],
+    }
+
+def test_line_times_from_alignment():
+    texts = ["Hi.", "Hello there."]
+    body = {"alignment": _alignment(LINE_SEPARATOR.join(texts))}
+    assert line_times(body, texts) == [(0.0, pytest.approx(0.3)), (pytest.approx(0.5), pytest.approx(1.7))]
+
+def test_line_times_from_normalized_alignment():
+    texts = ["It costs $5.", "Fine."]
+    normalized = LINE_SEPARATOR.join(["It costs five dollars.", "Fine."])
+    body = {"alignment": _alignment(normalized), "normalized_alignment": _alignment(normalized)}
+    first, second = line_times(body, texts)
+    assert first == (0.0, pytest.approx(2.2))
+    assert second == (pytest.approx(2.4), pytest.approx(2.9))
+
+def test_line_times_mismatch():
+    # The separator was lost, so the lines cannot be told apart
+    body = {"alignment": _alignment("It costs five dollars. Fine.")}
+    with pytest.raises(AlignmentMismatch):
+        line_times(body, ["It costs $5.", "Fine."])
+
+def test_batch_falls_back_to_one_request_per_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(podcast.settings, "JOBS_DIR", str(tmp_path / "jobs"))
+    cache = FileCache("elevenlabs", str(tmp_path / "cache"), 10 ** 6, extension=".mp3")
+    monkeypatch.setattr(podcast, "tts_cache", lambda: cache)
+    batched, single = [], []
+
+    def synthesize_lines(texts, voice_id, config, output_path, slot=None):
+        batched.append(texts)
+        raise AlignmentMismatch("ElevenLabs alignment does not match the requested text")
+
+    def synthesize_voice(text, voice_id, config, output_path, slot=None):
+        single.append(text)
+        with open(output_path, "wb") as f:
+            f.write(text.encode("utf-8"))
+
+    monkeypatch.setattr(podcast, "synthesize_lines", synthesize_lines)
+    monkeypatch.setattr(podcast, "synthesize_voice", synthesize_voice)
+    config = ElevenLabsConfig(stability=0.5, similarity_boost=0.75, style=0.0, model_id="eleven_multilingual_v2")
+    job = JobManifest("job-1", "audio", {})
+    job.save()
+    lines = [(0, "host", "It costs $5.", "voice-a"), (1, "guest", "Fine.", "voice-b"), (2, "host", "Bye.", "voice-a")]
+
+    failures = podcast._synthesize_batched(types.SimpleNamespace(elevenlabs_config=config), job, lines)
+    assert failures == {}
+    assert sorted(batched) == [["Fine."], ["It costs $5.", "Bye."]]
+    assert sorted(single) == ["Bye.", "Fine.", "It costs $5."]
+    for idx, _, text, _ in lines:
+        with open(job.segment(idx)["audio_path"], "rb") as f:
+            assert f.read() == text.encode("utf-8")